@@ -0,0 +1,288 @@
+"""Approximate nearest-neighbour index types for the FAISS store.
+
+``create_faiss_store`` builds an exact ``IndexFlatL2`` by default. The index
+types below trade a little recall for much cheaper queries on large corpora:
+
+- ``ivf``: inverted lists over k-means cells (``IVF{nlist},Flat``); search
+  visits ``nprobe`` cells.
+- ``hnsw``: graph index (``HNSW{hnsw_m}``); search width is ``ef_search``.
+- ``ivfpq``: IVF with product-quantized codes (``IVF{nlist},PQ{pq_m}``).
+
+The quantized types keep exhaustive search but store smaller codes than the
+6 KB of float32 per 1536-d vector:
+
+- ``fp16``: half-precision floats (``SQfp16``), 2 bytes per dimension.
+- ``sq8``: 8-bit scalar quantization (``SQ8``), 1 byte per dimension.
+- ``pq``: product quantization (``PQ{pq_m}``), ``pq_m`` bytes per vector.
+
+Any type can be preceded by a PCA reduction to ``pca`` dimensions
+(``PCA{pca},...``), e.g. ``index_type="sq8", index_options={"pca": 256}``.
+
+Types other than ``flat`` are trained on a sample of the corpus, so they are
+created by ``build_index`` once vectors are available. Run
+``python -m backend.agent.ann --store backend/agent/faiss_store`` for a
+recall/latency/size report against the flat index, including the memory
+saved and recall lost by each type.
+"""
+
+import argparse
+import json
+import math
+import time
+
+import faiss
+import numpy as np
+
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq", "fp16", "sq8", "pq")
+IVF_TYPES = ("ivf", "ivfpq")
+# Options that only affect searching; they can change without a rebuild.
+SEARCH_OPTIONS = ("nprobe", "ef_search")
+
+
+def factory_string(
+    index_type, embedding_size, n_train, nlist=None, hnsw_m=32, pq_m=None, pca=None
+):
+    """FAISS ``index_factory`` description for ``index_type``.
+
+    ``nlist`` defaults to ~4*sqrt(n) cells and PQ codes to 8 bits; both are
+    clamped so the available ``n_train`` vectors can train them. ``pca``
+    prepends a PCA reduction to that many dimensions.
+    """
+    if pca:
+        if not 0 < pca < embedding_size:
+            raise ValueError(f"pca must be between 1 and {embedding_size - 1}, got {pca}")
+        reduced = factory_string(index_type, pca, n_train, nlist, hnsw_m, pq_m)
+        return f"PCA{pca},{reduced}"
+    nbits = max(1, min(8, int(math.log2(max(n_train, 2)))))
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m}"
+    if index_type == "fp16":
+        return "SQfp16"
+    if index_type == "sq8":
+        return "SQ8"
+    if index_type == "pq":
+        return f"PQ{pq_m or _default_pq_m(embedding_size)}x{nbits}"
+    nlist = nlist or int(4 * math.sqrt(max(n_train, 1)))
+    nlist = max(1, min(nlist, n_train))
+    if index_type == "ivf":
+        return f"IVF{nlist},Flat"
+    if index_type == "ivfpq":
+        pq_m = pq_m or _default_pq_m(embedding_size)
+        return f"IVF{nlist},PQ{pq_m}x{nbits}"
+    raise ValueError(f"Unknown index type {index_type!r}; expected one of {INDEX_TYPES}")
+
+
+def _default_pq_m(embedding_size):
+    for m in (embedding_size // 16, 64, 32, 16, 8, 4, 2, 1):
+        if m and embedding_size % m == 0:
+            return m
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """Sets search-time parameters; those that don't apply to ``index`` are skipped."""
+    if not isinstance(index, faiss.Index):
+        # e.g. the exact ``MmapFlatIndex``, which has nothing to tune.
+        return index
+    params = faiss.ParameterSpace()
+    if nprobe is not None:
+        try:
+            params.set_index_parameter(index, "nprobe", nprobe)
+        except RuntimeError:
+            pass
+    if ef_search is not None:
+        try:
+            params.set_index_parameter(index, "efSearch", ef_search)
+        except RuntimeError:
+            pass
+    return index
+
+
+class TrainingSample:
+    """Uniform sample of at most ``size`` vectors from a stream of batches.
+
+    Reservoir sampling: every vector seen so far is equally likely to be in
+    ``vectors``, however the stream is ordered.
+    """
+
+    def __init__(self, size, seed=0):
+        self.size = size
+        self.seen = 0
+        self.vectors = None
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.vectors is None:
+            self.vectors = np.empty((0, vectors.shape[1]), dtype=np.float32)
+        free = max(0, self.size - len(self.vectors))
+        self.vectors = np.vstack([self.vectors, vectors[:free]])
+        self.seen += len(vectors[:free])
+        rest = vectors[free:]
+        if len(rest):
+            # Item number t (0-based) replaces a random slot with probability size/(t+1).
+            slots = self._rng.integers(0, self.seen + np.arange(1, len(rest) + 1))
+            for slot, vector in zip(slots, rest):
+                if slot < self.size:
+                    self.vectors[slot] = vector
+            self.seen += len(rest)
+
+
+def build_index(
+    index_type,
+    vectors,
+    train_size=20_000,
+    nlist=None,
+    hnsw_m=32,
+    pq_m=None,
+    pca=None,
+    nprobe=None,
+    ef_search=None,
+    seed=0,
+):
+    """Creates an empty index of ``index_type`` trained on a sample of ``vectors``.
+
+    IVF indexes get an array direct map so the store can reconstruct vectors,
+    which MMR search and ``without_vectors`` need.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, embedding_size = vectors.shape
+    if n > train_size:
+        sample = vectors[np.random.default_rng(seed).choice(n, train_size, replace=False)]
+    else:
+        sample = vectors
+    index = faiss.index_factory(
+        embedding_size,
+        factory_string(index_type, embedding_size, len(sample), nlist, hnsw_m, pq_m, pca),
+    )
+    if not index.is_trained:
+        index.train(sample)
+    if index_type in IVF_TYPES:
+        faiss.extract_index_ivf(index).set_direct_map_type(faiss.DirectMap.Array)
+    return set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+
+
+def supports_removal(index):
+    """Whether ``FAISS.delete`` works on ``index``.
+
+    The langchain store renumbers positions after ``remove_ids``, which only
+    holds for flat indexes: IVF lists keep their original ids and HNSW cannot
+    remove at all. Use ``without_vectors`` for the others.
+    """
+    return isinstance(index, faiss.IndexFlat)
+
+
+def without_vectors(index, positions):
+    """Copy of a trained ``index`` with the vectors at ``positions`` left out.
+
+    The trained quantizers are reused, so this costs one re-add of the
+    remaining vectors rather than a retrain.
+    """
+    removed = set(positions)
+    keep = [p for p in range(index.ntotal) if p not in removed]
+    vectors = np.array([index.reconstruct(p) for p in keep], dtype=np.float32)
+    rebuilt = faiss.clone_index(index)
+    rebuilt.reset()
+    if len(keep):
+        rebuilt.add(vectors.reshape(len(keep), index.d))
+    return rebuilt
+
+
+def index_size(index):
+    return int(faiss.serialize_index(index).size)
+
+
+def recall_at_k(expected, found, k):
+    hits = sum(
+        len(set(e[:k]) & set(f[:k]) - {-1}) for e, f in zip(expected, found)
+    )
+    return hits / (len(expected) * k)
+
+
+def index_report(vectors, queries, k=5, index_types=INDEX_TYPES, **options):
+    """Compares ``index_types`` with exact search on ``vectors``.
+
+    Returns one row per index type with recall@k against ``flat``, mean and
+    p95 per-query latency in milliseconds, build time, serialized size, and
+    the memory saved and recall lost relative to ``flat``.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    k = min(k, len(vectors))
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, expected = exact.search(queries, k)
+    flat_size = index_size(exact)
+    report = []
+    for index_type in index_types:
+        start = time.perf_counter()
+        index = build_index(index_type, vectors, **options)
+        index.add(vectors)
+        build_seconds = time.perf_counter() - start
+        size = index_size(index)
+        latencies = []
+        found = []
+        for query in queries:
+            start = time.perf_counter()
+            _, ids = index.search(query[None, :], k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found.append(ids[0])
+        recall = recall_at_k(expected, found, k)
+        report.append(
+            {
+                "index_type": index_type,
+                f"recall@{k}": round(recall, 4),
+                "mean_latency_ms": round(float(np.mean(latencies)), 4),
+                "p95_latency_ms": round(float(np.percentile(latencies, 95)), 4),
+                "build_seconds": round(build_seconds, 3),
+                "size_bytes": size,
+                "bytes_per_vector": round(size / len(vectors), 1),
+                "memory_saved": round(1 - size / flat_size, 4),
+                "recall_lost": round(1 - recall, 4),
+            }
+        )
+    return report
+
+
+def _store_vectors(store_path):
+    index = faiss.read_index(f"{store_path}/index.faiss")
+    return index.reconstruct_n(0, index.ntotal)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall/latency/size report for ANN index types.")
+    parser.add_argument("--store", help="FAISS store to take vectors from")
+    parser.add_argument("--synthetic", type=int, default=0, help="use N random vectors instead")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--pca", type=int, default=None, help="reduce to N dimensions first")
+    parser.add_argument("--types", default=",".join(INDEX_TYPES))
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.store:
+        data = _store_vectors(args.store)
+    else:
+        data = rng.standard_normal((args.synthetic or 10_000, args.dim)).astype(np.float32)
+    # Queries are perturbed corpus vectors, like paraphrases of stored chunks.
+    picks = rng.choice(len(data), min(args.queries, len(data)), replace=False)
+    queries = data[picks] + 0.1 * rng.standard_normal((len(picks), data.shape[1]))
+    print(
+        json.dumps(
+            index_report(
+                data,
+                queries,
+                k=args.k,
+                index_types=args.types.split(","),
+                nprobe=args.nprobe,
+                ef_search=args.ef_search,
+                pca=args.pca,
+            ),
+            indent=2,
+        )
+    )
@@ -0,0 +1,156 @@
+"""Builds or updates the RAG FAISS store, one builder at a time.
+
+The agent only loads an existing store (see ``backend.agent.graph``); run
+this after changing ``rag_datasets`` or before first start::
+
+    python -m backend.agent.build_index [--index-type ivf --nlist 256] [--workers 4]
+
+The build holds an exclusive lock on ``<store>.lock`` (``fcntl.flock``, or
+``msvcrt.locking`` on Windows), so builders
+started at the same time (several deploys or workers) do not write the same
+directory concurrently: a second builder waits for the first and then only
+embeds what changed since (or exits with ``--no-wait``). Readers are not
+blocked: ``index.faiss`` and ``index.pkl`` are saved to a scratch directory
+and renamed into place, and memory-mapped readers (the retriever's default)
+keep serving the export named in ``mmap_current.json`` until the build
+switches it to the new one; the retriever reloads when it changes.
+Non-mmap readers may briefly see a new ``index.faiss`` with the old
+``index.pkl``, since the two files are renamed one after the other.
+"""
+
+import argparse
+import contextlib
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from backend.agent.retriever import STORE_PATH
+
+
+DATASETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rag_datasets")
+
+
+@contextlib.contextmanager
+def store_lock(store_path, wait=True):
+    """Exclusive lock on ``store_path`` for the duration of a build.
+
+    Raises if ``wait`` is false and another process holds the lock.
+    """
+    lock_path = os.path.abspath(store_path).rstrip(os.sep) + ".lock"
+    with open(lock_path, "a") as f:
+        try:
+            _lock(f, wait)
+        except BlockingIOError:
+            raise Exception(f"{store_path} is being built by another process")
+        try:
+            yield
+        finally:
+            _unlock(f)
+
+
+def _lock(f, wait):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return
+    # msvcrt locks a byte range from the current position; LK_LOCK gives up
+    # after ten seconds, so waiting polls the non-blocking lock instead.
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return
+        except OSError:
+            if not wait:
+                raise BlockingIOError(f"{f.name} is locked")
+            time.sleep(0.5)
+
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def build_index(
+    store_path=STORE_PATH,
+    datasets_path=DATASETS_PATH,
+    embeddings=None,
+    index_type="flat",
+    index_options=None,
+    workers=1,
+    batch_size=512,
+    max_memory_mb=None,
+    wait=True,
+):
+    """Brings the store at ``store_path`` up to date with ``datasets_path``.
+
+    Only new or changed chunks are embedded; see ``rag.update_faiss_store``
+    for ``index_options`` and ``max_memory_mb``.
+    """
+    from backend.agent.rag import create_faiss_store, iter_documents, load_manifest
+
+    with store_lock(store_path, wait):
+        start = time.perf_counter()
+        manifest = load_manifest(store_path)
+        documents = iter_documents(datasets_path, manifest=manifest, workers=workers)
+        vectorstore = create_faiss_store(
+            documents,
+            llm=None,
+            store_path=store_path,
+            manifest=manifest,
+            batch_size=batch_size,
+            max_memory_mb=max_memory_mb,
+            embeddings=embeddings,
+            index_type=index_type,
+            index_options=index_options,
+        )
+        print(
+            f"Store {store_path}: {vectorstore.index.ntotal} chunks, "
+            f"built in {time.perf_counter() - start:.1f}s"
+        )
+        return vectorstore
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or update the RAG FAISS store.")
+    parser.add_argument("--store", default=STORE_PATH)
+    parser.add_argument("--datasets", default=DATASETS_PATH)
+    parser.add_argument("--index-type", default="flat")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument(
+        "--max-memory-mb", type=float, default=None, help="cap on each batch's text and vectors"
+    )
+    parser.add_argument("--nlist", type=int, default=None, help="IVF cells (ivf, ivfpq)")
+    parser.add_argument("--nprobe", type=int, default=None, help="IVF cells searched")
+    parser.add_argument("--ef-search", type=int, default=None, help="HNSW search width")
+    parser.add_argument("--hnsw-m", type=int, default=None, help="HNSW neighbours per node")
+    parser.add_argument("--pq-m", type=int, default=None, help="PQ bytes per vector")
+    parser.add_argument("--pca", type=int, default=None, help="reduce to N dimensions first")
+    parser.add_argument("--train-size", type=int, default=None, help="vectors to train on")
+    parser.add_argument(
+        "--no-wait", action="store_true", help="exit if another build is running"
+    )
+    args = parser.parse_args()
+    index_options = {
+        name: getattr(args, name)
+        for name in ("nlist", "nprobe", "ef_search", "hnsw_m", "pq_m", "pca", "train_size")
+        if getattr(args, name) is not None
+    }
+    build_index(
+        args.store,
+        args.datasets,
+        index_type=args.index_type,
+        index_options=index_options,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        max_memory_mb=args.max_memory_mb,
+        wait=not args.no_wait,
+    )
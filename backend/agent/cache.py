@@ -0,0 +1,361 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+DEFAULT_EMBEDDING_CACHE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "embedding_cache.sqlite3"
+)
+
+
+def text_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk embedding cache keyed by (model name, sha256 of the text).
+
+    Vectors are stored as float32 blobs in SQLite (WAL mode, so several
+    worker processes can share one file). When the cache grows past
+    ``max_entries`` or ``max_bytes`` the least recently used rows are evicted.
+
+    Hits are not written back one by one: their ``last_used`` times are kept
+    in memory and flushed every ``touch_every`` hits, before an eviction and
+    on ``close``. Row count and size are tracked as rows are put; the table
+    is only counted when that estimate passes a limit, or every
+    ``recount_every`` puts to pick up rows other processes added.
+    """
+
+    def __init__(
+        self,
+        path=DEFAULT_EMBEDDING_CACHE,
+        max_entries=200_000,
+        max_bytes=None,
+        touch_every=256,
+        recount_every=100,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.touch_every = touch_every
+        self.recount_every = recount_every
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, key))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self._conn.commit()
+        self._touched = {}
+        self._puts = 0
+        self._count, self._bytes = self._totals()
+
+    def get_many(self, model, texts):
+        """Returns a list aligned with ``texts``; misses are ``None``."""
+        keys = [text_key(text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                rows = self._conn.execute(
+                    "SELECT key, vector FROM embeddings WHERE model = ? AND key IN "
+                    f"({','.join('?' * len(batch))})",
+                    [model, *batch],
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._touched.update(((model, key), now) for key in found)
+                if len(self._touched) >= self.touch_every:
+                    self._flush_touched()
+                    self._conn.commit()
+        return [
+            np.frombuffer(found[key], dtype=np.float32).tolist() if key in found else None
+            for key in keys
+        ]
+
+    def put_many(self, model, texts, vectors):
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((model, text_key(text), blob, len(blob), now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, key, vector, size, last_used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            # Replaced rows are counted twice; that only brings a recount forward.
+            self._count += len(rows)
+            self._bytes += sum(row[3] for row in rows)
+            self._puts += 1
+            if self._over_limit() or self._puts % self.recount_every == 0:
+                self._flush_touched()
+                self._count, self._bytes = self._totals()
+                self._evict()
+            self._conn.commit()
+
+    def _totals(self):
+        return self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings"
+        ).fetchone()
+
+    def _over_limit(self):
+        return (self.max_entries and self._count > self.max_entries) or (
+            self.max_bytes and self._bytes > self.max_bytes
+        )
+
+    def _flush_touched(self):
+        if self._touched:
+            # MAX keeps a row's newer put time over an older, deferred hit.
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = MAX(last_used, ?) WHERE model = ? AND key = ?",
+                [(when, model, key) for (model, key), when in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _evict(self):
+        count, size = self._count, self._bytes
+        excess = 0
+        if self.max_entries and count > self.max_entries:
+            excess = count - self.max_entries
+        if self.max_bytes and size > self.max_bytes and count:
+            excess = max(excess, int((size - self.max_bytes) / (size / count)) + 1)
+        if excess:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings"
+                " ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            self._count, self._bytes = self._totals()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+        self._conn.close()
+
+
+def _as_float32(vector):
+    return np.asarray(vector, dtype=np.float32).tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embeddings model so only texts missing from ``cache`` are sent.
+
+    Fresh vectors are rounded to float32 like cached ones, so a text embeds
+    identically whether or not it was a cache hit. The async methods run the
+    SQLite lookups on a worker thread, off the event loop.
+    """
+
+    def __init__(self, embeddings, cache=None, model=None):
+        self.embeddings = embeddings
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.model = model or getattr(embeddings, "model", type(embeddings).__name__)
+
+    def _store(self, texts, vectors, missing, missing_texts, embedded):
+        embedded = {text: _as_float32(vector) for text, vector in zip(missing_texts, embedded)}
+        self.cache.put_many(self.model, missing_texts, embedded.values())
+        for i in missing:
+            vectors[i] = embedded[texts[i]]
+        return vectors
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        vectors = self.cache.get_many(self.model, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if not missing:
+            return vectors
+        missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+        embedded = self.embeddings.embed_documents(missing_texts)
+        return self._store(texts, vectors, missing, missing_texts, embedded)
+
+    async def aembed_documents(self, texts):
+        texts = list(texts)
+        vectors = await asyncio.to_thread(self.cache.get_many, self.model, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if not missing:
+            return vectors
+        missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+        embedded = await self.embeddings.aembed_documents(missing_texts)
+        return await asyncio.to_thread(
+            self._store, texts, vectors, missing, missing_texts, embedded
+        )
+
+    def embed_query(self, text):
+        vector = self.cache.get_many(self.model, [text])[0]
+        if vector is None:
+            vector = _as_float32(self.embeddings.embed_query(text))
+            self.cache.put_many(self.model, [text], [vector])
+        return vector
+
+    async def aembed_query(self, text):
+        vector = (await asyncio.to_thread(self.cache.get_many, self.model, [text]))[0]
+        if vector is None:
+            vector = _as_float32(await self.embeddings.aembed_query(text))
+            await asyncio.to_thread(self.cache.put_many, self.model, [text], [vector])
+        return vector
+
+
+def normalize_query(text):
+    return " ".join(text.lower().split())
+
+
+class QueryEmbeddingCache:
+    """In-process LRU cache of query embeddings with a TTL.
+
+    Keys are normalized (case and whitespace), so trivially different
+    rephrasings share an entry. Bounded by ``max_entries`` and ``max_bytes``
+    (float32 vector plus key); entries older than ``ttl`` seconds are misses.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024, ttl=3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text):
+        key = normalize_query(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] > self.ttl:
+                self._pop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0].tolist()
+
+    def put(self, text, vector):
+        key = normalize_query(text)
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (vector, time.monotonic())
+            self.bytes += vector.nbytes + len(key)
+            while self._entries and (
+                len(self._entries) > self.max_entries or self.bytes > self.max_bytes
+            ):
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key):
+        vector, _ = self._entries.pop(key)
+        self.bytes -= vector.nbytes + len(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class SemanticAnswerCache:
+    """Answers keyed by query embedding, matched by cosine similarity.
+
+    A lookup returns the cached answer of the most similar stored query if
+    its similarity is at least ``threshold``. Only answers stored with the
+    same ``scope`` match: the retriever passes the partitions a query was
+    routed to, so "hours at Seoul Kitchen" never gets the answer cached for
+    "hours at Hot Bird", however close their embeddings are. At most
+    ``max_entries`` answers are kept, evicting the least recently used. Call
+    ``clear`` when the underlying store changes.
+    """
+
+    def __init__(self, threshold=0.95, max_entries=512):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None
+        self._answers = [None] * max_entries
+        self._scopes = np.full(max_entries, "", dtype=object)
+        self._last_used = np.zeros(max_entries)
+        self._used = np.zeros(max_entries, dtype=bool)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def scope_key(keys):
+        """Scope for a set of partition keys; ``""`` for the whole store."""
+        return "\n".join(sorted(keys or ()))
+
+    def get(self, vector, scope=""):
+        query = self._unit(vector)
+        with self._lock:
+            if self._vectors is None or not self._used.any():
+                self.misses += 1
+                return None
+            candidates = self._used & (self._scopes == scope)
+            similarities = np.where(candidates, self._vectors @ query, -np.inf)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            self._last_used[best] = time.monotonic()
+            self.hits += 1
+            return self._answers[best]
+
+    def put(self, vector, answer, scope=""):
+        query = self._unit(vector)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(query)), dtype=np.float32)
+            free = np.flatnonzero(~self._used)
+            slot = int(free[0]) if len(free) else int(np.argmin(self._last_used))
+            self._vectors[slot] = query
+            self._answers[slot] = answer
+            self._scopes[slot] = scope
+            self._last_used[slot] = time.monotonic()
+            self._used[slot] = True
+
+    def clear(self):
+        with self._lock:
+            self._used[:] = False
+            self._answers = [None] * self.max_entries
+
+    def __len__(self):
+        return int(self._used.sum())
+
+    def stats(self):
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,503 @@
+"""Durable, bounded checkpointer for the agent graph.
+
+``SQLiteCheckpointSaver`` stores LangGraph checkpoints and pending writes in
+SQLite (WAL mode, so several worker processes can share one file), so
+conversations, including approvals pending at the sensitive-tools
+interrupt, survive a restart. It keeps the footprint bounded:
+
+* only the latest checkpoint of recently active threads is kept in memory,
+  deserialized once; threads idle for ``idle_seconds`` (or beyond
+  ``max_cached_threads``) are evicted and read back from disk when they
+  resume;
+* each thread keeps its newest ``keep_checkpoints`` checkpoints on disk,
+  older ones (and their writes) are pruned as new ones are saved;
+* threads not updated for ``retention_seconds`` are deleted.
+
+``stats()`` reports thread, checkpoint and write counts, memory and disk
+bytes, and eviction/pruning counters.
+"""
+
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    copy_checkpoint,
+    get_checkpoint_id,
+)
+from langgraph.constants import TASKS
+
+
+DEFAULT_CHECKPOINT_DB = os.environ.get(
+    "DINEBOT_CHECKPOINT_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkpoints.sqlite3"),
+)
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS checkpoints ("
+    " thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL,"
+    " parent_id TEXT, type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB,"
+    " size INTEGER NOT NULL,"
+    " PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id))",
+    "CREATE TABLE IF NOT EXISTS writes ("
+    " thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL,"
+    " task_id TEXT NOT NULL, idx INTEGER NOT NULL, channel TEXT NOT NULL,"
+    " type TEXT, value BLOB, size INTEGER NOT NULL,"
+    " PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx))",
+    "CREATE TABLE IF NOT EXISTS threads ("
+    " thread_id TEXT PRIMARY KEY, updated REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS threads_updated ON threads (updated)",
+)
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver):
+    """LangGraph checkpointer backed by SQLite with a bounded in-memory cache.
+
+    ``keep_checkpoints`` (at least 2, so the parent of the latest checkpoint
+    is kept) bounds the history per thread, ``None`` keeps all of it;
+    ``retention_seconds=None`` keeps threads forever. Expired threads are
+    deleted at most every ``prune_interval`` seconds while saving, or on
+    ``prune_expired()``.
+
+    The async methods run the (local, short) SQLite calls inline.
+    """
+
+    def __init__(
+        self,
+        path=DEFAULT_CHECKPOINT_DB,
+        keep_checkpoints=10,
+        retention_seconds=7 * 24 * 3600,
+        idle_seconds=600,
+        max_cached_threads=1024,
+        prune_interval=60,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        self.path = path
+        self.keep_checkpoints = None if keep_checkpoints is None else max(keep_checkpoints, 2)
+        self.retention_seconds = retention_seconds
+        self.idle_seconds = idle_seconds
+        self.max_cached_threads = max_cached_threads
+        self.prune_interval = prune_interval
+        # (thread_id, checkpoint_ns) -> (last used, thread version, database
+        # data_version, latest checkpoint row, its writes, the parent's sends,
+        # its CheckpointTuple once read)
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._last_pruned = 0.0
+        self.metrics = {
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "evicted_threads": 0,
+            "pruned_checkpoints": 0,
+            "expired_threads": 0,
+        }
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    # -- in-memory cache of each thread's latest checkpoint --
+
+    def _version(self, thread_id):
+        # Bumped on every save, by any process sharing the database, so a
+        # cached checkpoint is only served while it is still the latest.
+        row = self._conn.execute(
+            "SELECT updated FROM threads WHERE thread_id = ?", (thread_id,)
+        ).fetchone()
+        return row and row[0]
+
+    def _data_version(self):
+        # Changes only when another connection commits, so while it stays put
+        # no other process can have saved a newer checkpoint.
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _cache_get(self, key, seen):
+        entry = self._cache.get(key)
+        if entry is not None and entry[2] != seen:
+            if entry[1] == self._version(key[0]):
+                entry = entry[:2] + (seen,) + entry[3:]
+            else:
+                entry = None
+        if entry is None:
+            self.metrics["cache_misses"] += 1
+            return None
+        self.metrics["cache_hits"] += 1
+        self._cache.move_to_end(key)
+        self._cache[key] = (time.monotonic(),) + entry[1:]
+        return entry
+
+    def _cache_put(self, key, version, seen, row, writes, sends):
+        self._cache_pop(key)
+        self._cache[key] = (time.monotonic(), version, seen, row, writes, sends, None)
+        self._cached_bytes += _entry_size(row, writes, sends)
+        self.evict_idle()
+
+    def _cache_written(self, key, version, seen, checkpoint_id):
+        """Updates the cache after writes to ``checkpoint_id`` were saved."""
+        entry = self._cache.get(key)
+        if entry is None:
+            return
+        row, writes, sends = entry[3:6]
+        if row[0] == checkpoint_id:
+            writes = self._writes(key[0], key[1], checkpoint_id)
+        # Writes to an older checkpoint (which can land after the next put)
+        # leave the cached latest one as it is.
+        self._cache_put(key, version, seen, row, writes, sends)
+
+    def _cache_pop(self, key):
+        entry = self._cache.pop(key, None)
+        if entry is not None:
+            self._cached_bytes -= _entry_size(*entry[3:6])
+
+    def evict_idle(self):
+        """Drops idle threads (and the least recently used past the cap) from memory."""
+        with self._lock:
+            deadline = time.monotonic() - self.idle_seconds
+            while self._cache:
+                key, entry = next(iter(self._cache.items()))
+                if entry[0] >= deadline and len(self._cache) <= self.max_cached_threads:
+                    break
+                self._cache_pop(key)
+                self.metrics["evicted_threads"] += 1
+
+    # -- reads --
+
+    def _load(self, thread_id, checkpoint_ns, checkpoint_id=None):
+        if checkpoint_id is None:
+            row = self._conn.execute(
+                "SELECT checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata"
+                " FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+                " ORDER BY checkpoint_id DESC LIMIT 1",
+                (thread_id, checkpoint_ns),
+            ).fetchone()
+        else:
+            row = self._conn.execute(
+                "SELECT checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata"
+                " FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+                " AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            ).fetchone()
+        if row is None:
+            return None
+        return row, self._writes(thread_id, checkpoint_ns, row[0]), self._sends(
+            thread_id, checkpoint_ns, row[1]
+        )
+
+    def _writes(self, thread_id, checkpoint_ns, checkpoint_id):
+        return self._conn.execute(
+            "SELECT task_id, channel, type, value FROM writes WHERE thread_id = ?"
+            " AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+
+    def _sends(self, thread_id, checkpoint_ns, parent_id):
+        if not parent_id:
+            return []
+        return self._conn.execute(
+            "SELECT type, value FROM writes WHERE thread_id = ? AND checkpoint_ns = ?"
+            " AND checkpoint_id = ? AND channel = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, parent_id, TASKS),
+        ).fetchall()
+
+    def _tuple(self, thread_id, checkpoint_ns, row, writes, sends):
+        checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata = row
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={
+                **self.serde.loads_typed((type_, checkpoint)),
+                "pending_sends": [self.serde.loads_typed(send) for send in sends],
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": parent_id,
+                }
+            }
+            if parent_id
+            else None,
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((t, value)))
+                for task_id, channel, t, value in writes
+            ],
+        )
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        key = (thread_id, checkpoint_ns)
+        with self._lock:
+            seen = self._data_version()
+            entry = self._cache_get(key, seen)
+            if entry is not None and checkpoint_id in (None, entry[3][0]):
+                cached = entry[6]
+                if cached is None:
+                    cached = self._tuple(thread_id, checkpoint_ns, *entry[3:6])
+                    self._cache[key] = entry[:6] + (cached,)
+                # The graph updates the checkpoint it resumes from in place.
+                return cached._replace(
+                    checkpoint=copy_checkpoint(cached.checkpoint),
+                    pending_writes=list(cached.pending_writes),
+                )
+            version = self._version(thread_id)
+            loaded = self._load(thread_id, checkpoint_ns, checkpoint_id)
+            if loaded is None:
+                return None
+            if checkpoint_id is None:
+                self._cache_put(key, version, seen, *loaded)
+        return self._tuple(thread_id, checkpoint_ns, *loaded)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id FROM checkpoints"
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(get_checkpoint_id(config))
+        if before and get_checkpoint_id(before):
+            clauses.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+        with self._lock:
+            keys = self._conn.execute(query, params).fetchall()
+        for thread_id, checkpoint_ns, checkpoint_id in keys:
+            if limit is not None and limit <= 0:
+                break
+            with self._lock:
+                loaded = self._load(thread_id, checkpoint_ns, checkpoint_id)
+            if loaded is None:
+                continue
+            checkpoint_tuple = self._tuple(thread_id, checkpoint_ns, *loaded)
+            if filter and not all(
+                checkpoint_tuple.metadata.get(k) == v for k, v in filter.items()
+            ):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield checkpoint_tuple
+
+    # -- writes --
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        c = checkpoint.copy()
+        c.pop("pending_sends", None)
+        type_, blob = self.serde.dumps_typed(c)
+        metadata_type, metadata_blob = self.serde.dumps_typed(metadata)
+        row = (
+            checkpoint["id"],
+            config["configurable"].get("checkpoint_id"),
+            type_,
+            blob,
+            metadata_type,
+            metadata_blob,
+        )
+        with self._lock:
+            seen = self._data_version()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id,"
+                " parent_id, type, checkpoint, metadata_type, metadata, size)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, *row, len(blob) + len(metadata_blob)),
+            )
+            version = self._touch(thread_id)
+            self._prune_thread(thread_id, checkpoint_ns)
+            self._conn.commit()
+            # put_writes for this checkpoint may already have run: langgraph
+            # submits writes without waiting for the checkpoint's put.
+            writes = self._writes(thread_id, checkpoint_ns, row[0])
+            sends = self._sends(thread_id, checkpoint_ns, row[1])
+            self._cache_put((thread_id, checkpoint_ns), version, seen, row, writes, sends)
+            self._maybe_prune_expired()
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(self, config, writes, task_id):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            rows.append(
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint_id,
+                    task_id,
+                    WRITES_IDX_MAP.get(channel, idx),
+                    channel,
+                    type_,
+                    blob,
+                    len(blob),
+                )
+            )
+        # Special channels (errors, interrupts) overwrite; regular writes are
+        # only recorded once per task.
+        verb = "REPLACE" if all(w[0] in WRITES_IDX_MAP for w in writes) else "IGNORE"
+        with self._lock:
+            seen = self._data_version()
+            self._conn.executemany(
+                f"INSERT OR {verb} INTO writes (thread_id, checkpoint_ns, checkpoint_id,"
+                " task_id, idx, channel, type, value, size) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            version = self._touch(thread_id)
+            self._conn.commit()
+            self._cache_written((thread_id, checkpoint_ns), version, seen, checkpoint_id)
+
+    def _touch(self, thread_id):
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO threads (thread_id, updated) VALUES (?, ?)",
+            (thread_id, now),
+        )
+        return now
+
+    def _prune_thread(self, thread_id, checkpoint_ns):
+        if self.keep_checkpoints is None:
+            return
+        old = self._conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+            " ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+            (thread_id, checkpoint_ns, self.keep_checkpoints),
+        ).fetchall()
+        if not old:
+            return
+        for table in ("checkpoints", "writes"):
+            self._conn.executemany(
+                f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ?"
+                " AND checkpoint_id = ?",
+                [(thread_id, checkpoint_ns, checkpoint_id) for (checkpoint_id,) in old],
+            )
+        self.metrics["pruned_checkpoints"] += len(old)
+
+    def _maybe_prune_expired(self):
+        now = time.monotonic()
+        if now - self._last_pruned >= self.prune_interval:
+            self._last_pruned = now
+            self.prune_expired()
+
+    def prune_expired(self):
+        """Deletes threads not updated for ``retention_seconds``; returns how many."""
+        if self.retention_seconds is None:
+            return 0
+        with self._lock:
+            expired = [
+                thread_id
+                for (thread_id,) in self._conn.execute(
+                    "SELECT thread_id FROM threads WHERE updated < ?",
+                    (time.time() - self.retention_seconds,),
+                ).fetchall()
+            ]
+            for thread_id in expired:
+                self._delete(thread_id)
+            self._conn.commit()
+            self.metrics["expired_threads"] += len(expired)
+        return len(expired)
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            self._delete(thread_id)
+            self._conn.commit()
+
+    def _delete(self, thread_id):
+        for table in ("checkpoints", "writes", "threads"):
+            self._conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+        for key in [key for key in self._cache if key[0] == thread_id]:
+            self._cache_pop(key)
+
+    # -- async versions: SQLite is local, so these run inline --
+
+    async def aget_tuple(self, config):
+        return self.get_tuple(config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id):
+        return self.put_writes(config, writes, task_id)
+
+    def get_next_version(self, current, channel):
+        # Same scheme as langgraph's MemorySaver and SqliteSaver.
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # -- metrics --
+
+    def stats(self):
+        with self._lock:
+            threads = self._conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+            checkpoints, checkpoint_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM checkpoints"
+            ).fetchone()
+            writes, write_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM writes"
+            ).fetchone()
+            return {
+                "threads": threads,
+                "checkpoints": checkpoints,
+                "writes": writes,
+                "data_bytes": checkpoint_bytes + write_bytes,
+                "disk_bytes": sum(
+                    os.path.getsize(self.path + suffix)
+                    for suffix in ("", "-wal", "-shm")
+                    if os.path.exists(self.path + suffix)
+                ),
+                "cached_threads": len(self._cache),
+                "cached_bytes": self._cached_bytes,
+                **self.metrics,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _entry_size(row, writes, sends):
+    return (
+        len(row[3] or b"")
+        + len(row[5] or b"")
+        + sum(len(w[3] or b"") for w in writes)
+        + sum(len(s[1] or b"") for s in sends)
+    )
@@ -0,0 +1,117 @@
+DEFAULT_CONTEXT_MODEL = "gpt-3.5-turbo"
+# Chunks are split with chunk_overlap=200; shorter common spans are left alone
+# so a repeated heading or word is not mistaken for split overlap.
+MIN_OVERLAP = 20
+MAX_OVERLAP = 400
+# A chunk is only truncated to fit the budget if this many tokens of it fit.
+MIN_TRUNCATED_TOKENS = 32
+
+
+def _encoding(model):
+    # Imported on first use: the embeddings module loads the openai SDK.
+    from backend.agent.embeddings import _encoding
+
+    return _encoding(model)
+
+
+def overlap_length(before, after, min_overlap=MIN_OVERLAP, max_overlap=MAX_OVERLAP):
+    """Length of the longest suffix of ``before`` that is a prefix of ``after``."""
+    for length in range(min(len(before), len(after), max_overlap), min_overlap - 1, -1):
+        if before.endswith(after[:length]):
+            return length
+    return 0
+
+
+class ContextBuilder:
+    """Assembles retrieved chunks into a prompt context within a token budget.
+
+    Chunks are taken in the order given (most relevant first). Text a chunk
+    shares with an already included chunk of the same file, the overlap the
+    splitter put between neighbouring chunks, is cut out, and chunks are added
+    until ``max_tokens`` is reached; the last one may be truncated to fit.
+    Tokens are counted with tiktoken for ``model``, or estimated at ~4
+    characters per token when the encoding is unavailable. Each build prints
+    a summary unless ``verbose`` is false; the totals are kept in ``stats``.
+    """
+
+    def __init__(
+        self, max_tokens=4000, model=DEFAULT_CONTEXT_MODEL, separator="\n\n", verbose=True
+    ):
+        self.max_tokens = max_tokens
+        self.verbose = verbose
+        self.model = model
+        self.separator = separator
+        self.stats = {"calls": 0, "tokens": 0, "saved_overlap": 0, "saved_budget": 0}
+
+    def count(self, text):
+        encoding = _encoding(self.model)
+        if encoding is None:
+            return (len(text) + 3) // 4
+        return len(encoding.encode(text))
+
+    def truncate(self, text, tokens):
+        encoding = _encoding(self.model)
+        if encoding is None:
+            return text[: tokens * 4]
+        return encoding.decode(encoding.encode(text)[:tokens])
+
+    def dedupe(self, text, filename, included):
+        """``text`` without the spans it shares with ``included`` chunks of ``filename``."""
+        for other_filename, other in included:
+            if filename is None or other_filename != filename:
+                continue
+            if text in other:
+                return ""
+            # ``other`` came right before this chunk in the file...
+            text = text[overlap_length(other, text):]
+            # ...or right after it.
+            length = overlap_length(text, other)
+            if length:
+                text = text[:-length]
+        return text
+
+    def build(self, docs):
+        """Context string for ``docs``, ``(doc, score)`` pairs or documents."""
+        docs = [doc[0] if isinstance(doc, tuple) else doc for doc in docs]
+        included = []
+        parts = []
+        used = 0
+        saved_overlap = 0
+        saved_budget = 0
+        separator_tokens = self.count(self.separator)
+        for position, doc in enumerate(docs):
+            original = doc.page_content
+            filename = doc.metadata.get("filename")
+            text = self.dedupe(original, filename, included).strip()
+            original_tokens = self.count(original)
+            tokens = self.count(text)
+            saved_overlap += original_tokens - tokens
+            if not text:
+                continue
+            cost = tokens + (separator_tokens if parts else 0)
+            if used + cost > self.max_tokens:
+                remaining = self.max_tokens - used - (separator_tokens if parts else 0)
+                if remaining >= MIN_TRUNCATED_TOKENS:
+                    kept = self.truncate(text, remaining)
+                    kept_tokens = self.count(kept)
+                    parts.append(kept)
+                    used += kept_tokens + (separator_tokens if len(parts) > 1 else 0)
+                    saved_budget += tokens - kept_tokens
+                else:
+                    saved_budget += tokens
+                # Later chunks are less relevant; count them as dropped.
+                saved_budget += sum(self.count(d.page_content) for d in docs[position + 1 :])
+                break
+            parts.append(text)
+            included.append((filename, original))
+            used += cost
+        self.stats["calls"] += 1
+        self.stats["tokens"] += used
+        self.stats["saved_overlap"] += saved_overlap
+        self.stats["saved_budget"] += saved_budget
+        if self.verbose:
+            print(
+                f"Context: {used} tokens from {len(parts)}/{len(docs)} chunks, "
+                f"saved {saved_overlap} overlapping and {saved_budget} over-budget tokens"
+            )
+        return self.separator.join(parts)
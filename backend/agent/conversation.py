@@ -0,0 +1,112 @@
+"""Bounded conversation context for the assistant: a message window plus a rolling summary.
+
+Each turn the app sends only the new user message. ``ConversationWindow``
+keeps the persona's checkpointed messages bounded: once there are more than
+``max_messages``, all but the newest ``keep_messages`` are folded into a
+running summary (one summarizer call) and removed from the state. The LLM
+sees the summary as a system message followed by the recent messages.
+
+The cut never separates an AI message's tool calls from their
+``ToolMessage`` results, which the chat API requires to stay together.
+"""
+
+from langchain_core.messages import (
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+    get_buffer_string,
+)
+from langgraph.constants import TAG_NOSTREAM
+
+
+SUMMARY_PROMPT = (
+    "You maintain the running summary of a conversation between a user and DineBot, "
+    "a restaurant and reservation assistant for Charlotte, NC. Update the summary with "
+    "the new messages below. Keep every detail needed to continue: restaurants discussed, "
+    "reservation and cab details (names, dates, times, party sizes, locations, special "
+    "requests), what was booked or declined, and open questions. Be concise and factual; "
+    "reply with the summary only."
+)
+
+
+class ConversationWindow:
+    """Folds all but the most recent messages into a rolling summary.
+
+    Compaction starts when a persona has more than ``max_messages`` and
+    keeps the newest ``keep_messages`` (a few more if needed to keep a tool
+    call with its results), so the summarizer runs once every
+    ``max_messages - keep_messages`` messages rather than every turn.
+    Without a ``summarizer`` the older messages are dropped.
+    """
+
+    def __init__(self, summarizer=None, max_messages=24, keep_messages=12):
+        self.summarizer = summarizer
+        self.max_messages = max_messages
+        self.keep_messages = min(keep_messages, max_messages)
+        self.stats = {"compactions": 0, "summarized_messages": 0}
+
+    def split(self, messages):
+        """``(older, recent)``; ``older`` is empty while under the window."""
+        if len(messages) <= self.max_messages:
+            return [], messages
+        start = len(messages) - self.keep_messages
+        # Don't start on a tool result: keep the AI message that made the call.
+        while start > 0 and isinstance(messages[start], ToolMessage):
+            start -= 1
+        return messages[:start], messages[start:]
+
+    def _summary_input(self, summary, older):
+        previous = summary or "(none yet)"
+        return [
+            SystemMessage(SUMMARY_PROMPT),
+            HumanMessage(
+                f"Current summary:\n{previous}\n\nNew messages:\n{get_buffer_string(older)}"
+            ),
+        ]
+
+    def _summarizer(self):
+        # Summaries are internal: keep their tokens out of stream_mode="messages".
+        return self.summarizer.with_config(tags=[TAG_NOSTREAM], run_name="summarize")
+
+    def summarize(self, summary, older, config=None):
+        if self.summarizer is None:
+            return summary
+        return self._summarizer().invoke(self._summary_input(summary, older), config).content
+
+    async def asummarize(self, summary, older, config=None):
+        if self.summarizer is None:
+            return summary
+        result = await self._summarizer().ainvoke(self._summary_input(summary, older), config)
+        return result.content
+
+    def _compacted(self, older, recent, summary):
+        self.stats["compactions"] += 1
+        self.stats["summarized_messages"] += len(older)
+        return recent, summary, [RemoveMessage(id=m.id) for m in older]
+
+    def compact(self, messages, summary=None, config=None):
+        """``(recent messages, summary, removals)`` for a persona's messages.
+
+        ``removals`` are ``RemoveMessage`` updates deleting the summarized
+        messages from the state.
+        """
+        older, recent = self.split(messages)
+        if not older:
+            return recent, summary, []
+        return self._compacted(older, recent, self.summarize(summary, older, config))
+
+    async def acompact(self, messages, summary=None, config=None):
+        older, recent = self.split(messages)
+        if not older:
+            return recent, summary, []
+        return self._compacted(older, recent, await self.asummarize(summary, older, config))
+
+    @staticmethod
+    def with_summary(messages, summary):
+        """``messages`` preceded by the summary, as the LLM should see them."""
+        if not summary:
+            return list(messages)
+        return [SystemMessage(f"Summary of the earlier conversation:\n{summary}")] + list(
+            messages
+        )
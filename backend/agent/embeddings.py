@@ -0,0 +1,97 @@
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+from backend.agent.llm_gateway import get_gateway
+
+
+DEFAULT_EMBEDDING_MODEL = "text-embedding-ada-002"
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model):
+    try:
+        import tiktoken
+
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        return None
+
+
+def count_tokens(texts, model=DEFAULT_EMBEDDING_MODEL):
+    """Token count used for rate limiting; falls back to ~4 chars per token
+    when the tiktoken encoding is not available (e.g. offline)."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return sum(len(text) // 4 + 1 for text in texts)
+    return sum(len(encoding.encode(text)) for text in texts)
+
+
+class BatchEmbeddings(Embeddings):
+    """OpenAI embeddings sent as concurrent batches through the LLM gateway.
+
+    Texts are split into batches of ``batch_size`` and embedded on a pool of
+    ``max_workers`` threads. Requests go through ``gateway`` (by default
+    ``get_gateway()``), which rate-limits and retries every attempt of each
+    batch, so one failed request does not restart the whole run. Point
+    ``base_url`` at a local stand-in server (see ``backend.agent.stub_openai``)
+    to run without the OpenAI API.
+    """
+
+    def __init__(
+        self,
+        model=DEFAULT_EMBEDDING_MODEL,
+        batch_size=64,
+        max_workers=4,
+        api_key=None,
+        base_url=None,
+        client=None,
+        gateway=None,
+    ):
+        self.model = model
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.gateway = gateway or get_gateway()
+        if client is None:
+            kwargs = {"base_url": base_url}
+            if api_key:
+                kwargs["api_key"] = api_key
+            client = self.gateway.openai_client(**kwargs)
+        self.client = client
+        self.stats = {"chunks": 0, "requests": 0, "seconds": 0.0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def throughput(self):
+        """Embedded chunks per second over all ``embed_documents`` calls."""
+        if not self.stats["seconds"]:
+            return 0.0
+        return self.stats["chunks"] / self.stats["seconds"]
+
+    def _embed_batch(self, texts):
+        response = self.client.embeddings.create(model=self.model, input=texts)
+        with self._stats_lock:
+            self.stats["requests"] += 1
+        return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        start = time.perf_counter()
+        batches = [
+            texts[i : i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(self._embed_batch, batches))
+        with self._stats_lock:
+            self.stats["chunks"] += len(texts)
+            self.stats["seconds"] += time.perf_counter() - start
+        return [vector for batch in results for vector in batch]
+
+    def embed_query(self, text):
+        return self._embed_batch([text])[0]
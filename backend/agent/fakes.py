@@ -0,0 +1,191 @@
+"""Deterministic stand-ins for the OpenAI models, for offline tests, benchmarks and load tests."""
+
+import asyncio
+import hashlib
+import itertools
+import json
+import re
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from backend.agent.lexical import tokenize
+
+
+def _bucket(token, size):
+    digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % size, 1.0 if value >> 63 else -1.0
+
+
+class BagOfWordsEmbeddings(Embeddings):
+    """Hashed bag-of-words vectors: offline, deterministic and fast.
+
+    Each word (see ``lexical.tokenize``) adds +-1 to a hashed dimension and
+    the result is L2-normalized, so texts sharing words land close together,
+    which is enough for retrieval recall to mean something. ``latency``
+    seconds are slept per call to mimic an embeddings API round trip (with
+    ``asyncio.sleep`` in the async methods, so concurrent calls overlap).
+    """
+
+    def __init__(self, size=1536, latency=0.0):
+        self.size = size
+        self.latency = latency
+        self.model = f"bag-of-words-{size}"
+        self.calls = 0
+
+    def _embed(self, text):
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in tokenize(text):
+            index, sign = _bucket(token, self.size)
+            vector[index] += sign
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+
+_call_ids = itertools.count()
+_TIME = re.compile(r"\b\d{1,2}(?::\d{2})?\s?(?:am|pm)\b", re.IGNORECASE)
+_DATE = re.compile(r"\b\d{4}-\d{2}-\d{2}\b")
+_PARTY = re.compile(r"\b(\d+)\s+(?:people|persons|guests|passengers)\b", re.IGNORECASE)
+_PICKUP = re.compile(r"\bfrom (.+?)(?: to | at | for |[.?!]|$)", re.IGNORECASE)
+
+
+def _text(message):
+    content = message.content
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def _find(pattern, text, default):
+    match = pattern.search(text)
+    return match.group(match.lastindex or 0) if match else default
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Rule-based chat model that drives DineBot's tools without an API.
+
+    Bound with ``bind_tools`` (as the agent's model is), it answers a user
+    message with a tool call picked by keywords: "book ... cab/taxi" calls
+    ``book_a_cab`` (picking up "from X"), "book ... table" calls ``book_a_table``, and a question
+    calls ``answer_question``; tool results and anything else get a short
+    text reply. Unbound, as in the RAG answer chain and the conversation
+    summarizer, it answers from the prompt. Replies stream word by word, and
+    ``latency`` seconds are slept per call (``asyncio.sleep`` when async).
+    """
+
+    latency: float = 0.0
+    tool_names: tuple = ()
+
+    @property
+    def _llm_type(self):
+        return "scripted-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        names = tuple(getattr(tool, "name", None) or tool["name"] for tool in tools)
+        return self.model_copy(update={"tool_names": names})
+
+    def _tool_call(self, name, args):
+        return AIMessage("", tool_calls=[{"name": name, "args": args, "id": f"call_{next(_call_ids)}"}])
+
+    def respond(self, messages):
+        last = messages[-1]
+        if not self.tool_names:
+            return AIMessage(self._answer(messages))
+        if isinstance(last, ToolMessage):
+            return AIMessage(f"Done: {_text(last)}")
+        text = _text(last)
+        lowered = text.lower()
+        if "book" in lowered and ("cab" in lowered or "taxi" in lowered):
+            if "book_a_cab" in self.tool_names:
+                return self._tool_call(
+                    "book_a_cab",
+                    {
+                        "userquery": text,
+                        "pickuplocation": _find(_PICKUP, text, "Uptown"),
+                        "pickuptime": _find(_TIME, text, "7pm"),
+                        "numofpassengers": int(_find(_PARTY, text, 1)),
+                        "specialrequirements": "none",
+                    },
+                )
+        if "book" in lowered and "table" in lowered and "book_a_table" in self.tool_names:
+            return self._tool_call(
+                "book_a_table",
+                {"userquery": text, "date": _find(_DATE, text, "today"), "time": _find(_TIME, text, "7pm")},
+            )
+        if "?" in text and "answer_question" in self.tool_names:
+            return self._tool_call("answer_question", {"query": text})
+        return AIMessage(f"Happy to help with that: {text}")
+
+    def _answer(self, messages):
+        for message in messages:
+            text = _text(message)
+            if "Current summary:" in text:
+                return "Summary: " + " ".join(text.split()[-40:])
+            if isinstance(message, SystemMessage) and "Context:" in text:
+                context = text.split("Context:", 1)[1].strip().splitlines()
+                return f"From DineBot's notes: {context[0] if context else 'nothing found'}"
+        return f"Echo: {_text(messages[-1])}"
+
+    def _result(self, messages):
+        return ChatResult(generations=[ChatGeneration(message=self.respond(messages))])
+
+    def _chunks(self, messages):
+        message = self.respond(messages)
+        if message.tool_calls:
+            call = message.tool_calls[0]
+            chunk = {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": 0}
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[chunk]))
+            return
+        for i, word in enumerate(message.content.split(" ")):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._result(messages)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        for chunk in self._chunks(messages):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for chunk in self._chunks(messages):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
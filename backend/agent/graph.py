@@ -1,30 +1,37 @@
-from langchain_core.prompts import ChatPromptTemplate
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.graph import StateGraph
-from langgraph.prebuilt import tools_condition
-from langgraph.graph import END, StateGraph, START
-from langchain_core.messages import ToolMessage, HumanMessage
+"""The DineBot agent graph.
+
+Importing this module is cheap: it neither builds the FAISS store nor
+creates an OpenAI client. ``build_graph`` compiles a graph on demand, and
+``get_graph`` (or ``from backend.agent.graph import graph``) returns one
+shared, lazily built graph per process. The RAG tools load the existing
+store at ``backend/agent/faiss_store`` on first use; build or update it
+beforehand with ``python -m backend.agent.build_index``.
+"""
+
+import functools
 import json
 import os
-from langchain_openai import ChatOpenAI
+import threading
+
+from langchain_core.prompts import ChatPromptTemplate
+from langgraph.graph import END, StateGraph, START
+from langgraph.prebuilt import tools_condition
 from backend.agent.state import State
+from backend.agent.checkpoint import SQLiteCheckpointSaver
+from backend.agent.conversation import ConversationWindow
 from backend.agent.nodes.assistant import Assistant
+from backend.agent.llm_gateway import get_gateway
 from backend.agent.utils import create_tool_node_with_fallback
-from backend.agent.tools.general import book_a_cab, book_a_table, answer_question
-from backend.agent.rag import populate_vector_db, create_faiss_store
-
-
-token = os.environ.get("OPENAI_API_KEY")
-
-llm = ChatOpenAI(api_key=token)
+from backend.agent.tools.general import (
+    book_a_cab,
+    book_a_table,
+    answer_question,
+    answer_compound_question,
+)
 
 
 ########### General Agent ###########################
 
-path = os.path.dirname(os.path.abspath(__file__)) + "/"
-documents = populate_vector_db(path + "rag_datasets")
-create_faiss_store(documents, llm=llm, store_path=path + "faiss_store", rewrite=True)
-
 general_prompt = ChatPromptTemplate.from_messages(
     [
         (
@@ -55,26 +62,21 @@ general_safe_tools = [book_a_table]
 
 general_sensitive_tools = [book_a_cab]
 
-rag_tools = [answer_question]
-
-general_agent = general_prompt | llm.bind_tools(
-    general_safe_tools + general_sensitive_tools + rag_tools
-)
+rag_tools = [answer_question, answer_compound_question]
 
 #######################
 
 ####### Graph ################
 
-builder = StateGraph(State)
-routes: list = json.load(
-    open(os.path.dirname(os.path.abspath(__file__)) + "/../../role-values.json")
-)
+with open(os.path.dirname(os.path.abspath(__file__)) + "/../../role-values.json") as f:
+    routes: list = json.load(f)
 
 
-def route_to_agent(state: State):
+def route_to_agent(state: State, verbose=True):
     if state["current_persona"] in routes:
         if state["current_persona"] == "General Agent":
-            print("Routing to...", state["current_persona"])
+            if verbose:
+                print("Routing to...", state["current_persona"])
             return state["current_persona"]
         else:
             return END
@@ -84,7 +86,8 @@ def route_to_agent(state: State):
 def route_tools(state: State):
     current_persona = state["current_persona"]
     messages = state["messages"][current_persona]
-    next_node = tools_condition(messages)
+    # tools_condition only looks at the last message.
+    next_node = tools_condition(messages[-1:])
     # If no tools are invoked, return to the user
     if next_node == END:
         return END
@@ -103,41 +106,91 @@ def route_tools(state: State):
     return current_persona + "_safe_tools"
 
 
-builder.add_conditional_edges(START, route_to_agent, routes)
-node_name = routes[0]
-builder.add_node(node_name, Assistant(general_agent))
-builder.add_node(
-    node_name + "_safe_tools",
-    create_tool_node_with_fallback(general_safe_tools, node_name),
-)
-builder.add_node(
-    node_name + "_sensitive_tools",
-    create_tool_node_with_fallback(general_sensitive_tools, node_name),
-)
-builder.add_node(
-    node_name + "_rag_tools", create_tool_node_with_fallback(rag_tools, node_name)
-)
-builder.add_conditional_edges(
-    node_name,
-    route_tools,
-    [
+def build_graph(llm=None, checkpointer=None, verbose=True):
+    """Compiles the agent graph around ``llm`` (by default a streaming ChatOpenAI
+    from the LLM gateway, see ``backend.agent.llm_gateway``).
+
+    Interrupts before sensitive tools; ``checkpointer`` defaults to a
+    ``SQLiteCheckpointSaver`` (see ``backend.agent.checkpoint``), so threads
+    survive restarts. The graph runs with ``invoke``/``stream`` or,
+    without a thread per in-flight request, with ``ainvoke``/``astream``.
+    ``verbose=False`` turns off the routing printout.
+    """
+    if llm is None:
+        llm = get_gateway().chat_model(
+            api_key=os.environ.get("OPENAI_API_KEY"), streaming=True
+        )
+    general_agent = general_prompt | llm.bind_tools(
+        general_safe_tools + general_sensitive_tools + rag_tools
+    )
+
+    builder = StateGraph(State)
+    builder.add_conditional_edges(
+        START, functools.partial(route_to_agent, verbose=verbose), routes
+    )
+    node_name = routes[0]
+    builder.add_node(
+        node_name, Assistant(general_agent, window=ConversationWindow(summarizer=llm))
+    )
+    builder.add_node(
         node_name + "_safe_tools",
+        create_tool_node_with_fallback(general_safe_tools, node_name),
+    )
+    builder.add_node(
         node_name + "_sensitive_tools",
-        node_name + "_rag_tools",
-        END,
-    ],
-)
-builder.add_edge(node_name + "_safe_tools", node_name)
-builder.add_edge(node_name + "_sensitive_tools", node_name)
-builder.add_edge(node_name + "_rag_tools", node_name)
-
-memory = MemorySaver()
-graph = builder.compile(
-    checkpointer=memory,
-    interrupt_before=[node_name + "_sensitive_tools" for node_name in routes],
-)
-
-graph_image = graph.get_graph().draw_ascii()
-
-with open("graph.txt", "w") as f:
-    f.write(graph_image)
+        create_tool_node_with_fallback(general_sensitive_tools, node_name),
+    )
+    builder.add_node(
+        node_name + "_rag_tools", create_tool_node_with_fallback(rag_tools, node_name)
+    )
+    builder.add_conditional_edges(
+        node_name,
+        route_tools,
+        [
+            node_name + "_safe_tools",
+            node_name + "_sensitive_tools",
+            node_name + "_rag_tools",
+            END,
+        ],
+    )
+    builder.add_edge(node_name + "_safe_tools", node_name)
+    builder.add_edge(node_name + "_sensitive_tools", node_name)
+    builder.add_edge(node_name + "_rag_tools", node_name)
+
+    return builder.compile(
+        checkpointer=checkpointer or SQLiteCheckpointSaver(),
+        interrupt_before=[node_name + "_sensitive_tools" for node_name in routes],
+    )
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_graph():
+    """The process-wide graph, built on first use."""
+    global _graph
+    with _graph_lock:
+        if _graph is None:
+            _graph = build_graph()
+        return _graph
+
+
+def __getattr__(name):
+    # Keeps ``from backend.agent.graph import graph`` working without
+    # building the graph at import time.
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def draw_graph(path="graph.txt", graph=None):
+    """Writes an ASCII drawing of the graph to ``path``."""
+    graph = graph or get_graph()
+    with open(path, "w") as f:
+        f.write(graph.get_graph().draw_ascii())
+
+
+if __name__ == "__main__":
+    draw_graph()
+    print("Wrote graph.txt")
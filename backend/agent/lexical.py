@@ -0,0 +1,151 @@
+"""BM25 keyword index stored beside the FAISS store.
+
+Exact names (restaurants, dishes, neighbourhoods) are where embeddings are
+weakest and keyword matching is strongest. ``update_faiss_store`` writes a
+``lexical.json`` inverted index next to ``index.faiss``; the retriever fuses
+its ranking with the vector results and, when a query is matched decisively,
+answers from it without embedding the query at all.
+"""
+
+import json
+import math
+import os
+import re
+from collections import Counter
+
+
+LEXICAL_FILE = "lexical.json"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are at be by can do does for from how i in is it me of on or "
+    "s t the there to what when where which who with you your".split()
+)
+
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 inverted index over chunk documents, keyed by docstore id."""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self.doc_len = []
+        self.postings = {}
+        self._docnos = {}
+
+    @classmethod
+    def build(cls, items, **kwargs):
+        """``items`` yields ``(docstore_id, text)`` pairs."""
+        index = cls(**kwargs)
+        for doc_id, text in items:
+            docno = len(index.ids)
+            terms = Counter(tokenize(text))
+            index.ids.append(doc_id)
+            index.doc_len.append(sum(terms.values()))
+            for term, tf in terms.items():
+                index.postings.setdefault(term, []).append((docno, tf))
+        index._docnos = {doc_id: docno for docno, doc_id in enumerate(index.ids)}
+        return index
+
+    @property
+    def avgdl(self):
+        return sum(self.doc_len) / len(self.doc_len) if self.doc_len else 0.0
+
+    def idf(self, term):
+        n = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.ids) - n + 0.5) / (n + 0.5))
+
+    def scores(self, terms):
+        scores = {}
+        avgdl = self.avgdl or 1.0
+        for term in set(terms):
+            idf = self.idf(term)
+            for docno, tf in self.postings.get(term, ()):
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_len[docno] / avgdl)
+                scores[docno] = scores.get(docno, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return scores
+
+    def search(self, query, k=30, ids=None):
+        """Top ``k`` ``(docstore_id, score)`` pairs, best first, among ``ids`` if given."""
+        scores = self.scores(tokenize(query))
+        if ids is not None:
+            scores = {d: s for d, s in scores.items() if self.ids[d] in ids}
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.ids[docno], score) for docno, score in best]
+
+    def confidence(self, query, hits):
+        """How decisively the top hit answers ``query`` lexically.
+
+        Returns ``(coverage, margin)``: the share of the query's IDF weight
+        whose terms occur in the top hit (terms unknown to the corpus count as
+        missing, at the highest IDF), and the top score's lead over the
+        runner-up relative to the top score.
+        """
+        terms = set(tokenize(query))
+        top = self._docnos.get(hits[0][0]) if hits else None
+        if top is None or not terms:
+            return 0.0, 0.0
+        top_terms = {
+            term for term in terms if any(d == top for d, _ in self.postings.get(term, ()))
+        }
+        unknown_idf = math.log(1 + (len(self.ids) + 0.5) / 0.5)
+        weights = {t: self.idf(t) if t in self.postings else unknown_idf for t in terms}
+        coverage = sum(weights[t] for t in top_terms) / sum(weights.values())
+        second = hits[1][1] if len(hits) > 1 else 0.0
+        margin = (hits[0][1] - second) / hits[0][1] if hits[0][1] > 0 else 0.0
+        return coverage, margin
+
+    def save(self, path):
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "ids": self.ids,
+            "doc_len": self.doc_len,
+            "postings": self.postings,
+        }
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(k1=data["k1"], b=data["b"])
+        index.ids = data["ids"]
+        index.doc_len = data["doc_len"]
+        index.postings = {
+            term: [tuple(p) for p in postings] for term, postings in data["postings"].items()
+        }
+        index._docnos = {doc_id: docno for docno, doc_id in enumerate(index.ids)}
+        return index
+
+
+def write_lexical_index(vectorstore, store_path):
+    """Builds the BM25 index over every chunk in ``vectorstore`` and saves it."""
+    ids = [i for _, i in sorted(vectorstore.index_to_docstore_id.items())]
+    index = BM25Index.build((i, vectorstore.docstore.search(i).page_content) for i in ids)
+    index.save(os.path.join(store_path, LEXICAL_FILE))
+    return index
+
+
+def load_lexical_index(store_path):
+    """The saved BM25 index for ``store_path``, or ``None`` if there is none."""
+    path = os.path.join(store_path, LEXICAL_FILE)
+    if not os.path.exists(path):
+        return None
+    return BM25Index.load(path)
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuses ranked id lists; returns ``(id, score)`` pairs, best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
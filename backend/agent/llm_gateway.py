@@ -0,0 +1,540 @@
+"""One gateway for every OpenAI request the agent makes.
+
+The chat models and embeddings (``graph.py``, ``retriever.py``) and the
+OpenAI client behind ``BatchEmbeddings`` (index builds) are built by
+``get_gateway()``, whose pooled ``httpx`` clients send each request through
+the same policies:
+
+* a process-wide ``RateLimiter`` (requests and estimated tokens per minute),
+  so concurrent sessions queue instead of setting off 429 storms;
+* retries of 408/409/429/5xx responses and connection errors, with
+  full-jitter exponential backoff that honours ``Retry-After``;
+* a ``CircuitBreaker`` that fails fast (``CircuitOpenError``) after repeated
+  5xx/connection failures and lets a single probe through once it cools down;
+* optional hedging: if no response headers arrive within ``hedge_after``
+  seconds, a second copy of the request is sent and the first good response
+  wins, which cuts tail latency at the cost of a few extra requests.
+
+The OpenAI clients are created with ``max_retries=0`` so retries are not
+multiplied. Settings come from the environment (``DINEBOT_LLM_RPM``,
+``DINEBOT_LLM_TPM``, ``DINEBOT_LLM_MAX_RETRIES``, ``DINEBOT_LLM_HEDGE_AFTER``)
+or from an ``LLMGateway`` passed to ``set_gateway``. Point ``OPENAI_BASE_URL``
+at ``backend.agent.stub_openai`` to run against a local stand-in.
+
+Importing this module does not import the OpenAI SDK.
+"""
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import httpx
+
+
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+def backoff_delay(attempt, base=0.5, cap=20.0):
+    """Full-jitter exponential backoff before retry ``attempt`` (from 0)."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def retry_after(response):
+    """Seconds the server asked us to wait, if it said."""
+    if response is None:
+        return None
+    for header, scale in (("retry-after-ms", 1000.0), ("retry-after", 1.0)):
+        value = response.headers.get(header)
+        try:
+            return float(value) / scale
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+class RateLimiter:
+    """Token buckets for requests-per-minute and tokens-per-minute limits.
+
+    ``acquire`` (or ``aacquire``) blocks until both buckets can cover the
+    request. A limit of ``None`` disables that bucket.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute or 0)
+        self._tokens = float(tokens_per_minute or 0)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(
+                self.requests_per_minute,
+                self._requests + elapsed * self.requests_per_minute / 60,
+            )
+        if self.tokens_per_minute:
+            self._tokens = min(
+                self.tokens_per_minute,
+                self._tokens + elapsed * self.tokens_per_minute / 60,
+            )
+
+    def _reserve(self, tokens):
+        """Takes from the buckets and returns 0, or returns how long to wait."""
+        with self._lock:
+            self._refill(time.monotonic())
+            wait = 0.0
+            if self.requests_per_minute and self._requests < 1:
+                wait = (1 - self._requests) * 60 / self.requests_per_minute
+            if self.tokens_per_minute and self._tokens < tokens:
+                wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+            if wait == 0.0:
+                if self.requests_per_minute:
+                    self._requests -= 1
+                if self.tokens_per_minute:
+                    self._tokens -= tokens
+            return wait
+
+    def _clamp(self, tokens):
+        if self.tokens_per_minute:
+            # A single oversized request can never fit; let it through on a full bucket.
+            tokens = min(tokens, self.tokens_per_minute)
+        return tokens
+
+    def acquire(self, tokens=0):
+        """Blocks until the request fits; returns the seconds spent waiting."""
+        tokens = self._clamp(tokens)
+        waited = 0.0
+        while True:
+            wait = self._reserve(tokens)
+            if wait == 0.0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def aacquire(self, tokens=0):
+        tokens = self._clamp(tokens)
+        waited = 0.0
+        while True:
+            wait = self._reserve(tokens)
+            if wait == 0.0:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def try_acquire(self, tokens=0):
+        """Takes capacity only if it is available right now."""
+        return self._reserve(self._clamp(tokens)) == 0.0
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised instead of sending while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures.
+
+    While open, requests fail immediately; after ``reset_seconds`` one probe
+    request is let through (half-open) and its outcome closes or re-opens
+    the circuit.
+    """
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_seconds:
+            return "open"
+        return "half-open"
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_seconds or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def release(self):
+        """Ends a probe that finished without an outcome (e.g. cancelled)."""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok):
+        """Records an outcome; returns True if this failure opened the circuit."""
+        with self._lock:
+            probing, self._probing = self._probing, False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return False
+            self.failures += 1
+            if probing or self.failures >= self.failure_threshold:
+                opened = self.opened_at is None or probing
+                self.opened_at = time.monotonic()
+                return opened
+            return False
+
+
+def request_tokens(request):
+    """Rough token count of a chat or embeddings request, for rate limiting."""
+    try:
+        body = json.loads(request.content or b"{}")
+    except ValueError:
+        return 0
+    if not isinstance(body, dict):
+        return 0
+    inputs = body.get("input")
+    if inputs is None:
+        inputs = [m.get("content") for m in body.get("messages", []) if isinstance(m, dict)]
+    elif isinstance(inputs, str) or inputs and isinstance(inputs[0], int):
+        inputs = [inputs]
+    texts, tokens = [], 0
+    for item in inputs:
+        if isinstance(item, str):
+            texts.append(item)
+        elif isinstance(item, list) and all(isinstance(t, int) for t in item):
+            tokens += len(item)  # already tokenized
+        elif item:
+            texts.append(json.dumps(item))
+    from backend.agent.embeddings import count_tokens
+
+    completion = body.get("max_completion_tokens") or body.get("max_tokens") or 0
+    return tokens + count_tokens(texts) + completion
+
+
+def _usable(response):
+    return response.status_code not in RETRYABLE_STATUS
+
+
+class LLMGateway:
+    """Pooled HTTP clients plus the rate limit, retry, circuit breaker and
+    hedging policies shared by every OpenAI client built from it."""
+
+    def __init__(
+        self,
+        requests_per_minute=None,
+        tokens_per_minute=None,
+        max_retries=4,
+        backoff=0.5,
+        max_backoff=20.0,
+        failure_threshold=5,
+        reset_seconds=30.0,
+        hedge_after=None,
+        max_connections=100,
+        max_keepalive_connections=20,
+        timeout=60.0,
+        connect_timeout=5.0,
+    ):
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_after = hedge_after
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.stats = {
+            "requests": 0,
+            "attempts": 0,
+            "retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "circuit_opened": 0,
+            "circuit_rejected": 0,
+            "rate_limited_seconds": 0.0,
+        }
+        self._stats_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._http_client = None
+        self._async_http_client = None
+        self._executor = None
+
+    def _count(self, key, value=1):
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def _tokens(self, request):
+        return request_tokens(request) if self.rate_limiter.tokens_per_minute else 0
+
+    def _retry_delay(self, attempt, response):
+        delay = backoff_delay(attempt, self.backoff, self.max_backoff)
+        return min(self.max_backoff, max(delay, retry_after(response) or 0.0))
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self._count("circuit_rejected")
+            raise CircuitOpenError("LLM circuit breaker is open; not sending the request")
+
+    def _outcome(self, response, error):
+        """Records an attempt; returns True if it should be retried."""
+        self._count("attempts")
+        failed = error is not None or response.status_code >= 500
+        if self.breaker.record(not failed):
+            self._count("circuit_opened")
+        return error is not None or not _usable(response)
+
+    def send(self, request, send):
+        """Sends ``request`` with ``send`` (a transport's ``handle_request``)."""
+        request.read()
+        tokens = self._tokens(request)
+        self._count("requests")
+        for attempt in range(self.max_retries + 1):
+            self._admit()
+            self._count("rate_limited_seconds", self.rate_limiter.acquire(tokens))
+            response, error = None, None
+            try:
+                response = self._hedged(request, send, tokens)
+            except httpx.TransportError as e:
+                error = e
+            except BaseException:
+                self.breaker.release()
+                raise
+            if not self._outcome(response, error) or attempt == self.max_retries:
+                if error is not None:
+                    raise error
+                return response
+            delay = self._retry_delay(attempt, response)
+            if response is not None:
+                response.close()
+            self._count("retries")
+            time.sleep(delay)
+
+    async def asend(self, request, send):
+        """``send`` for async transports (``handle_async_request``)."""
+        await request.aread()
+        tokens = self._tokens(request)
+        self._count("requests")
+        for attempt in range(self.max_retries + 1):
+            self._admit()
+            self._count("rate_limited_seconds", await self.rate_limiter.aacquire(tokens))
+            response, error = None, None
+            try:
+                response = await self._ahedged(request, send, tokens)
+            except httpx.TransportError as e:
+                error = e
+            except BaseException:
+                self.breaker.release()
+                raise
+            if not self._outcome(response, error) or attempt == self.max_retries:
+                if error is not None:
+                    raise error
+                return response
+            delay = self._retry_delay(attempt, response)
+            if response is not None:
+                await response.aclose()
+            self._count("retries")
+            await asyncio.sleep(delay)
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.limits.max_connections, thread_name_prefix="llm-hedge"
+                )
+            return self._executor
+
+    def _hedged(self, request, send, tokens):
+        if not self.hedge_after:
+            return send(request)
+        primary = self._pool().submit(send, request)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        # Hedges only use spare rate limit capacity; they never wait for it.
+        if done or not self.rate_limiter.try_acquire(tokens):
+            return primary.result()
+        self._count("hedges")
+        hedge = self._pool().submit(send, request)
+        futures = [primary, hedge]
+        chosen, pending = None, set(futures)
+        while pending and chosen is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if chosen is None and future.exception() is None and _usable(future.result()):
+                    chosen = future
+        chosen = chosen or primary
+        if chosen is hedge:
+            self._count("hedge_wins")
+        for future in futures:
+            if future is not chosen:
+                future.add_done_callback(_close_response)
+        return chosen.result()
+
+    async def _ahedged(self, request, send, tokens):
+        if not self.hedge_after:
+            return await send(request)
+        primary = asyncio.ensure_future(send(request))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+            if done or not self.rate_limiter.try_acquire(tokens):
+                return await primary
+            self._count("hedges")
+            hedge = asyncio.ensure_future(send(request))
+            tasks.append(hedge)
+            chosen, pending = None, set(tasks)
+            while pending and chosen is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if chosen is None and task.exception() is None and _usable(task.result()):
+                        chosen = task
+            chosen = chosen or primary
+            if chosen is hedge:
+                self._count("hedge_wins")
+            for task in tasks:
+                if task is not chosen and task.done() and task.exception() is None:
+                    await task.result().aclose()
+            return await chosen
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def http_client(self):
+        """Pooled ``httpx.Client`` sending through the gateway."""
+        with self._lock:
+            if self._http_client is None:
+                transport = GatewayTransport(self, httpx.HTTPTransport(limits=self.limits))
+                self._http_client = httpx.Client(transport=transport, timeout=self.timeout)
+            return self._http_client
+
+    def async_http_client(self):
+        """``httpx.AsyncClient`` sending through the gateway, with a connection
+        pool per event loop (see ``AsyncGatewayTransport``)."""
+        with self._lock:
+            if self._async_http_client is None:
+                transport = AsyncGatewayTransport(
+                    self, lambda: httpx.AsyncHTTPTransport(limits=self.limits)
+                )
+                self._async_http_client = httpx.AsyncClient(
+                    transport=transport, timeout=self.timeout
+                )
+            return self._async_http_client
+
+    def chat_model(self, **kwargs):
+        """``ChatOpenAI`` sending through the gateway."""
+        from langchain_openai import ChatOpenAI
+
+        kwargs.setdefault("max_retries", 0)
+        return ChatOpenAI(
+            http_client=self.http_client(),
+            http_async_client=self.async_http_client(),
+            **kwargs,
+        )
+
+    def embeddings(self, **kwargs):
+        """``OpenAIEmbeddings`` sending through the gateway."""
+        from langchain_openai import OpenAIEmbeddings
+
+        kwargs.setdefault("max_retries", 0)
+        return OpenAIEmbeddings(
+            http_client=self.http_client(),
+            http_async_client=self.async_http_client(),
+            **kwargs,
+        )
+
+    def openai_client(self, **kwargs):
+        """``openai.OpenAI`` sending through the gateway."""
+        import openai
+
+        kwargs.setdefault("max_retries", 0)
+        return openai.OpenAI(http_client=self.http_client(), **kwargs)
+
+
+def _close_response(future):
+    if future.exception() is None:
+        future.result().close()
+
+
+class GatewayTransport(httpx.BaseTransport):
+    def __init__(self, gateway, transport):
+        self.gateway = gateway
+        self.transport = transport
+
+    def handle_request(self, request):
+        return self.gateway.send(request, self.transport.handle_request)
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncGatewayTransport(httpx.AsyncBaseTransport):
+    """Async transport with one ``new_transport()`` pool per event loop.
+
+    Pooled connections belong to the loop that opened them, so a client
+    shared across loops (e.g. successive ``asyncio.run`` calls) would reuse
+    connections of a closed loop. Pools of closed loops are dropped.
+    """
+
+    def __init__(self, gateway, new_transport):
+        self.gateway = gateway
+        self.new_transport = new_transport
+        self._transports = {}
+        self._lock = threading.Lock()
+
+    def _transport(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                for other in [other for other in self._transports if other.is_closed()]:
+                    del self._transports[other]
+                transport = self._transports[loop] = self.new_transport()
+            return transport
+
+    async def handle_async_request(self, request):
+        return await self.gateway.asend(request, self._transport().handle_async_request)
+
+    async def aclose(self):
+        with self._lock:
+            transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+def _env_number(name, cast=float):
+    value = os.environ.get(name)
+    return cast(value) if value else None
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """The process-wide gateway, configured from the environment on first use."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            max_retries = _env_number("DINEBOT_LLM_MAX_RETRIES", int)
+            _gateway = LLMGateway(
+                requests_per_minute=_env_number("DINEBOT_LLM_RPM"),
+                tokens_per_minute=_env_number("DINEBOT_LLM_TPM"),
+                max_retries=4 if max_retries is None else max_retries,
+                hedge_after=_env_number("DINEBOT_LLM_HEDGE_AFTER"),
+            )
+        return _gateway
+
+
+def set_gateway(gateway):
+    """Replaces the process-wide gateway (for clients built afterwards)."""
+    global _gateway
+    with _gateway_lock:
+        _gateway = gateway
@@ -0,0 +1,177 @@
+"""Append-optimized, persistent message list for the per-persona conversation state.
+
+``add_messages_to_dict`` used to rebuild every persona's list with langgraph's
+``add_messages`` on each state update (id map, copies, conversions), so each
+step cost O(history), and it changed the left-hand dict in place. A
+``MessageLog`` is an immutable sequence that ``extend`` turns into a new log:
+
+* appends are amortized O(1): the new log shares the old one's storage
+  list and just sees one more item (a log only appends in place while it
+  is the newest view of that storage, otherwise it copies first);
+* a message with an existing id replaces the old one through a small
+  per-version override map, without copying the list;
+* lookups by id use an id -> position map shared in the same way.
+
+Older versions stay valid and unchanged, e.g. the state yielded by
+``graph.stream(stream_mode="values")`` or held by a checkpoint. Removals
+(``RemoveMessage``) rebuild the log once, which is O(history) but rare (see
+``ConversationWindow``). Logs serialize as a plain message list.
+"""
+
+import uuid
+from collections.abc import Sequence
+
+from langchain_core.messages import RemoveMessage, convert_to_messages, message_chunk_to_message
+
+
+# Replacements are folded into a fresh storage list past this many overrides.
+MAX_OVERRIDES = 64
+
+_MISSING = object()
+
+
+class MessageLog(Sequence):
+    """Immutable sequence of messages with O(1) amortized append and id lookup."""
+
+    __slots__ = ("_items", "_length", "_index", "_overrides")
+
+    def __init__(self, messages=()):
+        self._items = []
+        self._index = {}
+        self._overrides = {}
+        for message in _coerce(messages):
+            if message.id in self._index:
+                self._overrides[self._index[message.id]] = message
+            else:
+                self._index[message.id] = len(self._items)
+                self._items.append(message)
+        self._length = len(self._items)
+        if self._overrides:
+            self._items = list(self)
+            self._overrides = {}
+
+    @classmethod
+    def _view(cls, items, length, index, overrides):
+        log = cls.__new__(cls)
+        log._items, log._length, log._index, log._overrides = items, length, index, overrides
+        return log
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._length))]
+        if i < 0:
+            i += self._length
+        if not 0 <= i < self._length:
+            raise IndexError("MessageLog index out of range")
+        message = self._overrides.get(i, _MISSING)
+        return self._items[i] if message is _MISSING else message
+
+    def __iter__(self):
+        overrides = self._overrides
+        for i in range(self._length):
+            yield overrides[i] if i in overrides else self._items[i]
+
+    def __eq__(self, other):
+        if isinstance(other, (MessageLog, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __repr__(self):
+        return f"MessageLog({list(self)!r})"
+
+    def _asdict(self):
+        # The checkpoint serializer stores namedtuple-likes as their fields and
+        # rebuilds them with ``MessageLog(**fields)``.
+        return {"messages": list(self)}
+
+    def position(self, message_id):
+        """Position of the message with ``message_id``, or ``None``."""
+        i = self._index.get(message_id)
+        return i if i is not None and i < self._length else None
+
+    def get(self, message_id, default=None):
+        i = self.position(message_id)
+        return default if i is None else self[i]
+
+    def extend(self, messages):
+        """New log with ``messages`` merged in, as ``add_messages`` would.
+
+        Messages with a known id replace the old one in place, others are
+        appended, and ``RemoveMessage`` deletes by id.
+        """
+        messages = _coerce(messages)
+        if any(isinstance(m, RemoveMessage) for m in messages):
+            return self._rebuild(messages)
+        items, index, overrides = self._items, self._index, self._overrides
+        length = self._length
+        owned = len(items) == length
+        copied_overrides = False
+        for message in messages:
+            i = index.get(message.id)
+            if i is not None and i < length:
+                if not copied_overrides:
+                    overrides = dict(overrides)
+                    copied_overrides = True
+                overrides[i] = message
+                continue
+            if not owned or i is not None:
+                # Someone else appended to this storage (or left a stale id in
+                # the shared map): continue on a private copy.
+                items = items[:length]
+                index = {k: v for k, v in index.items() if v < length}
+                owned = True
+            index[message.id] = length
+            items.append(message)
+            length += 1
+        if len(overrides) > MAX_OVERRIDES:
+            return MessageLog(self._view(items, length, index, overrides))
+        return self._view(items, length, index, overrides)
+
+    def _rebuild(self, messages):
+        merged = list(self)
+        positions = {m.id: i for i, m in enumerate(merged)}
+        removed = set()
+        for message in messages:
+            i = positions.get(message.id)
+            if isinstance(message, RemoveMessage):
+                if i is None:
+                    raise ValueError(
+                        "Attempting to delete a message with an ID that doesn't exist "
+                        f"('{message.id}')"
+                    )
+                removed.add(message.id)
+            elif i is not None:
+                merged[i] = message
+            else:
+                positions[message.id] = len(merged)
+                merged.append(message)
+        return MessageLog([m for m in merged if m.id not in removed])
+
+
+def _coerce(messages):
+    if isinstance(messages, MessageLog):
+        return list(messages)
+    if not isinstance(messages, (list, tuple)) or (
+        isinstance(messages, tuple) and len(messages) == 2 and isinstance(messages[0], str)
+    ):
+        messages = [messages]
+    messages = [message_chunk_to_message(m) for m in convert_to_messages(messages)]
+    for message in messages:
+        if message.id is None:
+            message.id = str(uuid.uuid4())
+    return messages
+
+
+def as_message_log(messages):
+    if isinstance(messages, MessageLog):
+        return messages
+    return MessageLog(messages or [])
@@ -0,0 +1,223 @@
+"""Read-only, memory-mapped view of a saved FAISS store.
+
+``FAISS.load_local`` reads ``index.faiss`` and unpickles ``index.pkl`` into
+each process's heap. ``export_mmap_store`` writes the same store in a layout
+that can be mapped instead:
+
+- ``docstore.bin``: the chunk documents as JSON records behind an offset table.
+- ``vectors.f32``: raw float32 vectors, for flat indexes, searched with
+  ``faiss.knn`` straight from the mapping.
+- ``index.faiss``: a copy of the index, for other index types.
+- ``mmap_meta.json``: dimension, count and the position -> docstore id list.
+
+Each export goes to a new ``mmap_<version>`` directory, and ``mmap_current.json``
+is then switched to it in one atomic rename, so readers always open a
+complete, matching set of files, and keep opening the previous one until a
+rebuild has finished. Only the builder exports; readers of a store that was
+never exported fall back to ``FAISS.load_local``.
+
+IVF indexes are opened with FAISS' own ``IO_FLAG_MMAP`` so their inverted
+lists stay on the page cache. All workers on a host then share one copy of
+the pages, and startup no longer deserializes the whole store.
+"""
+
+import json
+import mmap
+import os
+import shutil
+import time
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores.faiss import FAISS
+
+
+DOCSTORE_FILE = "docstore.bin"
+VECTORS_FILE = "vectors.f32"
+INDEX_FILE = "index.faiss"
+META_FILE = "mmap_meta.json"
+CURRENT_FILE = "mmap_current.json"
+VERSION_PREFIX = "mmap_"
+# Exports kept besides the current one, for readers still opening them.
+KEEP_PREVIOUS = 1
+
+
+def _replace(path, write):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _index_version(store_path):
+    stat = os.stat(os.path.join(store_path, "index.faiss"))
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def current_export(store_path):
+    """The pointer record of the current export, or ``None``."""
+    try:
+        with open(os.path.join(store_path, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _remove_old_exports(store_path, current):
+    exports = sorted(
+        name
+        for name in os.listdir(store_path)
+        if name.startswith(VERSION_PREFIX)
+        and name != current
+        and os.path.isdir(os.path.join(store_path, name))
+    )
+    for name in exports[: max(0, len(exports) - KEEP_PREVIOUS)]:
+        shutil.rmtree(os.path.join(store_path, name), ignore_errors=True)
+
+
+def export_mmap_store(vectorstore, store_path):
+    """Writes the mmap layout for ``vectorstore``, saved at ``store_path``.
+
+    Called by the builder right after ``save_local``.
+    """
+    ids = [i for _, i in sorted(vectorstore.index_to_docstore_id.items())]
+    records = []
+    for i in ids:
+        doc = vectorstore.docstore.search(i)
+        records.append(
+            json.dumps(
+                {"page_content": doc.page_content, "metadata": doc.metadata}
+            ).encode("utf-8")
+        )
+    offsets = np.zeros(len(records) + 1, dtype=np.uint64)
+    offsets[1:] = np.cumsum([len(r) for r in records], dtype=np.uint64)
+
+    def write_docstore(f):
+        f.write(np.uint64(len(records)).tobytes())
+        f.write(offsets.tobytes())
+        for record in records:
+            f.write(record)
+
+    name = f"{VERSION_PREFIX}{time.time_ns():020d}_{os.getpid()}"
+    export_path = os.path.join(store_path, name)
+    os.makedirs(export_path)
+    with open(os.path.join(export_path, DOCSTORE_FILE), "wb") as f:
+        write_docstore(f)
+    index = vectorstore.index
+    flat = isinstance(index, faiss.IndexFlatL2)
+    if flat:
+        vectors = index.reconstruct_n(0, index.ntotal).astype(np.float32)
+        with open(os.path.join(export_path, VECTORS_FILE), "wb") as f:
+            f.write(vectors.tobytes())
+    else:
+        faiss.write_index(index, os.path.join(export_path, INDEX_FILE))
+    meta = {"d": index.d, "ntotal": index.ntotal, "flat": flat, "ids": ids}
+    with open(os.path.join(export_path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    current = {"export": name, "index": _index_version(store_path)}
+    _replace(
+        os.path.join(store_path, CURRENT_FILE),
+        lambda f: f.write(json.dumps(current).encode()),
+    )
+    _remove_old_exports(store_path, name)
+
+
+def _is_current(store_path, current):
+    return current is not None and current["index"] == _index_version(store_path)
+
+
+def mmap_store_is_current(store_path):
+    """Whether the current export was made from the saved ``index.faiss``."""
+    return _is_current(store_path, current_export(store_path))
+
+
+class MmapDocstore(Docstore):
+    """Docstore reading JSON records from a shared read-only mapping."""
+
+    def __init__(self, path, ids):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        count = int(np.frombuffer(self._mmap, dtype=np.uint64, count=1)[0])
+        self._offsets = np.frombuffer(self._mmap, dtype=np.uint64, count=count + 1, offset=8)
+        self._data_start = 8 * (count + 2)
+        self._positions = {i: position for position, i in enumerate(ids)}
+
+    def search(self, search):
+        position = self._positions.get(search)
+        if position is None:
+            return f"ID {search} not found."
+        start = self._data_start + int(self._offsets[position])
+        end = self._data_start + int(self._offsets[position + 1])
+        record = json.loads(self._mmap[start:end])
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+
+class MmapFlatIndex:
+    """Exact L2 search over a memory-mapped float32 vector file.
+
+    Implements the parts of the ``faiss.Index`` interface the langchain
+    ``FAISS`` store uses for searching.
+    """
+
+    def __init__(self, path, d):
+        self.d = d
+        self.metric_type = faiss.METRIC_L2
+        self._vectors = np.memmap(path, dtype=np.float32, mode="r").reshape(-1, d)
+        self.ntotal = len(self._vectors)
+
+    def search(self, x, k):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        if self.ntotal == 0:
+            return (
+                np.full((len(x), k), np.inf, dtype=np.float32),
+                np.full((len(x), k), -1, dtype=np.int64),
+            )
+        distances, labels = faiss.knn(x, self._vectors, min(k, self.ntotal))
+        if k > self.ntotal:
+            pad = k - self.ntotal
+            distances = np.pad(distances, ((0, 0), (0, pad)), constant_values=np.inf)
+            labels = np.pad(labels, ((0, 0), (0, pad)), constant_values=-1)
+        return distances, labels
+
+    def reconstruct(self, key):
+        return np.array(self._vectors[key])
+
+    def reconstruct_batch(self, keys):
+        return np.array(self._vectors[keys])
+
+
+def load_mmap_store(store_path, embeddings):
+    """Opens ``store_path`` read-only through memory maps.
+
+    Serves the export named by ``CURRENT_FILE`` even while a rebuild is
+    rewriting ``index.faiss``: the builder switches the pointer only once the
+    new export is complete. Stores that were never exported are loaded into
+    memory with ``FAISS.load_local``.
+    """
+    current = current_export(store_path)
+    if current is None:
+        print(f"No mmap export in {store_path}; loading it into memory")
+        return FAISS.load_local(store_path, embeddings, allow_dangerous_deserialization=True)
+    export_path = os.path.join(store_path, current["export"])
+    with open(os.path.join(export_path, META_FILE), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta["flat"]:
+        index = MmapFlatIndex(os.path.join(export_path, VECTORS_FILE), meta["d"])
+    else:
+        index_path = os.path.join(export_path, INDEX_FILE)
+        try:
+            index = faiss.read_index(
+                index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+            )
+        except RuntimeError:
+            # Index types without mmap support (e.g. HNSW) are read normally.
+            index = faiss.read_index(index_path)
+    docstore = MmapDocstore(os.path.join(export_path, DOCSTORE_FILE), meta["ids"])
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=dict(enumerate(meta["ids"])),
+    )
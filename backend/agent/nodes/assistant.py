@@ -1,33 +1,100 @@
+import asyncio
+import time
+
 from langchain_core.runnables import Runnable, RunnableConfig
+from langgraph.utils.runnable import RunnableCallable
+from backend.agent.conversation import ConversationWindow
+from backend.agent.llm_gateway import backoff_delay
 from backend.agent.state import State
 
 
-class Assistant:
-    def __init__(self, runnable: Runnable, persona: str = None):
+MAX_EMPTY_RETRIES = 3
+# Base of the jittered backoff before re-prompting after an empty response.
+# Transport failures (429s, 5xx, timeouts) are retried by the LLM gateway.
+EMPTY_RETRY_BACKOFF = 0.25
+
+
+def _is_empty(result):
+    return not result.tool_calls and (
+        not result.content
+        or isinstance(result.content, list)
+        and not result.content[0].get("text")
+    )
+
+
+class Assistant(RunnableCallable):
+    """Graph node that calls the persona's LLM ``runnable`` on its messages.
+
+    Runs ``runnable.invoke`` under ``graph.invoke``/``graph.stream`` and
+    ``runnable.ainvoke`` under ``graph.ainvoke``/``graph.astream``, so async
+    runs wait on the LLM without holding a thread.
+
+    With a ``window`` (``ConversationWindow``), older messages are folded
+    into the persona's rolling summary and removed from the state, so the
+    prompt stays bounded however long the conversation gets.
+    """
+
+    def __init__(self, runnable: Runnable, persona: str = None, window: ConversationWindow = None):
+        super().__init__(self._func, self._afunc, name="Assistant", trace=False)
         self.runnable = runnable
         self.persona = persona
+        self.window = window
+
+    def _context(self, state: State):
+        current_persona = self.persona or state["current_persona"]
+        messages = state["messages"][current_persona]
+        summary = (state.get("summary") or {}).get(current_persona)
+        return current_persona, messages, summary
 
-    def __call__(self, state: State, config: RunnableConfig):
+    def _input(self, state: State, messages, summary):
+        return {**state, "messages": ConversationWindow.with_summary(messages, summary)}
+
+    def _retry(self, messages, retried: int):
+        # If the LLM happens to return an empty response, we will re-prompt it
+        # for an actual response.
+        if retried >= MAX_EMPTY_RETRIES:
+            print(f"Retried {MAX_EMPTY_RETRIES} times for empty response")
+            return None
+        return messages + [("user", "Respond with a real output.")]
+
+    def _update(self, current_persona, result, summary, removals):
+        update = {"messages": {current_persona: removals + [result]}}
+        if removals:
+            update["summary"] = {current_persona: summary}
+        return update
+
+    def _func(self, state: State, config: RunnableConfig):
+        current_persona, messages, summary = self._context(state)
+        removals = []
+        if self.window is not None:
+            messages, summary, removals = self.window.compact(messages, summary, config)
         retried = 0
         while True:
-            current_persona = self.persona or state["current_persona"]
-            _state = {**state, "messages": state["messages"][current_persona]}
-            result = self.runnable.invoke(_state)
-            # If the LLM happens to return an empty response, we will re-prompt it
-            # for an actual response.
-            if not result.tool_calls and (
-                not result.content
-                or isinstance(result.content, list)
-                and not result.content[0].get("text")
-            ):
-                retried += 1
-                if retried >= 3:
-                    print("Retried 3 times for empty response")
-                    break
-
-                state["messages"][current_persona] = state["messages"][
-                    current_persona
-                ] + [("user", "Respond with a real output.")]
-            else:
+            # The config carries the graph's callbacks, which stream tokens
+            # for stream_mode="messages".
+            result = self.runnable.invoke(self._input(state, messages, summary), config)
+            if not _is_empty(result):
+                break
+            retried += 1
+            messages = self._retry(messages, retried)
+            if messages is None:
+                break
+            time.sleep(backoff_delay(retried - 1, EMPTY_RETRY_BACKOFF))
+        return self._update(current_persona, result, summary, removals)
+
+    async def _afunc(self, state: State, config: RunnableConfig):
+        current_persona, messages, summary = self._context(state)
+        removals = []
+        if self.window is not None:
+            messages, summary, removals = await self.window.acompact(messages, summary, config)
+        retried = 0
+        while True:
+            result = await self.runnable.ainvoke(self._input(state, messages, summary), config)
+            if not _is_empty(result):
+                break
+            retried += 1
+            messages = self._retry(messages, retried)
+            if messages is None:
                 break
-        return {"messages": {current_persona: result}}
+            await asyncio.sleep(backoff_delay(retried - 1, EMPTY_RETRY_BACKOFF))
+        return self._update(current_persona, result, summary, removals)
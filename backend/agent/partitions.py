@@ -0,0 +1,215 @@
+"""Metadata partitions of the FAISS store and query routing.
+
+``update_faiss_store`` writes ``partitions.json`` beside the index: every
+chunk is assigned to a ``file:<filename>`` partition, plus one
+``restaurant:<name>`` / ``neighborhood:<name>`` partition per restaurant or
+neighbourhood it mentions. Names come from the corpus itself: restaurant
+headings (the line above ``Location:``), the ``restaurant_name`` column of
+markdown tables and ``Located in ...`` phrases.
+
+``route`` maps a query to the partitions it is scoped to; the retriever
+searches the global index restricted to just those chunks
+(``partition_search``), and the whole index for unscoped queries.
+"""
+
+import json
+import os
+import re
+
+import numpy as np
+
+from backend.agent.lexical import tokenize
+
+
+PARTITIONS_FILE = "partitions.json"
+ENTITY_KINDS = ("restaurant", "neighborhood")
+
+_RESTAURANT_HEADING = re.compile(r"^(?:#+[ \t]*)?([^\n:|#]+?)[ \t]*\nLocation:", re.M)
+_NEIGHBORHOOD = re.compile(r"\bLocated in (?:the )?([A-Z][\w']*(?: [A-Z][\w']*)*)")
+
+
+def _table_column(lines, column):
+    """Values of ``column`` in the markdown table rows of ``lines``."""
+    values = []
+    position = None
+    for line in lines:
+        if not line.startswith("|"):
+            continue
+        cells = [cell.strip() for cell in line.strip().strip("|").split("|")]
+        if column in cells:
+            position = cells.index(column)
+        elif position is not None and position < len(cells) and not set(cells[0]) <= set("-:"):
+            values.append(cells[position])
+    return values
+
+
+def extract_vocabulary(texts):
+    """Restaurant and neighbourhood names mentioned across ``texts``."""
+    vocabulary = {kind: set() for kind in ENTITY_KINDS}
+    for text in texts:
+        vocabulary["restaurant"].update(m.strip() for m in _RESTAURANT_HEADING.findall(text))
+        vocabulary["restaurant"].update(_table_column(text.splitlines(), "restaurant_name"))
+        vocabulary["neighborhood"].update(_NEIGHBORHOOD.findall(text))
+    return {
+        kind: sorted(name for name in names if tokenize(name))
+        for kind, names in vocabulary.items()
+    }
+
+
+def phrase_index(vocabulary):
+    """Maps each vocabulary name's token tuple to its ``kind:name`` keys."""
+    index = {}
+    for kind in ENTITY_KINDS:
+        for name in vocabulary.get(kind, ()):
+            index.setdefault(tuple(tokenize(name)), []).append(f"{kind}:{name}")
+    return index
+
+
+def mentions(text, vocabulary, index=None):
+    """``kind:name`` keys of the vocabulary entries that occur in ``text``.
+
+    Looks up every token n-gram of ``text`` up to the longest name, so the
+    cost grows with the text rather than the vocabulary.
+    """
+    index = index if index is not None else phrase_index(vocabulary)
+    longest = max(map(len, index), default=0)
+    tokens = tokenize(text)
+    found = {}
+    for start in range(len(tokens)):
+        for length in range(1, min(longest, len(tokens) - start) + 1):
+            for key in index.get(tuple(tokens[start : start + length]), ()):
+                found[key] = True
+    return list(found)
+
+
+def build_partitions(vectorstore):
+    """Partition map ``{"vocabulary": ..., "partitions": {key: [docstore ids]}}``."""
+    ids = [i for _, i in sorted(vectorstore.index_to_docstore_id.items())]
+    docs = [vectorstore.docstore.search(i) for i in ids]
+    vocabulary = extract_vocabulary(doc.page_content for doc in docs)
+    index = phrase_index(vocabulary)
+    partitions = {}
+    for i, doc in zip(ids, docs):
+        keys = mentions(doc.page_content, vocabulary, index)
+        if "filename" in doc.metadata:
+            keys.append(f"file:{doc.metadata['filename']}")
+        for key in keys:
+            partitions.setdefault(key, []).append(i)
+    return {"vocabulary": vocabulary, "partitions": partitions}
+
+
+def write_partitions(vectorstore, store_path):
+    partitions = build_partitions(vectorstore)
+    path = os.path.join(store_path, PARTITIONS_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(partitions, f)
+    os.replace(path + ".tmp", path)
+    return partitions
+
+
+def load_partitions(store_path):
+    """The saved partition map for ``store_path``, or ``None`` if there is none."""
+    path = os.path.join(store_path, PARTITIONS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        partition_map = json.load(f)
+    partition_map["aliases"] = _aliases(partition_map["vocabulary"])
+    partition_map["phrases"] = phrase_index(partition_map["vocabulary"])
+    return partition_map
+
+
+def _aliases(vocabulary):
+    """Short forms for names: a distinctive first word, e.g. "Magnolia's".
+
+    A first word only counts if no other name contains it and it is not a
+    short, common word ("hot", "the").
+    """
+    names = [(kind, name) for kind in ENTITY_KINDS for name in vocabulary.get(kind, ())]
+    counts = {}
+    for _, name in names:
+        for token in set(tokenize(name)):
+            counts[token] = counts.get(token, 0) + 1
+    aliases = {}
+    for kind, name in names:
+        tokens = tokenize(name)
+        if len(tokens) > 1 and len(tokens[0]) >= 5 and counts[tokens[0]] == 1:
+            aliases[tokens[0]] = f"{kind}:{name}"
+    return aliases
+
+
+def route(query, partition_map):
+    """Partition keys ``query`` is scoped to; empty for an unscoped query."""
+    if not partition_map:
+        return []
+    vocabulary = partition_map["vocabulary"]
+    keys = mentions(query, vocabulary, partition_map.get("phrases"))
+    aliases = partition_map.get("aliases") or _aliases(vocabulary)
+    for token in tokenize(query):
+        if token in aliases and aliases[token] not in keys:
+            keys.append(aliases[token])
+    return [key for key in keys if key in partition_map["partitions"]]
+
+
+def _search_parameters(faiss, index, selector):
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def restricted_search(index, embedding, positions, k):
+    """``index.search`` for one query, limited to the vectors at ``positions``.
+
+    Searches the shared index with an id selector. Where that is not
+    supported (PQ, memory-mapped vectors) or finds fewer than ``k`` (IVF
+    cells or HNSW neighbours the query did not reach), it falls back to an
+    exact search over just those vectors, decoded by the index per query.
+    """
+    import faiss
+
+    x = np.asarray([embedding], dtype=np.float32)
+    k = min(k, len(positions))
+    if isinstance(index, faiss.Index):
+        selector = faiss.IDSelectorBatch(positions)
+        try:
+            distances, labels = index.search(
+                x, k, params=_search_parameters(faiss, index, selector)
+            )
+            if (labels[0] >= 0).all():
+                return distances, labels
+        except RuntimeError:
+            pass
+    vectors = np.ascontiguousarray(index.reconstruct_batch(positions), dtype=np.float32)
+    distances, labels = faiss.knn(x, vectors, k)
+    return distances, positions[labels]
+
+
+def partition_search(vectorstore, embedding, positions, k, fetch_k, lambda_mult):
+    """MMR search of ``vectorstore`` restricted to the index ``positions``.
+
+    Works like ``FAISS.max_marginal_relevance_search_with_score_by_vector``
+    on the shared index, so partitions cost no extra index memory and keep
+    the store's memory mapping and quantization.
+    """
+    from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+    if not len(positions):
+        return []
+    distances, labels = restricted_search(vectorstore.index, embedding, positions, fetch_k)
+    candidates = [(float(d), int(p)) for d, p in zip(distances[0], labels[0]) if p >= 0]
+    selected = maximal_marginal_relevance(
+        np.array([embedding], dtype=np.float32),
+        [vectorstore.index.reconstruct(p) for _, p in candidates],
+        k=min(k, len(candidates)),
+        lambda_mult=lambda_mult,
+    )
+    return [
+        (
+            vectorstore.docstore.search(vectorstore.index_to_docstore_id[candidates[i][1]]),
+            candidates[i][0],
+        )
+        for i in selected
+    ]
@@ -1,52 +1,286 @@
 import os
+import json
+import hashlib
 import faiss
 from langchain_community.vectorstores.faiss import FAISS
 from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from langchain.embeddings import OpenAIEmbeddings
 from uuid import uuid4
 from tqdm import tqdm
 import shutil
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from backend.agent.embeddings import BatchEmbeddings
+from backend.agent.cache import CachedEmbeddings
+from backend.agent.ann import (
+    SEARCH_OPTIONS,
+    TrainingSample,
+    build_index,
+    set_search_params,
+    supports_removal,
+    without_vectors,
+)
+from backend.agent.mmap_store import (
+    export_mmap_store,
+    load_mmap_store,
+    mmap_store_is_current,
+)
+from backend.agent.lexical import LEXICAL_FILE, write_lexical_index
+from backend.agent.partitions import PARTITIONS_FILE, write_partitions
 
 
 token = os.environ.get("OPENAI_API_KEY")
 
 
-def populate_vector_db(directory):
-    print("Populating Vector DB...")
-    documents = []
+MANIFEST_FILE = "manifest.json"
+SEARCH_PARAMS_FILE = "search_params.json"
+
+
+def _hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_manifest(store_path):
+    """Returns the content-hash manifest stored alongside a FAISS store.
+
+    The manifest records the hash and chunk ids of every ingested file and the
+    docstore id of every embedded chunk, so rebuilds can skip unchanged content.
+    """
+    manifest_path = os.path.join(store_path, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"files": {}, "chunks": {}}
+
+
+def save_manifest(store_path, manifest):
+    os.makedirs(store_path, exist_ok=True)
+    manifest_path = os.path.join(store_path, MANIFEST_FILE)
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def load_search_params(store_path):
+    """``nprobe``/``ef_search`` the store was last built with, if any."""
+    try:
+        with open(os.path.join(store_path, SEARCH_PARAMS_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_search_params(store_path, params):
+    if params == load_search_params(store_path):
+        return
+    path = os.path.join(store_path, SEARCH_PARAMS_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(params, f, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def default_embeddings():
+    """Batch OpenAI embeddings behind the shared on-disk embedding cache."""
+    return CachedEmbeddings(BatchEmbeddings(api_key=token))
+
+
+def _read_chunks(output_path, chunk_ids):
+    chunks = []
+    for chunk_id in chunk_ids:
+        chunk_path = os.path.join(output_path, f"{chunk_id}.txt")
+        if not os.path.exists(chunk_path):
+            return None
+        with open(chunk_path, "r", encoding="utf-8") as f:
+            chunks.append(f.read())
+    return chunks
+
+
+def populate_vector_db(directory, manifest=None, workers=1):
+    """Splits every file in ``directory`` into chunk documents.
+
+    When a manifest (see ``load_manifest``) is passed, files whose content hash
+    is unchanged keep their chunk ids and chunk files on disk; only new or
+    modified files are re-split. The manifest's ``files`` entry is updated in
+    place so it can be handed on to ``create_faiss_store``.
+    """
+    return list(iter_documents(directory, manifest=manifest, workers=workers))
+
+
+def _chunk_dir(directory, filename):
+    return os.path.join(directory, "".join(filename.split(".")[:-1]))
+
+
+def _split_file(directory, filename, previous=None):
+    with open(os.path.join(directory, filename), "r", encoding="utf-8") as f:
+        content = f.read()
+    file_hash = _hash_text(content)
+    if previous and previous["hash"] == file_hash:
+        chunks = _read_chunks(_chunk_dir(directory, filename), previous["chunk_ids"])
+        if chunks is not None:
+            return filename, file_hash, chunks, previous["chunk_ids"]
     splitter = RecursiveCharacterTextSplitter(
         separators=["##"], chunk_size=1000, chunk_overlap=200
     )
-    chunk_id = 0
-    filenames = [
+    return filename, file_hash, splitter.split_text(content), None
+
+
+def _write_chunks(output_path, chunk_ids, chunks):
+    if os.path.exists(output_path):
+        shutil.rmtree(output_path)
+    for i, chunk in zip(chunk_ids, chunks):
+        os.makedirs(output_path, exist_ok=True)
+        with open(os.path.join(output_path, f"{i}.txt"), "w", encoding="utf-8") as f:
+            f.write(chunk)
+
+
+def _ordered_map(executor, fn, args_list, window):
+    """Like ``executor.map`` but keeps at most ``window`` tasks in flight."""
+    pending = deque()
+    for args in args_list:
+        pending.append(executor.submit(fn, *args))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def iter_documents(directory, manifest=None, workers=1):
+    """Generator version of ``populate_vector_db``.
+
+    Files are read and split one at a time, so only a single file's chunks are
+    held in memory. The manifest is updated once the generator is exhausted,
+    and the chunk directories of files no longer in ``directory`` are removed.
+
+    With ``workers > 1`` reading, splitting and writing chunk files run on a
+    process pool (a bounded number of files ahead of the consumer). Chunk ids
+    are still assigned here, in sorted filename order, so they stay
+    deterministic and globally unique.
+    """
+    print("Populating Vector DB...")
+    previous_files = manifest.get("files", {}) if manifest is not None else {}
+    chunk_id = 1 + max(
+        (i for entry in previous_files.values() for i in entry["chunk_ids"]),
+        default=-1,
+    )
+    files = {}
+    filenames = sorted(
         f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))
-    ]
-    for filename in tqdm(filenames, desc="Processing file: "):
-        with open(os.path.join(directory, filename), "r", encoding="utf-8") as f:
-            content = f.read()
-            chunks = splitter.split_text(content)
-            file = "".join(filename.split(".")[:-1])
-            output_path = os.path.join(directory, file)
-            if os.path.exists(output_path):
-                shutil.rmtree(output_path)
-            for chunk in chunks:
-                os.makedirs(output_path, exist_ok=True)
-                open(output_path + f"/{chunk_id}.txt", "w").write(chunk)
-                documents.append(
-                    Document(
-                        page_content=chunk,
-                        metadata={"filename": filename, "chunk_id": chunk_id},
-                    )
+    )
+    tasks = [(directory, f, previous_files.get(f)) for f in filenames]
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    writes = []
+    try:
+        if executor:
+            results = _ordered_map(executor, _split_file, tasks, window=workers * 4)
+        else:
+            results = (_split_file(*task) for task in tasks)
+        for filename, file_hash, chunks, chunk_ids in tqdm(
+            results, total=len(tasks), desc="Processing file: "
+        ):
+            if chunk_ids is None:
+                chunk_ids = list(range(chunk_id, chunk_id + len(chunks)))
+                chunk_id += len(chunks)
+                args = (_chunk_dir(directory, filename), chunk_ids, chunks)
+                if executor:
+                    writes.append(executor.submit(_write_chunks, *args))
+                else:
+                    _write_chunks(*args)
+            files[filename] = {"hash": file_hash, "chunk_ids": chunk_ids}
+            for i, chunk in zip(chunk_ids, chunks):
+                yield Document(
+                    page_content=chunk,
+                    metadata={"filename": filename, "chunk_id": i},
                 )
-                chunk_id += 1
-    return documents
+        for write in writes:
+            write.result()
+    finally:
+        if executor:
+            executor.shutdown()
+    if manifest is not None:
+        _remove_stale_chunks(directory, previous_files, files)
+        manifest["files"] = files
+
+
+def _remove_stale_chunks(directory, previous_files, files):
+    """Deletes the chunk directories of files that left the corpus."""
+    current = {_chunk_dir(directory, f) for f in files}
+    for filename in previous_files:
+        chunk_dir = _chunk_dir(directory, filename)
+        if filename not in files and chunk_dir not in current and os.path.isdir(chunk_dir):
+            shutil.rmtree(chunk_dir)
+
+
+def document_ids(documents, seen=None):
+    """Content-derived docstore ids: identical chunks map to identical ids.
+
+    Pass the same ``seen`` dict across calls to keep ids of repeated chunks
+    unique when documents arrive in batches.
+    """
+    ids = []
+    seen = {} if seen is None else seen
+    for doc in documents:
+        key = _hash_text(doc.metadata.get("filename", "") + "\0" + doc.page_content)
+        seen[key] = seen.get(key, 0) + 1
+        ids.append(key if seen[key] == 1 else f"{key}-{seen[key] - 1}")
+    return ids
+
+
+# A freshly embedded vector arrives as a list of Python floats (~32 bytes each).
+_BYTES_PER_EMBEDDING_VALUE = 32
+
+
+def estimate_document_bytes(document, embedding_size=1536):
+    return (
+        len(document.page_content.encode("utf-8"))
+        + embedding_size * _BYTES_PER_EMBEDDING_VALUE
+    )
+
+
+def iter_batches(documents, batch_size=64, max_batch_bytes=None, embedding_size=1536):
+    """Groups a document stream into batches of at most ``batch_size`` documents
+    and, if given, roughly ``max_batch_bytes`` of text plus pending vectors."""
+    batch, batch_bytes = [], 0
+    for doc in documents:
+        size = estimate_document_bytes(doc, embedding_size)
+        if batch and (
+            len(batch) >= batch_size
+            or (max_batch_bytes and batch_bytes + size > max_batch_bytes)
+        ):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(doc)
+        batch_bytes += size
+    if batch:
+        yield batch
 
 
 def create_faiss_store(
-    documents, llm, store_path="faiss_index", embedding_size=1536, rewrite=False
+    documents,
+    llm,
+    store_path="faiss_index",
+    embedding_size=1536,
+    rewrite=False,
+    manifest=None,
+    batch_size=512,
+    max_memory_mb=None,
+    embeddings=None,
+    index_type="flat",
+    index_options=None,
 ):
+    if manifest is not None or index_type != "flat":
+        return update_faiss_store(
+            documents,
+            manifest if manifest is not None else {"files": {}, "chunks": {}},
+            store_path,
+            embedding_size,
+            batch_size=batch_size,
+            max_memory_mb=max_memory_mb,
+            embeddings=embeddings,
+            index_type=index_type,
+            index_options=index_options,
+        )
     if os.path.exists(store_path) and (not rewrite):
         return FAISS.load_local(
             store_path,
@@ -54,26 +288,216 @@ def create_faiss_store(
             embeddings=llm._generate_embeddings,
         )
     print("Creating FAISS store...")
-    embeddings = OpenAIEmbeddings(api_key=token)
+    embeddings = embeddings or default_embeddings()
+    vectorstore = _empty_faiss_store(embeddings, embedding_size)
+    vectorstore.add_documents(
+        documents, ids=[str(uuid4()) for _ in range(len(documents))]
+    )
+    save_faiss_store(vectorstore, store_path)
+    export_mmap_store(vectorstore, store_path)
+    return vectorstore
+
+
+def save_faiss_store(vectorstore, store_path):
+    """``save_local`` into a scratch directory, then renames the files into place.
+
+    Readers loading ``index.faiss``/``index.pkl`` directly never see a
+    partially written file.
+    """
+    os.makedirs(store_path, exist_ok=True)
+    tmp_path = os.path.join(store_path, f".saving.{os.getpid()}")
+    vectorstore.save_local(tmp_path)
+    for name in ("index.faiss", "index.pkl"):
+        os.replace(os.path.join(tmp_path, name), os.path.join(store_path, name))
+    shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def _empty_faiss_store(embeddings, embedding_size):
     index = faiss.IndexFlatL2(embedding_size)
-    vectorstore = FAISS(
+    return FAISS(
         index=index,
         embedding_function=embeddings,
         docstore=InMemoryDocstore(),
         index_to_docstore_id={},
     )
-    vectorstore.add_documents(
-        documents, ids=[str(uuid4()) for _ in range(len(documents))]
+
+
+def update_faiss_store(
+    documents,
+    manifest,
+    store_path,
+    embedding_size=1536,
+    batch_size=512,
+    max_memory_mb=None,
+    embeddings=None,
+    index_type="flat",
+    index_options=None,
+):
+    """Incrementally brings the store at ``store_path`` in line with ``documents``.
+
+    Chunks are keyed by their content hash (``document_ids``): only chunks not
+    yet in the store are embedded, vectors of chunks that disappeared are
+    removed, and the store is only written back when something changed. The
+    BM25 index (``backend.agent.lexical``) and the partition map
+    (``backend.agent.partitions``) are rewritten along with it.
+
+    ``documents`` may be any iterable, e.g. ``iter_documents``. It is consumed
+    in batches of ``batch_size`` (capped at roughly ``max_memory_mb`` of text
+    and pending vectors), each embedded and added to the index before the next
+    one is read. Embedding defaults to ``default_embeddings``: cached vectors are
+    reused and the rest are sent as concurrent, rate-limited batches.
+
+    ``index_type`` selects an ANN or quantized index from ``backend.agent.ann``
+    (``flat``, ``ivf``, ``hnsw``, ``ivfpq``, ``fp16``, ``sq8``, ``pq``);
+    ``index_options`` are passed on to ``ann.build_index`` (``nlist``,
+    ``train_size``, ``pca``, ...); changing them or the index type rebuilds
+    the store. A new trained index is trained on ``train_size`` vectors
+    sampled uniformly from the whole corpus, so the vectors are staged in a
+    flat index until all are embedded. The search options ``nprobe`` and
+    ``ef_search`` are saved to ``SEARCH_PARAMS_FILE`` and applied by
+    ``load_faiss_store``; changing them never re-embeds anything.
+    """
+    embeddings = embeddings or default_embeddings()
+    index_options = dict(index_options or {})
+    search_params = {k: index_options.pop(k) for k in SEARCH_OPTIONS if k in index_options}
+    index_spec = {"type": index_type, **index_options}
+    stored_spec = {
+        k: v
+        for k, v in manifest.get("index", {"type": "flat"}).items()
+        if k not in SEARCH_OPTIONS
+    }
+    if (
+        manifest.get("chunks")
+        and stored_spec == index_spec
+        and os.path.exists(os.path.join(store_path, "index.faiss"))
+    ):
+        vectorstore = FAISS.load_local(
+            store_path, embeddings, allow_dangerous_deserialization=True
+        )
+    else:
+        vectorstore = _empty_faiss_store(embeddings, embedding_size)
+
+    existing = set(vectorstore.index_to_docstore_id.values())
+    changed = not os.path.exists(os.path.join(store_path, "index.faiss"))
+    max_batch_bytes = int(max_memory_mb * 1024 * 1024) if max_memory_mb else None
+    seen = {}
+    chunks = {}
+    added = 0
+    embed_seconds = 0.0
+    # A fresh ANN index is trained once every vector is in; until then they
+    # are added to the flat store and sampled for training.
+    sample = None
+    if index_type != "flat" and not existing:
+        sample = TrainingSample(
+            index_options.get("train_size", 20_000), seed=index_options.get("seed", 0)
+        )
+    for batch in iter_batches(documents, batch_size, max_batch_bytes, embedding_size):
+        new = []
+        for i, doc in zip(document_ids(batch, seen), batch):
+            chunks[i] = {
+                "filename": doc.metadata["filename"],
+                "chunk_id": doc.metadata["chunk_id"],
+            }
+            if i not in existing:
+                new.append((i, doc))
+                continue
+            # Unchanged chunks may still have moved to a new chunk_id.
+            stored = vectorstore.docstore.search(i)
+            if stored.metadata != doc.metadata:
+                vectorstore.docstore.delete([i])
+                vectorstore.docstore.add({i: doc})
+                changed = True
+        if new:
+            texts = [doc.page_content for _, doc in new]
+            start = time.perf_counter()
+            vectors = embeddings.embed_documents(texts)
+            embed_seconds += time.perf_counter() - start
+            added += len(new)
+            changed = True
+            if sample is not None:
+                sample.add(vectors)
+            vectorstore.add_embeddings(
+                zip(texts, vectors),
+                metadatas=[doc.metadata for _, doc in new],
+                ids=[i for i, _ in new],
+            )
+    if sample is not None and sample.seen:
+        _train_and_add(vectorstore, sample, index_type, index_options)
+
+    stale = [i for i in existing if i not in chunks]
+    print(
+        f"Updating FAISS store: {added} new, {len(stale)} removed, "
+        f"{len(chunks) - added} unchanged chunks"
     )
-    vectorstore.save_local(store_path)
+    if added and embed_seconds:
+        print(f"Embedded {added} chunks at {added / embed_seconds:.1f} chunks/sec")
+    if stale:
+        _delete(vectorstore, stale)
+        changed = True
+    if changed:
+        save_faiss_store(vectorstore, store_path)
+    if changed or not mmap_store_is_current(store_path):
+        export_mmap_store(vectorstore, store_path)
+    if changed or not os.path.exists(os.path.join(store_path, LEXICAL_FILE)):
+        write_lexical_index(vectorstore, store_path)
+    if changed or not os.path.exists(os.path.join(store_path, PARTITIONS_FILE)):
+        write_partitions(vectorstore, store_path)
+    manifest["chunks"] = chunks
+    manifest["index"] = index_spec
+    save_manifest(store_path, manifest)
+    save_search_params(store_path, search_params)
+    set_search_params(vectorstore.index, **search_params)
     return vectorstore
 
 
-def load_faiss_store(store_path, llm):
+def _train_and_add(vectorstore, sample, index_type, index_options, batch_size=8192):
+    """Replaces the staged flat index with one trained on ``sample``."""
+    staged = vectorstore.index
+    index = build_index(index_type, sample.vectors, **index_options)
+    for start in range(0, staged.ntotal, batch_size):
+        index.add(staged.reconstruct_n(start, min(batch_size, staged.ntotal - start)))
+    vectorstore.index = index
+
+
+def _delete(vectorstore, ids):
+    if supports_removal(vectorstore.index):
+        vectorstore.delete(ids)
+        return
+    removed = set(ids)
+    positions = [p for p, i in vectorstore.index_to_docstore_id.items() if i in removed]
+    vectorstore.index = without_vectors(vectorstore.index, positions)
+    remaining = [
+        i for _, i in sorted(vectorstore.index_to_docstore_id.items()) if i not in removed
+    ]
+    vectorstore.index_to_docstore_id = dict(enumerate(remaining))
+    vectorstore.docstore.delete(ids)
+
+
+def load_faiss_store(
+    store_path, llm=None, nprobe=None, ef_search=None, mmap=False, embeddings=None
+):
+    """Loads a saved store.
+
+    With ``mmap=True`` the store is opened read-only through memory maps (see
+    ``backend.agent.mmap_store``), so worker processes share its pages.
+    ``nprobe`` and ``ef_search`` default to those saved by the last build.
+    """
+    if embeddings is None:
+        embeddings = llm._generate_embeddings
     if os.path.exists(store_path):
-        return FAISS.load_local(
-            store_path,
-            allow_dangerous_deserialization=True,
-            embeddings=llm._generate_embeddings,
+        if mmap:
+            vectorstore = load_mmap_store(store_path, embeddings)
+        else:
+            vectorstore = FAISS.load_local(
+                store_path,
+                allow_dangerous_deserialization=True,
+                embeddings=embeddings,
+            )
+        params = load_search_params(store_path)
+        set_search_params(
+            vectorstore.index,
+            nprobe=params.get("nprobe") if nprobe is None else nprobe,
+            ef_search=params.get("ef_search") if ef_search is None else ef_search,
         )
+        return vectorstore
     raise ValueError(f"{store_path} does not exist for loading FAISS")
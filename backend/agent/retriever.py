@@ -0,0 +1,581 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from backend.agent.lexical import LEXICAL_FILE, load_lexical_index, reciprocal_rank_fusion
+from backend.agent.partitions import (
+    PARTITIONS_FILE,
+    load_partitions,
+    partition_search,
+    route,
+)
+from backend.agent.context import ContextBuilder
+from backend.agent.llm_gateway import get_gateway
+from backend.agent.cache import (
+    CachedEmbeddings,
+    QueryEmbeddingCache,
+    SemanticAnswerCache,
+)
+
+
+# Partition key sets whose chunk positions are kept, most recently used first.
+MAX_PARTITION_CACHE = 256
+
+STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "faiss_store")
+
+RAG_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "Use the following context to answer the question at the end."
+            " Process the context by removing any special characters that might be from a Markdown or other files."
+            " If you don't know the answer, just say that you don't know, don't try to make up an answer."
+            "\nContext:\n"
+            "{context}",
+        ),
+        ("user", "Question: {question}" "\nHelpful Answer:"),
+    ]
+)
+
+def load_faiss_store(*args, **kwargs):
+    """``rag.load_faiss_store``; rag, and with it faiss, is imported on first use."""
+    from backend.agent import rag
+
+    return rag.load_faiss_store(*args, **kwargs)
+
+
+def _doc_key(doc):
+    if "filename" in doc.metadata and "chunk_id" in doc.metadata:
+        return doc.metadata["filename"], doc.metadata["chunk_id"]
+    return doc.page_content
+
+
+def _unit_rows(x):
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return np.divide(x, norms, out=np.zeros_like(x), where=norms > 0)
+
+
+def batched_mmr(queries, candidates, valid, k, lambda_mult=0.5):
+    """Maximal marginal relevance for several queries at once.
+
+    ``queries`` is (Q, d), ``candidates`` (Q, F, d) and ``valid`` a (Q, F)
+    mask of real candidates. Returns a (Q, k) array of selected candidate
+    positions, -1 where a query has fewer than k candidates. Selection
+    matches ``langchain_community.vectorstores.utils.maximal_marginal_relevance``.
+    """
+    n_queries, n_candidates = valid.shape
+    queries = _unit_rows(np.asarray(queries, dtype=np.float32))
+    candidates = _unit_rows(np.asarray(candidates, dtype=np.float32))
+    to_query = np.einsum("qfd,qd->qf", candidates, queries)
+    to_each_other = np.einsum("qfd,qgd->qfg", candidates, candidates)
+    rows = np.arange(n_queries)
+    selected = np.full((n_queries, k), -1, dtype=np.int64)
+    taken = ~valid
+    redundancy = np.full((n_queries, n_candidates), -np.inf, dtype=np.float32)
+    for step in range(k):
+        if step == 0:
+            score = to_query.copy()
+        else:
+            score = lambda_mult * to_query - (1 - lambda_mult) * redundancy
+        score[taken] = -np.inf
+        best = np.argmax(score, axis=1)
+        has_choice = np.isfinite(score[rows, best])
+        selected[has_choice, step] = best[has_choice]
+        taken[rows[has_choice], best[has_choice]] = True
+        redundancy = np.where(
+            has_choice[:, None],
+            np.maximum(redundancy, to_each_other[rows, :, best]),
+            redundancy,
+        )
+    return selected
+
+
+def store_files_version(store_path):
+    """``(mtime, size)`` of the files making up the store at ``store_path``."""
+    # Imported here so importing the retriever does not load faiss.
+    from backend.agent.mmap_store import CURRENT_FILE
+    from backend.agent.rag import SEARCH_PARAMS_FILE
+
+    version = []
+    names = ("index.faiss", "index.pkl", CURRENT_FILE, LEXICAL_FILE, PARTITIONS_FILE)
+    for name in names + (SEARCH_PARAMS_FILE,):
+        try:
+            stat = os.stat(os.path.join(store_path, name))
+            version.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            version.append(None)
+    return tuple(version)
+
+
+class RetrieverService:
+    """Long-lived RAG retriever: the store, clients and prompt are set up once.
+
+    The store is loaded lazily (memory-mapped by default) and reloaded when
+    the files on disk change, checked at most every ``check_interval``
+    seconds. A reload builds the new store first and then swaps the
+    reference, so in-flight searches finish on the old one.
+
+    If the store has a BM25 index (``backend.agent.lexical``), ``answer``
+    fuses its ranking with the vector results. A query whose top keyword hit
+    covers at least ``fast_path_coverage`` of the query's IDF weight and leads
+    the runner-up by ``fast_path_margin`` is answered from the keyword hits
+    alone, without an embedding request; ``lexical=False`` disables both.
+
+    Queries naming a restaurant or neighbourhood (``backend.agent.partitions``)
+    are searched, lexically and by vector, only within the chunks of the
+    matching partitions; other queries search the whole store.
+    ``partitioned=False`` always searches the whole store.
+    """
+
+    def __init__(
+        self,
+        store_path=STORE_PATH,
+        embeddings=None,
+        llm=None,
+        mmap=True,
+        check_interval=1.0,
+        query_cache=None,
+        answer_cache=None,
+        lexical=True,
+        fast_path_coverage=0.9,
+        fast_path_margin=0.3,
+        partitioned=True,
+        context_builder=None,
+    ):
+        self.store_path = store_path
+        self.lexical = lexical
+        self.fast_path_coverage = fast_path_coverage
+        self.fast_path_margin = fast_path_margin
+        self.lexical_stats = {"fast_path": 0, "fused": 0}
+        self.partitioned = partitioned
+        self.partition_stats = {"routed": 0, "global": 0}
+        self.mmap = mmap
+        self.check_interval = check_interval
+        self.prompt = RAG_PROMPT
+        self.context_builder = context_builder or ContextBuilder()
+        self.query_cache = query_cache if query_cache is not None else QueryEmbeddingCache()
+        self.answer_cache = (
+            answer_cache if answer_cache is not None else SemanticAnswerCache()
+        )
+        self._embeddings = embeddings
+        self._llm = llm
+        self._chain = None
+        self._store = None
+        self._lexical_index = None
+        self._partitions = None
+        self._partition_positions = OrderedDict()
+        self._store_positions = None
+        self._version = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            self._embeddings = CachedEmbeddings(get_gateway().embeddings())
+        return self._embeddings
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            # A chat model, so a graph run with stream_mode="messages" gets
+            # the answer token by token.
+            self._llm = get_gateway().chat_model(streaming=True)
+        return self._llm
+
+    @property
+    def chain(self):
+        if self._chain is None:
+            self._chain = self.prompt | self.llm | StrOutputParser()
+        return self._chain
+
+    def store_version(self):
+        """Changes whenever the store is rewritten on disk."""
+        return store_files_version(self.store_path)
+
+    @property
+    def store(self):
+        now = time.monotonic()
+        if self._store is not None and now - self._checked < self.check_interval:
+            return self._store
+        with self._lock:
+            self._checked = now
+            version = self.store_version()
+            if self._store is None or version != self._version:
+                store = load_faiss_store(
+                    self.store_path, embeddings=self.embeddings, mmap=self.mmap
+                )
+                lexical_index = load_lexical_index(self.store_path) if self.lexical else None
+                partitions = load_partitions(self.store_path) if self.partitioned else None
+                self._store, self._lexical_index = store, lexical_index
+                self._partitions = partitions
+                self._partition_positions = OrderedDict()
+                self._store_positions = None
+                self._version = self.store_version()
+                self.on_reload()
+            return self._store
+
+    def on_reload(self):
+        """Runs after a (re)load of the store: cached answers may be stale."""
+        self.answer_cache.clear()
+
+    def embed_query(self, query):
+        vector = self.query_cache.get(query)
+        if vector is None:
+            vector = self.embeddings.embed_query(query)
+            self.query_cache.put(query, vector)
+        return vector
+
+    async def aembed_query(self, query):
+        vector = self.query_cache.get(query)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(query)
+            self.query_cache.put(query, vector)
+        return vector
+
+    def route(self, query):
+        """Partition keys ``query`` is scoped to; empty means the whole store."""
+        self.store
+        return route(query, self._partitions)
+
+    def partition_positions(self, keys):
+        """Sorted index positions of the chunks in partitions ``keys``.
+
+        Kept for the ``MAX_PARTITION_CACHE`` most recently used key sets.
+        """
+        keys = frozenset(keys)
+        db = self.store
+        with self._lock:
+            positions = self._partition_positions.get(keys)
+            if positions is not None:
+                self._partition_positions.move_to_end(keys)
+                return positions
+            if self._store_positions is None:
+                self._store_positions = {i: p for p, i in db.index_to_docstore_id.items()}
+            ids = {i for key in keys for i in self._partitions["partitions"][key]}
+            positions = np.array(
+                sorted(self._store_positions[i] for i in ids if i in self._store_positions),
+                dtype=np.int64,
+            )
+            self._partition_positions[keys] = positions
+            while len(self._partition_positions) > MAX_PARTITION_CACHE:
+                self._partition_positions.popitem(last=False)
+            return positions
+
+    def partition_ids(self, keys):
+        if not keys:
+            return None
+        return {i for key in keys for i in self._partitions["partitions"][key]}
+
+    def _cached_queries(self, queries):
+        embeddings = [self.query_cache.get(query) for query in queries]
+        return embeddings, [i for i, vector in enumerate(embeddings) if vector is None]
+
+    def _cache_queries(self, queries, embeddings, missing, vectors):
+        for i, vector in zip(missing, vectors):
+            self.query_cache.put(queries[i], vector)
+            embeddings[i] = vector
+        return embeddings
+
+    def embed_queries(self, queries):
+        """Query embeddings, fetching all cache misses in one request."""
+        embeddings, missing = self._cached_queries(queries)
+        if not missing:
+            return embeddings
+        vectors = self.embeddings.embed_documents([queries[i] for i in missing])
+        return self._cache_queries(queries, embeddings, missing, vectors)
+
+    async def aembed_queries(self, queries):
+        embeddings, missing = self._cached_queries(queries)
+        if not missing:
+            return embeddings
+        vectors = await self.embeddings.aembed_documents([queries[i] for i in missing])
+        return self._cache_queries(queries, embeddings, missing, vectors)
+
+    def search(
+        self, query, k=5, fetch_k=30, lambda_mult=0.1, embedding=None, partitions=None
+    ):
+        """MMR vector search, within ``partitions`` (routed from ``query`` by default)."""
+        try:
+            if partitions is None:
+                partitions = self.route(query)
+            self.partition_stats["routed" if partitions else "global"] += 1
+            db = self.store
+            positions = self.partition_positions(partitions) if partitions else None
+            if embedding is None:
+                embedding = self.embed_query(query)
+        except Exception as e:
+            raise Exception(f"Error loading FAISS store: {str(e)}")
+        if db.index.ntotal == 0:
+            return []
+        try:
+            if positions is not None:
+                docs = partition_search(db, embedding, positions, k, fetch_k, lambda_mult)
+            else:
+                docs = db.max_marginal_relevance_search_with_score_by_vector(
+                    embedding=embedding,
+                    k=min(k, db.index.ntotal),
+                    fetch_k=min(fetch_k, db.index.ntotal),
+                    lambda_mult=lambda_mult,
+                )
+        except Exception as e:
+            raise Exception(f"Error during vector search: {str(e)}")
+        # MMR picks a diverse set; present it closest (lowest L2 distance) first.
+        return sorted(docs, key=lambda x: x[1])
+
+    def lexical_search(self, query, k=30, partitions=None):
+        """BM25 ``(docstore id, score)`` hits, best first; empty without a lexical index."""
+        self.store
+        if self._lexical_index is None:
+            return []
+        return self._lexical_index.search(query, k, ids=self.partition_ids(partitions))
+
+    def is_confident(self, query, hits):
+        """Whether the keyword ``hits`` settle ``query`` without vector search."""
+        if not hits or self._lexical_index is None:
+            return False
+        coverage, margin = self._lexical_index.confidence(query, hits)
+        return coverage >= self.fast_path_coverage and margin >= self.fast_path_margin
+
+    def _lexical_docs(self, hits):
+        docs = [(self._store.docstore.search(i), score) for i, score in hits]
+        # A concurrent reload may have dropped some ids; the docstore then
+        # returns a "not found" string rather than a document.
+        return [(doc, score) for doc, score in docs if not isinstance(doc, str)]
+
+    def hybrid_search(
+        self,
+        query,
+        k=5,
+        fetch_k=30,
+        lambda_mult=0.1,
+        embedding=None,
+        hits=None,
+        partitions=None,
+    ):
+        """Vector MMR results fused with BM25 hits by reciprocal rank.
+
+        Returns ``(doc, score)`` pairs most relevant first: fused scores,
+        or L2 distances when there are no keyword hits.
+        """
+        if partitions is None:
+            partitions = self.route(query)
+        docs = self.search(
+            query,
+            k=k,
+            fetch_k=fetch_k,
+            lambda_mult=lambda_mult,
+            embedding=embedding,
+            partitions=partitions,
+        )
+        if hits is None:
+            hits = self.lexical_search(query, fetch_k, partitions=partitions)
+        if not hits:
+            return docs
+        hits = self._lexical_docs(hits)
+        by_key = {}
+        rankings = []
+        for ranked in (docs, hits):
+            keys = []
+            for doc, _ in ranked:
+                key = _doc_key(doc)
+                by_key.setdefault(key, doc)
+                keys.append(key)
+            rankings.append(keys)
+        fused = reciprocal_rank_fusion(rankings)[:k]
+        self.lexical_stats["fused"] += 1
+        return [(by_key[key], score) for key, score in fused]
+
+    def search_many(self, queries, k=5, fetch_k=30, lambda_mult=0.1, embeddings=None):
+        """Retrieves context for several sub-queries in one pass.
+
+        Uncached query embeddings (unless given as ``embeddings``) are
+        fetched in a single request, the index
+        is searched once with the whole query matrix and MMR runs for all
+        queries together (``batched_mmr``). Returns ``(doc, score)`` pairs
+        merged across queries, deduplicated by docstore id keeping the best
+        (lowest) distance, closest first.
+        """
+        if not queries:
+            return []
+        try:
+            db = self.store
+            if embeddings is None:
+                embeddings = self.embed_queries(queries)
+        except Exception as e:
+            raise Exception(f"Error loading FAISS store: {str(e)}")
+        try:
+            query_matrix = np.asarray(embeddings, dtype=np.float32)
+            distances, positions = db.index.search(query_matrix, fetch_k)
+            valid = positions != -1
+            vectors = {
+                int(p): db.index.reconstruct(int(p)) for p in np.unique(positions[valid])
+            }
+            candidates = np.zeros(positions.shape + (query_matrix.shape[1],), np.float32)
+            for (q, f), p in np.ndenumerate(positions):
+                if p != -1:
+                    candidates[q, f] = vectors[int(p)]
+            selected = batched_mmr(query_matrix, candidates, valid, k, lambda_mult)
+        except Exception as e:
+            raise Exception(f"Error during vector search: {str(e)}")
+        best = {}
+        for q, f in zip(*np.nonzero(selected != -1)):
+            candidate = selected[q, f]
+            position = int(positions[q, candidate])
+            distance = float(distances[q, candidate])
+            if position not in best or distance < best[position]:
+                best[position] = distance
+        results = []
+        for position, distance in sorted(best.items(), key=lambda item: item[1]):
+            doc = db.docstore.search(db.index_to_docstore_id[position])
+            results.append((doc, distance))
+        return results
+
+    def answer_many(self, queries, question=None, config=None):
+        """Answers ``question`` (default: all ``queries``) from merged context.
+
+        Without ``queries``, ``question`` is answered like a single query.
+        """
+        if not queries and question:
+            return self.answer(question, config=config)
+        docs = self.search_many(queries)
+        return self._generate(question or "\n".join(queries), docs, config)
+
+    async def aanswer_many(self, queries, question=None, config=None):
+        if not queries and question:
+            return await self.aanswer(question, config=config)
+        try:
+            embeddings = await self.aembed_queries(queries)
+        except Exception as e:
+            raise Exception(f"Error loading FAISS store: {str(e)}")
+        docs = await asyncio.to_thread(self.search_many, queries, embeddings=embeddings)
+        return await self._agenerate(question or "\n".join(queries), docs, config)
+
+    def _lexical_stage(self, query, fetch_k):
+        try:
+            # Touch the store first so a rebuild clears the answer cache.
+            self.store
+            partitions = self.route(query)
+            hits = self.lexical_search(query, fetch_k, partitions=partitions)
+        except Exception as e:
+            raise Exception(f"Error loading FAISS store: {str(e)}")
+        return partitions, hits
+
+    def _vector_stage(self, query, k, fetch_k, embedding, hits, partitions, use_answer_cache):
+        if use_answer_cache:
+            cached = self.answer_cache.get(embedding, self.answer_cache.scope_key(partitions))
+            if cached is not None:
+                return [], embedding, cached
+        docs = self.hybrid_search(
+            query, k=k, fetch_k=fetch_k, embedding=embedding, hits=hits, partitions=partitions
+        )
+        return docs, embedding, None
+
+    def retrieve(self, query, k=5, fetch_k=30, use_answer_cache=False):
+        """Context for ``query`` as ``(docs, embedding, cached_answer)``.
+
+        ``docs`` are most relevant first and ``embedding`` is ``None`` when the
+        lexical fast path skipped embedding. With ``use_answer_cache``, a
+        cached answer to a similar query routed to the same partitions is
+        returned instead of searching.
+        """
+        partitions, hits = self._lexical_stage(query, fetch_k)
+        if self.is_confident(query, hits):
+            self.lexical_stats["fast_path"] += 1
+            return self._lexical_docs(hits[:k]), None, None
+        try:
+            embedding = self.embed_query(query)
+        except Exception as e:
+            raise Exception(f"Error loading FAISS store: {str(e)}")
+        return self._vector_stage(
+            query, k, fetch_k, embedding, hits, partitions, use_answer_cache
+        )
+
+    async def aretrieve(self, query, k=5, fetch_k=30, use_answer_cache=False):
+        """Async ``retrieve``: awaits the query embedding.
+
+        Store (re)loads, cache lookups and searches of the local index block,
+        so they run on a worker thread instead of the event loop.
+        """
+        partitions, hits = await asyncio.to_thread(self._lexical_stage, query, fetch_k)
+        if self.is_confident(query, hits):
+            self.lexical_stats["fast_path"] += 1
+            return self._lexical_docs(hits[:k]), None, None
+        try:
+            embedding = await self.aembed_query(query)
+        except Exception as e:
+            raise Exception(f"Error loading FAISS store: {str(e)}")
+        return await asyncio.to_thread(
+            self._vector_stage, query, k, fetch_k, embedding, hits, partitions, use_answer_cache
+        )
+
+    def answer(self, query, k=5, fetch_k=30, config=None):
+        """Answers ``query`` from retrieved context.
+
+        ``config`` is passed to the generation chain; inside a graph run its
+        callbacks stream the answer's tokens.
+        """
+        docs, embedding, cached = self.retrieve(query, k, fetch_k, use_answer_cache=True)
+        if cached is not None:
+            return cached
+        response = self._generate(query, docs, config)
+        if embedding is not None:
+            self._cache_answer(query, embedding, response)
+        return response
+
+    async def aanswer(self, query, k=5, fetch_k=30, config=None):
+        """Async ``answer``, for ``graph.ainvoke``/``graph.astream``."""
+        docs, embedding, cached = await self.aretrieve(
+            query, k, fetch_k, use_answer_cache=True
+        )
+        if cached is not None:
+            return cached
+        response = await self._agenerate(query, docs, config)
+        if embedding is not None:
+            await asyncio.to_thread(self._cache_answer, query, embedding, response)
+        return response
+
+    def _cache_answer(self, query, embedding, response):
+        scope = self.answer_cache.scope_key(self.route(query))
+        self.answer_cache.put(embedding, response, scope)
+
+    def _generate(self, query, docs, config=None):
+        """Answers from ``docs``, which are ordered most relevant first."""
+        context = self.context_builder.build(docs)
+        try:
+            return self.chain.invoke({"context": context, "question": query}, config)
+        except Exception as e:
+            raise Exception(f"Error generating response: {str(e)}")
+
+    async def _agenerate(self, query, docs, config=None):
+        context = self.context_builder.build(docs)
+        try:
+            return await self.chain.ainvoke({"context": context, "question": query}, config)
+        except Exception as e:
+            raise Exception(f"Error generating response: {str(e)}")
+
+
+_retriever = None
+_retriever_lock = threading.Lock()
+
+
+def get_retriever():
+    """Process-wide ``RetrieverService`` used by the RAG tools."""
+    global _retriever
+    with _retriever_lock:
+        if _retriever is None:
+            _retriever = RetrieverService()
+        return _retriever
+
+
+def set_retriever(retriever):
+    """Replaces the process-wide retriever, e.g. with fakes in tests."""
+    global _retriever
+    with _retriever_lock:
+        _retriever = retriever
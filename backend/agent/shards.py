@@ -0,0 +1,425 @@
+"""Sharded FAISS store with scatter-gather search across worker processes.
+
+``create_sharded_store`` splits the corpus into ``num_shards`` ordinary
+stores under one directory (``shard_00``, ``shard_01``, ...), assigning each
+chunk by its content-hash id so a chunk always lands in the same shard.
+
+``ShardPool`` serves each shard from its own process: a local worker started
+over a ``multiprocessing`` pipe, or a remote one started with
+``python -m backend.agent.shards serve --shard <dir> --port <port>`` and
+reached over ``multiprocessing.connection``. A search sends the query
+vectors to every shard at once, each shard returns its ``fetch_k`` nearest
+candidates with their vectors, and the pool merges them and runs MMR
+centrally. ``ShardedRetrieverService`` plugs the pool into the RAG tools::
+
+    set_retriever(ShardedRetrieverService(ShardPool("faiss_shards")))
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+
+from backend.agent.rag import (
+    document_ids,
+    load_faiss_store,
+    load_manifest,
+    save_manifest,
+    update_faiss_store,
+)
+from backend.agent.retriever import (
+    RetrieverService,
+    _doc_key,
+    batched_mmr,
+    store_files_version,
+)
+
+
+SHARDS_FILE = "shards.json"
+
+
+def shard_of(docstore_id, num_shards):
+    return int(docstore_id[:8], 16) % num_shards
+
+
+def create_sharded_store(
+    documents,
+    store_path,
+    num_shards,
+    manifest=None,
+    embedding_size=1536,
+    batch_size=512,
+    max_memory_mb=None,
+    embeddings=None,
+    index_type="flat",
+    index_options=None,
+):
+    """Writes ``documents`` as ``num_shards`` incremental stores under ``store_path``.
+
+    Each shard is built with ``update_faiss_store`` and keeps its own
+    manifest, so rebuilds only embed the chunks new to that shard. Chunk
+    text is grouped per shard in memory; vectors are still embedded and
+    added batch by batch. ``manifest`` is the corpus manifest from
+    ``load_manifest(store_path)`` that ``iter_documents`` filled in.
+    """
+    os.makedirs(store_path, exist_ok=True)
+    names = [f"shard_{i:02d}" for i in range(num_shards)]
+    shards = [[] for _ in range(num_shards)]
+    seen = {}
+    for doc in documents:
+        shards[shard_of(document_ids([doc], seen)[0], num_shards)].append(doc)
+    if manifest is not None:
+        save_manifest(store_path, manifest)
+    for name, docs in zip(names, shards):
+        shard_path = os.path.join(store_path, name)
+        os.makedirs(shard_path, exist_ok=True)
+        print(f"Shard {name}: {len(docs)} chunks")
+        update_faiss_store(
+            docs,
+            load_manifest(shard_path),
+            shard_path,
+            embedding_size,
+            batch_size=batch_size,
+            max_memory_mb=max_memory_mb,
+            embeddings=embeddings,
+            index_type=index_type,
+            index_options=index_options,
+        )
+    with open(os.path.join(store_path, SHARDS_FILE), "w", encoding="utf-8") as f:
+        json.dump({"num_shards": num_shards, "shards": names}, f)
+    return [os.path.join(store_path, name) for name in names]
+
+
+def shard_paths(store_path):
+    with open(os.path.join(store_path, SHARDS_FILE), "r", encoding="utf-8") as f:
+        return [os.path.join(store_path, name) for name in json.load(f)["shards"]]
+
+
+class _QueryVectorsOnly(Embeddings):
+    """Shard workers receive query vectors; they never embed text."""
+
+    def embed_documents(self, texts):
+        raise NotImplementedError("shard workers search by vector only")
+
+    def embed_query(self, text):
+        raise NotImplementedError("shard workers search by vector only")
+
+
+def search_shard(store, vectors, fetch_k):
+    """``fetch_k`` nearest chunks of ``store`` per query vector.
+
+    Returns, per query, ``(distance, page_content, metadata, vector)`` tuples.
+    """
+    if store.index.ntotal == 0:
+        return [[] for _ in vectors]
+    distances, positions = store.index.search(
+        np.ascontiguousarray(vectors, dtype=np.float32), min(fetch_k, store.index.ntotal)
+    )
+    results = []
+    for row_distances, row_positions in zip(distances, positions):
+        row = []
+        for distance, position in zip(row_distances, row_positions):
+            if position == -1:
+                continue
+            doc = store.docstore.search(store.index_to_docstore_id[int(position)])
+            vector = np.asarray(store.index.reconstruct(int(position)), dtype=np.float32)
+            row.append((float(distance), doc.page_content, doc.metadata, vector))
+        results.append(row)
+    return results
+
+
+def load_shard(shard_path, mmap=True):
+    return load_faiss_store(shard_path, embeddings=_QueryVectorsOnly(), mmap=mmap)
+
+
+class ShardStore:
+    """A worker's loaded shard, reloaded when its files change on disk.
+
+    Searches check the files at most every ``check_interval`` seconds;
+    version requests, already paced by the caller, always check.
+    """
+
+    def __init__(self, shard_path, mmap=True, check_interval=1.0):
+        self.shard_path = shard_path
+        self.mmap = mmap
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked = time.monotonic()
+        self.store = load_shard(shard_path, mmap)
+        self.version = store_files_version(shard_path)
+
+    def current(self, check=False):
+        now = time.monotonic()
+        if not check and now - self._checked < self.check_interval:
+            return self.store
+        with self._lock:
+            self._checked = now
+            if store_files_version(self.shard_path) != self.version:
+                self.store = load_shard(self.shard_path, self.mmap)
+                self.version = store_files_version(self.shard_path)
+            return self.store
+
+
+def serve_store(conn, shard):
+    """Answers requests for ``shard`` (a ``ShardStore``) on ``conn`` until it is closed."""
+    conn.send(("ready", shard.store.index.ntotal))
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request[0] == "close":
+            break
+        try:
+            if request[0] == "version":
+                shard.current(check=True)
+                conn.send(("ok", shard.version))
+            else:
+                _, vectors, fetch_k = request
+                conn.send(("ok", search_shard(shard.current(), vectors, fetch_k)))
+        except Exception as e:
+            conn.send(("error", str(e)))
+    conn.close()
+
+
+def serve(conn, shard_path, mmap=True):
+    """Worker process entry point: loads one shard and serves it on ``conn``."""
+    try:
+        shard = ShardStore(shard_path, mmap)
+    except Exception as e:
+        conn.send(("error", f"could not load {shard_path}: {str(e)}"))
+        conn.close()
+        return
+    serve_store(conn, shard)
+
+
+def _serve_listener(shard_path, address, authkey, mmap=True):
+    # Requests are pickles, so an unauthenticated listener runs arbitrary code.
+    if not authkey:
+        raise Exception("Shard workers need an authkey (--authkey or SHARD_AUTHKEY)")
+    shard = ShardStore(shard_path, mmap)
+    with Listener(address, authkey=authkey) as listener:
+        print(
+            f"Serving {shard_path} ({shard.store.index.ntotal} chunks) on {listener.address}"
+        )
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=serve_store, args=(conn, shard), daemon=True).start()
+
+
+class ShardPool:
+    """One connection per shard worker; searches fan out to all of them.
+
+    With ``store_path``, a local worker process is started per shard.
+    Alternatively pass ``addresses`` (and ``authkey``) of workers started with
+    ``python -m backend.agent.shards serve``. Use as a context manager or call
+    ``close`` to stop local workers.
+
+    Each connection is locked only for its own request and reply, so
+    concurrent searches overlap: one can be on shard 0 while another is
+    already on shard 1.
+    """
+
+    def __init__(
+        self, store_path=None, addresses=None, authkey=None, mmap=True, context="spawn"
+    ):
+        self._processes = []
+        self._connections = []
+        if addresses:
+            for address in addresses:
+                self._connections.append(Client(address, authkey=authkey))
+        else:
+            ctx = multiprocessing.get_context(context)
+            for shard_path in shard_paths(store_path):
+                parent, child = ctx.Pipe()
+                process = ctx.Process(
+                    target=serve, args=(child, shard_path, mmap), daemon=True
+                )
+                process.start()
+                child.close()
+                self._processes.append(process)
+                self._connections.append(parent)
+        self._locks = [threading.Lock() for _ in self._connections]
+        self._executor = ThreadPoolExecutor(
+            max_workers=2 * max(1, len(self._connections)), thread_name_prefix="shard"
+        )
+        self.sizes = [self._receive(i, conn)[1] for i, conn in enumerate(self._connections)]
+
+    def __len__(self):
+        return len(self._connections)
+
+    def _receive(self, shard, conn):
+        try:
+            reply = conn.recv()
+        except (EOFError, OSError) as e:
+            raise Exception(f"Shard {shard} is unavailable: {str(e)}")
+        if reply[0] == "error":
+            raise Exception(f"Shard {shard} failed: {reply[1]}")
+        return reply
+
+    def _request(self, shard, request):
+        with self._locks[shard]:
+            conn = self._connections[shard]
+            try:
+                conn.send(request)
+            except (OSError, ValueError) as e:
+                raise Exception(f"Shard {shard} is unavailable: {str(e)}")
+            return self._receive(shard, conn)[1]
+
+    def _broadcast(self, request):
+        futures = [
+            self._executor.submit(self._request, shard, request) for shard in range(len(self))
+        ]
+        return [future.result() for future in futures]
+
+    def scatter(self, vectors, fetch_k):
+        """Per-shard candidate lists; all shards search concurrently."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        return self._broadcast(("search", vectors, fetch_k))
+
+    def versions(self):
+        """On-disk version of every shard; changes when any shard is rebuilt."""
+        return tuple(self._broadcast(("version",)))
+
+    def search(self, vectors, k=5, fetch_k=30, lambda_mult=0.1):
+        """MMR over the merged shard candidates of each query vector.
+
+        Returns one list of ``(doc, distance)`` pairs per query, closest first.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        per_shard = self.scatter(vectors, fetch_k)
+        merged = []
+        for q in range(len(vectors)):
+            candidates = [c for shard in per_shard for c in shard[q]]
+            candidates.sort(key=lambda c: c[0])
+            merged.append(candidates[:fetch_k])
+        width = max((len(c) for c in merged), default=0)
+        if width == 0:
+            return [[] for _ in merged]
+        candidate_vectors = np.zeros((len(vectors), width, vectors.shape[1]), np.float32)
+        valid = np.zeros((len(vectors), width), dtype=bool)
+        for q, candidates in enumerate(merged):
+            for f, candidate in enumerate(candidates):
+                candidate_vectors[q, f] = candidate[3]
+                valid[q, f] = True
+        selected = batched_mmr(vectors, candidate_vectors, valid, min(k, width), lambda_mult)
+        results = []
+        for q, candidates in enumerate(merged):
+            picked = [candidates[f] for f in selected[q] if f != -1]
+            picked.sort(key=lambda c: c[0])
+            results.append(
+                [(Document(page_content=c[1], metadata=c[2]), c[0]) for c in picked]
+            )
+        return results
+
+    def close(self):
+        for lock, conn in zip(self._locks, self._connections):
+            with lock:
+                try:
+                    conn.send(("close",))
+                except (OSError, ValueError):
+                    pass
+                conn.close()
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._executor.shutdown()
+        self._connections = []
+        self._processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardedRetrieverService(RetrieverService):
+    """``RetrieverService`` that searches a ``ShardPool`` instead of a local store.
+
+    Keyword search and partitions need the whole corpus in one place, so this
+    mode uses vector search only. Workers reload their shard when it is
+    rebuilt; the service polls the shard versions every ``check_interval``
+    seconds and clears its answer cache when they change.
+    """
+
+    def __init__(self, pool, **kwargs):
+        kwargs.setdefault("lexical", False)
+        kwargs.setdefault("partitioned", False)
+        super().__init__(store_path=None, **kwargs)
+        self.pool = pool
+
+    @property
+    def store(self):
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return None
+        with self._lock:
+            self._checked = now
+            version = self.pool.versions()
+            if version != self._version:
+                self._version = version
+                self.on_reload()
+        return None
+
+    def search(
+        self, query, k=5, fetch_k=30, lambda_mult=0.1, embedding=None, partitions=None
+    ):
+        try:
+            if embedding is None:
+                embedding = self.embed_query(query)
+        except Exception as e:
+            raise Exception(f"Error loading FAISS store: {str(e)}")
+        try:
+            return self.pool.search([embedding], k, fetch_k, lambda_mult)[0]
+        except Exception as e:
+            raise Exception(f"Error during vector search: {str(e)}")
+
+    def search_many(self, queries, k=5, fetch_k=30, lambda_mult=0.1, embeddings=None):
+        if not queries:
+            return []
+        try:
+            if embeddings is None:
+                embeddings = self.embed_queries(queries)
+        except Exception as e:
+            raise Exception(f"Error loading FAISS store: {str(e)}")
+        try:
+            per_query = self.pool.search(embeddings, k, fetch_k, lambda_mult)
+        except Exception as e:
+            raise Exception(f"Error during vector search: {str(e)}")
+        best = {}
+        for results in per_query:
+            for doc, distance in results:
+                key = _doc_key(doc)
+                if key not in best or distance < best[key][1]:
+                    best[key] = (doc, distance)
+        return sorted(best.values(), key=lambda item: item[1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve one shard of a sharded FAISS store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve")
+    serve_parser.add_argument(
+        "--shard", required=True, help="shard directory, e.g. faiss_shards/shard_00"
+    )
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, required=True)
+    serve_parser.add_argument(
+        "--authkey",
+        default=os.environ.get("SHARD_AUTHKEY", ""),
+        help="shared secret clients must present (default: $SHARD_AUTHKEY); required",
+    )
+    args = parser.parse_args()
+    if not args.authkey:
+        parser.error("an authkey is required: pass --authkey or set SHARD_AUTHKEY")
+    _serve_listener(args.shard, (args.host, args.port), args.authkey.encode())
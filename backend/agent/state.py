@@ -1,7 +1,7 @@
 from typing import TypedDict, Annotated, Dict, Any, List
 
 # from langgraph.graph import add_messages
-from backend.agent.utils import add_messages_to_dict
+from backend.agent.utils import add_messages_to_dict, merge_dicts
 from langchain_core.messages import AnyMessage
 
 
@@ -10,3 +10,5 @@ class State(TypedDict):
     salesforce_case: Dict[str, Any]
     salesforce_cases: List[Dict[str, Any]]
     current_persona: str
+    # Per persona: rolling summary of the messages folded out of the window.
+    summary: Annotated[Dict[str, str], merge_dicts]
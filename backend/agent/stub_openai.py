@@ -0,0 +1,215 @@
+"""Local stand-in for the parts of the OpenAI HTTP API used by DineBot.
+
+Serves deterministic embeddings and chat completions (an echo of the last
+user message, optionally streamed) so index builds, benchmarks and the LLM
+gateway can run offline::
+
+    python -m backend.agent.stub_openai --port 8765 --latency 0.05
+
+and point clients at ``http://127.0.0.1:8765/v1``.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+def fake_embedding(text, dimensions=1536):
+    """Unit vector seeded from the text, so equal texts embed identically."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions)
+    return (vector / np.linalg.norm(vector)).astype(np.float32).tolist()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "StubOpenAI/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_events(self, events):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for event in events:
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # e.g. the losing copy of a hedged request
+
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        failure, delay = stub.take_request()
+        if failure:
+            body = {"error": {"message": "Rate limit reached", "type": "requests"}}
+            if stub.failure_status != 429:
+                body = {"error": {"message": "Server error", "type": "server_error"}}
+            self._send_json(stub.failure_status, body)
+            return
+        if delay:
+            time.sleep(delay)
+        path = self.path.rstrip("/")
+        if path.endswith("/embeddings"):
+            self._send_json(200, stub.embeddings(request))
+        elif path.endswith("/chat/completions"):
+            if request.get("stream"):
+                self._send_events(stub.chat_chunks(request))
+            else:
+                self._send_json(200, stub.chat_completion(request))
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+
+class StubOpenAIServer:
+    """Threaded HTTP server implementing ``POST /v1/embeddings`` and
+    ``POST /v1/chat/completions``.
+
+    ``latency`` adds a fixed delay per request, or ``delays`` one delay per
+    request in arrival order (then ``latency``), to exercise hedging.
+    ``failures`` makes the first N requests answer ``failure_status`` (429 by
+    default), to exercise client retries and circuit breaking.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        dimensions=1536,
+        latency=0.0,
+        failures=0,
+        failure_status=429,
+        delays=(),
+    ):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.failures = failures
+        self.failure_status = failure_status
+        self.delays = list(delays)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def take_request(self):
+        """``(fail, delay)`` for the next request."""
+        with self._lock:
+            self.requests += 1
+            if self.failures > 0:
+                self.failures -= 1
+                return True, 0.0
+            return False, self.delays.pop(0) if self.delays else self.latency
+
+    def reply(self, request):
+        messages = request.get("messages") or [{}]
+        content = messages[-1].get("content") or ""
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content)
+        return f"Echo: {content}"
+
+    def chat_completion(self, request):
+        content = self.reply(request)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", ""),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    def chat_chunks(self, request):
+        chunk = {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", ""),
+        }
+        words = self.reply(request).split(" ")
+        for i, word in enumerate(words):
+            delta = {"content": word if i == 0 else " " + word}
+            if i == 0:
+                delta["role"] = "assistant"
+            yield {**chunk, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+        yield {**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+
+    def embeddings(self, request):
+        inputs = request.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = request.get("dimensions") or self.dimensions
+        as_base64 = request.get("encoding_format") == "base64"
+        data = []
+        for i, text in enumerate(inputs):
+            embedding = fake_embedding(text, dimensions)
+            if as_base64:
+                # The openai SDK asks for base64 float32 by default, like the real API.
+                embedding = base64.b64encode(
+                    np.asarray(embedding, dtype=np.float32).tobytes()
+                ).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        return {
+            "object": "list",
+            "model": request.get("model", ""),
+            "data": data,
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    server = StubOpenAIServer(args.host, args.port, args.dimensions, args.latency)
+    print(f"Serving stub OpenAI API at {server.url}")
+    server._server.serve_forever()
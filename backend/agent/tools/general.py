@@ -1,20 +1,16 @@
 import requests
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool, tool
 import json
-from typing import Any, Dict
+from typing import Any, Dict, List
 from langchain_core.runnables import RunnableConfig
 import os
-from langchain_openai import ChatOpenAI
 from operator import itemgetter
 from langchain.schema.runnable import RunnableMap
 from langchain.schema import StrOutputParser
 from langchain.schema.runnable import RunnablePassthrough
 from langchain_core.prompts import ChatPromptTemplate
-from backend.agent.rag import load_faiss_store
+from backend.agent.retriever import get_retriever
 
-# from openai import OpenAI
-from langchain_openai import OpenAI, OpenAIEmbeddings
-from langchain.vectorstores import FAISS
 
 
 from dotenv import load_dotenv
@@ -66,8 +62,7 @@ def book_a_table(userquery: str, date: str, time: str) -> str:
     return f"Restaurant table has been booked for the requested party on {date} at {time}."
 
 
-@tool
-def answer_question(query: str):
+def _answer_question(query: str, config: RunnableConfig):
     """Fetches and returns information using RAG for user query for general purposes and searches.
 
     Args:
@@ -75,51 +70,44 @@ def answer_question(query: str):
     Returns:
         str: response of user query fetched through RAG
     """
-    token = os.environ.get("OPENAI_API_KEY")
-
-    llm = OpenAI()
-    embedding_model = OpenAIEmbeddings()
-
-    path = os.path.dirname(os.path.abspath(__file__)) + "/../"
-
-    # Added allow_dangerous_deserialization parameter
-    try:
-        db = FAISS.load_local(
-            path + "faiss_store/",
-            embedding_model,
-            allow_dangerous_deserialization=True,  # Add this line
-        )
-        query_embedding = embedding_model.embed_query(query)
-    except Exception as e:
-        raise Exception(f"Error loading FAISS store: {str(e)}")
-
-    try:
-        docs = db.max_marginal_relevance_search_with_score_by_vector(
-            embedding=query_embedding, k=5, fetch_k=30, lambda_mult=0.1
-        )
-    except Exception as e:
-        raise Exception(f"Error during vector search: {str(e)}")
-
-    docs.sort(key=lambda x: x[1], reverse=True)
-    context = "\n\n".join([doc[0].page_content for doc in docs])
-
-    template = [
-        (
-            "system",
-            "Use the following context to answer the question at the end."
-            " Process the context by removing any special characters that might be from a Markdown or other files."
-            " If you don't know the answer, just say that you don't know, don't try to make up an answer."
-            "\nContext:\n"
-            "{context}",
-        ),
-        ("user", "Question: {question}" "\nHelpful Answer:"),
-    ]
-
-    rag_prompt_custom = ChatPromptTemplate.from_messages(template)
-    chain = rag_prompt_custom | llm
-
-    try:
-        response = chain.invoke({"context": context, "question": query})
-        return response
-    except Exception as e:
-        raise Exception(f"Error generating response: {str(e)}")
+    # The retriever keeps the store, clients and prompt warm across calls.
+    # Passing the config on lets the graph stream the generated tokens.
+    return get_retriever().answer(query, config=config)
+
+
+async def _aanswer_question(query: str, config: RunnableConfig):
+    return await get_retriever().aanswer(query, config=config)
+
+
+def _answer_compound_question(question: str, sub_queries: List[str], config: RunnableConfig):
+    """Answers a question that spans several restaurants or topics using RAG in one pass.
+
+    Use this instead of calling answer_question repeatedly, e.g. for
+    "compare the brunch menus and parking at A, B and C".
+
+    Args:
+        question (str): The user's full question
+        sub_queries (List[str]): One focused search query per restaurant/topic,
+            e.g. ["brunch menu at A", "parking at A", "brunch menu at B", ...]
+    Returns:
+        str: response to the question, generated from the merged context of all sub-queries
+    """
+    return get_retriever().answer_many(sub_queries, question=question, config=config)
+
+
+async def _aanswer_compound_question(
+    question: str, sub_queries: List[str], config: RunnableConfig
+):
+    return await get_retriever().aanswer_many(sub_queries, question=question, config=config)
+
+
+# The RAG tools have async versions, so graph.ainvoke/astream wait on the
+# embeddings and LLM requests without a thread per call.
+answer_question = StructuredTool.from_function(
+    func=_answer_question, coroutine=_aanswer_question, name="answer_question"
+)
+answer_compound_question = StructuredTool.from_function(
+    func=_answer_compound_question,
+    coroutine=_aanswer_compound_question,
+    name="answer_compound_question",
+)
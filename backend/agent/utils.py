@@ -1,5 +1,6 @@
 from langchain_core.messages import ToolMessage
 from langchain_core.runnables import RunnableLambda
+from backend.agent.message_log import as_message_log
 from backend.agent.nodes.tool_node import ToolNode
 from langgraph.graph import add_messages
 from typing import Union
@@ -35,23 +36,24 @@ Messages = Union[list[MessageLikeRepresentation], MessageLikeRepresentation]
 
 
 def add_messages_to_dict(left: Messages, right: Messages) -> Messages:
-    left_messages = left
-    right_messages = right
-    dict_key = None
+    """Reducer for the per-persona ``messages`` dict.
+
+    Each persona's messages are a ``MessageLog``, so an update costs
+    O(new messages) instead of O(history). ``left`` is not modified: the
+    result is a new dict sharing the untouched personas' logs.
+    """
     if isinstance(right, dict):
-        for dict_key in right:
-            right_messages = right[dict_key]
-            left_messages = left.get(dict_key, [])
-            if not isinstance(right_messages, list):
-                right_messages = [right_messages]
-            if not isinstance(left_messages, list):
-                left_messages = [left_messages]
-            merged = add_messages(left_messages, right_messages)
-            left[dict_key] = merged
-        return left
+        merged = dict(left or {})
+        for dict_key, right_messages in right.items():
+            merged[dict_key] = as_message_log(merged.get(dict_key)).extend(right_messages)
+        return merged
     return add_messages(left, right)
 
 
+def merge_dicts(left: dict, right: dict) -> dict:
+    return {**(left or {}), **(right or {})}
+
+
 def _print_event(event: dict, _printed: set, max_length=1500):
     current_state = event.get("current_persona")
     message = event.get("messages")
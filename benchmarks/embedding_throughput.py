@@ -0,0 +1,45 @@
+"""Embedding throughput of BatchEmbeddings against the local stub server.
+
+    python -m benchmarks.embedding_throughput --chunks 2000 --latency 0.1
+"""
+
+import argparse
+import json
+
+from backend.agent.embeddings import BatchEmbeddings
+from backend.agent.stub_openai import StubOpenAIServer
+
+
+def run(chunks, batch_size, workers, latency, dimensions=1536):
+    texts = [f"Restaurant review #{i}: great brunch, easy parking." for i in range(chunks)]
+    results = []
+    with StubOpenAIServer(dimensions=dimensions, latency=latency) as server:
+        for max_workers in sorted({1, workers}):
+            embeddings = BatchEmbeddings(
+                batch_size=batch_size,
+                max_workers=max_workers,
+                api_key="stub",
+                base_url=server.url,
+            )
+            embeddings.embed_documents(texts)
+            results.append(
+                {
+                    "workers": max_workers,
+                    "batch_size": batch_size,
+                    "chunks": chunks,
+                    "requests": embeddings.stats["requests"],
+                    "seconds": round(embeddings.stats["seconds"], 3),
+                    "chunks_per_sec": round(embeddings.throughput, 1),
+                }
+            )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.1)
+    args = parser.parse_args()
+    print(json.dumps(run(args.chunks, args.batch_size, args.workers, args.latency), indent=2))
@@ -0,0 +1,93 @@
+"""Cold-start benchmark: how long a fresh process takes to import the agent.
+
+Each run imports ``backend.agent.graph`` in a new interpreter and reports
+the median and worst wall time, the slowest modules (from ``-X importtime``)
+and whether any of the modules that should load lazily (faiss, the OpenAI
+SDK) were imported::
+
+    python -m benchmarks.import_time --runs 10 --budget 1.0
+
+Exits non-zero if the median exceeds ``--budget`` seconds or a lazy module
+was imported.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_MODULES = ("faiss", "openai", "langchain_openai", "langchain_community")
+
+_PROBE = (
+    "import json, sys, time\n"
+    "start = time.perf_counter()\n"
+    "import {module}\n"
+    "seconds = time.perf_counter() - start\n"
+    "lazy = [m for m in {lazy!r} if m in sys.modules]\n"
+    "print(json.dumps({{'seconds': seconds, 'lazy_imported': lazy}}))\n"
+)
+
+
+def _run(module, extra_args=()):
+    code = _PROBE.format(module=module, lazy=LAZY_MODULES)
+    result = subprocess.run(
+        [sys.executable, *extra_args, "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_modules(module, top=10):
+    """``(cumulative seconds, name)`` of the slowest imports ``module`` makes."""
+    _, stderr = _run(module, ("-X", "importtime"))
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # Modules imported by the probe are indented by one space, the ones
+        # they import by two more.
+        if len(name) - len(name.lstrip(" ")) == 3:
+            rows.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def run(module="backend.agent.graph", runs=5):
+    # The first run also writes bytecode caches; it is not counted.
+    _run(module)
+    samples = [_run(module)[0] for _ in range(runs)]
+    seconds = [sample["seconds"] for sample in samples]
+    return {
+        "module": module,
+        "runs": runs,
+        "median_s": round(statistics.median(seconds), 3),
+        "max_s": round(max(seconds), 3),
+        "lazy_imported": sorted({m for s in samples for m in s["lazy_imported"]}),
+        "slowest": [
+            {"module": name, "seconds": round(s, 3)} for s, name in slowest_modules(module)
+        ],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold-start import benchmark.")
+    parser.add_argument("--module", default="backend.agent.graph")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1.0, help="max median seconds")
+    args = parser.parse_args()
+
+    results = run(args.module, args.runs)
+    print(json.dumps(results, indent=2))
+    if results["lazy_imported"]:
+        sys.exit(f"Imported eagerly: {', '.join(results['lazy_imported'])}")
+    if results["median_s"] > args.budget:
+        sys.exit(f"Median import time {results['median_s']}s is over {args.budget}s")
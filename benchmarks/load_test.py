@@ -0,0 +1,270 @@
+"""Concurrent load test of the agent graph, offline.
+
+Runs ``sessions`` conversations at once (one ``thread_id`` each, on a pool
+of threads), each through a multi-turn scenario driven with
+``graph.stream``:
+
+1. small talk (no tool);
+2. a restaurant question (``answer_question`` over a synthetic RAG store);
+3. a table booking (safe tool);
+4. a cab booking (sensitive tool): the graph interrupts, and the session
+   approves and resumes it, or with ``deny_every`` denies it the way
+   ``test_agent.py`` does, answering the tool call with a ``ToolMessage``
+   (``dinebot_app.py`` resumes with ``None`` on deny too, so its denials
+   cost the same as an approval here);
+5. a goodbye.
+
+``ScriptedChatModel`` and ``BagOfWordsEmbeddings`` stand in for OpenAI, so
+the numbers are the graph's and the checkpointer's own cost (plus
+``--latency`` seconds per model call, if set). Reports turns/sec, turn and
+per-node latency percentiles, checkpointer call latency and memory growth
+(RSS after each round of sessions)::
+
+    python -m benchmarks.load_test --sessions 32 --rounds 3 --checkpointer sqlite
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from backend.agent import rag
+from backend.agent.checkpoint import SQLiteCheckpointSaver
+from backend.agent.context import ContextBuilder
+from backend.agent.fakes import BagOfWordsEmbeddings, ScriptedChatModel
+from backend.agent.graph import build_graph
+from backend.agent.retriever import RetrieverService, set_retriever
+from benchmarks.rag_benchmark import percentiles, write_corpus
+
+
+PERSONA = "General Agent"
+SCENARIO = (
+    "Hi DineBot!",
+    "What are the hours at {name}?",
+    "Book a table at {name} for 4 people on 2024-06-15 at 7pm",
+    "Book a cab from {name} at 6:30pm for 4 passengers",
+    "Thanks, that's all.",
+)
+CHECKPOINTER_CALLS = ("get_tuple", "put", "put_writes")
+
+
+def rss_mb():
+    """Current resident set size (peak RSS where /proc is not available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def time_checkpointer(saver, timings):
+    """Records the duration of the saver's sync calls in ``timings``."""
+
+    def timed(name, call):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return call(*args, **kwargs)
+            finally:
+                timings[name].append(time.perf_counter() - start)
+
+        return wrapper
+
+    for name in CHECKPOINTER_CALLS:
+        setattr(saver, name, timed(name, getattr(saver, name)))
+    return saver
+
+
+def _stream(graph, inputs, config, nodes):
+    # With stream_mode="updates" each event is one finished step, so the time
+    # since the previous event is that node's latency (checkpoint included).
+    last = time.perf_counter()
+    for update in graph.stream(inputs, config, stream_mode="updates"):
+        now = time.perf_counter()
+        for node in update:
+            if not node.startswith("__"):
+                nodes[node].append(now - last)
+        last = now
+
+
+def run_session(graph, thread_id, name, approve):
+    """One conversation; returns its turn latencies, node latencies and interrupts."""
+    config = {"configurable": {"thread_id": thread_id}}
+    turns, nodes, interrupts = [], defaultdict(list), 0
+    for template in SCENARIO:
+        start = time.perf_counter()
+        inputs = {
+            "messages": {PERSONA: [("user", template.format(name=name))]},
+            "current_persona": PERSONA,
+        }
+        _stream(graph, inputs, config, nodes)
+        snapshot = graph.get_state(config)
+        while snapshot.next:
+            interrupts += 1
+            if approve:
+                inputs = None
+            else:
+                # Denial as in test_agent.py, not the app (which resumes with None).
+                call = snapshot.values["messages"][PERSONA][-1].tool_calls[0]
+                inputs = {
+                    "messages": {
+                        PERSONA: [
+                            ToolMessage(
+                                tool_call_id=call["id"],
+                                content="API call denied by user. Reasoning: 'not today'.",
+                            )
+                        ]
+                    }
+                }
+            _stream(graph, inputs, config, nodes)
+            snapshot = graph.get_state(config)
+        turns.append(time.perf_counter() - start)
+    reply = graph.get_state(config).values["messages"][PERSONA][-1]
+    assert reply.content.startswith("Happy to help"), reply.content
+    return turns, nodes, interrupts
+
+
+def build_store(directory, restaurants, dimensions):
+    names = write_corpus(os.path.join(directory, "rag_datasets"), restaurants, per_file=10)
+    store_path = os.path.join(directory, "faiss_store")
+    embeddings = BagOfWordsEmbeddings(size=dimensions)
+    rag.create_faiss_store(
+        rag.populate_vector_db(os.path.join(directory, "rag_datasets")),
+        llm=None,
+        store_path=store_path,
+        embedding_size=dimensions,
+        manifest=rag.load_manifest(store_path),
+        embeddings=embeddings,
+    )
+    return names, store_path, embeddings
+
+
+def _timing_report(timings):
+    return {
+        name: {"count": len(values), **percentiles(values)}
+        for name, values in sorted(timings.items())
+        if values
+    }
+
+
+def run(
+    sessions=16,
+    rounds=3,
+    checkpointer="sqlite",
+    latency=0.0,
+    deny_every=4,
+    restaurants=50,
+    dimensions=64,
+    seed=0,
+    workdir=None,
+):
+    config = {
+        "sessions": sessions,
+        "rounds": rounds,
+        "checkpointer": checkpointer,
+        "latency": latency,
+        "deny_every": deny_every,
+        "restaurants": restaurants,
+        "turns_per_session": len(SCENARIO),
+    }
+    tmp = tempfile.mkdtemp(prefix="load_test_", dir=workdir)
+    try:
+        names, store_path, embeddings = build_store(tmp, restaurants, dimensions)
+        llm = ScriptedChatModel(latency=latency)
+        set_retriever(
+            RetrieverService(
+                store_path,
+                embeddings=embeddings,
+                llm=llm,
+                context_builder=ContextBuilder(verbose=False),
+            )
+        )
+        if checkpointer == "sqlite":
+            saver = SQLiteCheckpointSaver(os.path.join(tmp, "checkpoints.sqlite3"))
+        else:
+            saver = MemorySaver()
+        saver_timings = defaultdict(list)
+        # verbose=False keeps the graph's and retriever's progress out of the report.
+        graph = build_graph(
+            llm=llm, checkpointer=time_checkpointer(saver, saver_timings), verbose=False
+        )
+        rng = random.Random(seed)
+
+        turns, nodes, interrupts = [], defaultdict(list), 0
+        memory = [round(rss_mb(), 1)]
+        seconds = 0.0
+        with ThreadPoolExecutor(max_workers=sessions) as executor:
+            for r in range(rounds):
+                start = time.perf_counter()
+                futures = [
+                    executor.submit(
+                        run_session,
+                        graph,
+                        f"load-{r}-{i}",
+                        rng.choice(names),
+                        not deny_every or (i + 1) % deny_every != 0,
+                    )
+                    for i in range(sessions)
+                ]
+                for future in futures:
+                    session_turns, session_nodes, session_interrupts = future.result()
+                    turns += session_turns
+                    interrupts += session_interrupts
+                    for node, values in session_nodes.items():
+                        nodes[node] += values
+                seconds += time.perf_counter() - start
+                gc.collect()
+                memory.append(round(rss_mb(), 1))
+        saver_stats = saver.stats() if hasattr(saver, "stats") else None
+    finally:
+        set_retriever(None)
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        "config": config,
+        "turns": len(turns),
+        "interrupts": interrupts,
+        "seconds": round(seconds, 3),
+        "turns_per_sec": round(len(turns) / seconds, 1),
+        "turn_latency": percentiles(turns),
+        "nodes": _timing_report(nodes),
+        "checkpointer_calls": _timing_report(saver_timings),
+        "checkpointer_stats": saver_stats,
+        "memory": {
+            "rss_mb_per_round": memory,
+            "growth_mb": round(memory[-1] - memory[1], 1) if rounds > 1 else 0.0,
+            "first_round_mb": round(memory[1] - memory[0], 1),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent agent graph load test.")
+    parser.add_argument("--sessions", type=int, default=16, help="concurrent thread_ids")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--checkpointer", choices=("sqlite", "memory"), default="sqlite")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per model call")
+    parser.add_argument("--deny-every", type=int, default=4, help="every Nth session denies")
+    parser.add_argument("--restaurants", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = run(
+        sessions=args.sessions,
+        rounds=args.rounds,
+        checkpointer=args.checkpointer,
+        latency=args.latency,
+        deny_every=args.deny_every,
+        restaurants=args.restaurants,
+        seed=args.seed,
+    )
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,111 @@
+"""Microbenchmark for the per-persona ``messages`` reducer.
+
+Compares the previous reducer (langgraph's ``add_messages`` over each
+persona's full list) with ``add_messages_to_dict`` on ``MessageLog`` at 10,
+100 and 1000 messages per thread. For each size it reports:
+
+* ``append_us``: one state update appending a message to the latest state
+  (a node's output);
+* ``replace_us``: one update replacing a message by id;
+* ``versions_kib``: memory held by every intermediate state of a thread
+  grown to that size, as the checkpointer and ``stream_mode="values"``
+  keep them::
+
+    python -m benchmarks.message_log --sizes 10 100 1000
+"""
+
+import argparse
+import json
+import timeit
+import tracemalloc
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import add_messages
+
+from backend.agent.utils import add_messages_to_dict
+
+
+PERSONA = "General Agent"
+
+
+def list_reducer(left, right):
+    """The reducer before ``MessageLog``: ``add_messages`` on every update."""
+    merged = dict(left)
+    for key, messages in right.items():
+        merged[key] = add_messages(merged.get(key, []), messages)
+    return merged
+
+
+REDUCERS = {"add_messages": list_reducer, "message_log": add_messages_to_dict}
+
+
+def _message(i):
+    cls = HumanMessage if i % 2 == 0 else AIMessage
+    return cls(f"message {i} " + "x" * 200, id=f"m{i}")
+
+
+def _grow(reducer, size):
+    """Every state version of a thread grown one message at a time."""
+    versions = [{}]
+    for i in range(size):
+        versions.append(reducer(versions[-1], {PERSONA: [_message(i)]}))
+    return versions
+
+
+def _timed(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def _append_us(reducer, size, number):
+    # Each update extends the latest state, as consecutive graph steps do.
+    best = None
+    for _ in range(5):
+        state = _grow(reducer, size)[-1]
+        updates = [{PERSONA: [AIMessage("new", id=f"new{i}")]} for i in range(number)]
+        start = timeit.default_timer()
+        for update in updates:
+            state = reducer(state, update)
+        elapsed = timeit.default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / number * 1e6
+
+
+def bench(reducer, size, number=100):
+    state = _grow(reducer, size)[-1]
+    replacement = AIMessage("edited", id=f"m{size - 1}")
+    append_us = _append_us(reducer, size, number)
+    replace_us = _timed(lambda: reducer(state, {PERSONA: [replacement]}), number)
+
+    messages = [_message(i) for i in range(size)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    versions = [{}]
+    for message in messages:
+        versions.append(reducer(versions[-1], {PERSONA: [message]}))
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return {
+        "append_us": round(append_us, 1),
+        "replace_us": round(replace_us, 1),
+        "versions_kib": round(held / 1024, 1),
+    }
+
+
+def run(sizes=(10, 100, 1000)):
+    results = []
+    for size in sizes:
+        row = {"messages": size}
+        for name, reducer in REDUCERS.items():
+            row[name] = bench(reducer, size)
+        row["append_speedup"] = round(
+            row["add_messages"]["append_us"] / row["message_log"]["append_us"], 1
+        )
+        results.append(row)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Messages reducer microbenchmark.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+    print(json.dumps(run(args.sizes), indent=2))
@@ -0,0 +1,288 @@
+"""Offline benchmark of the RAG retrieval path on a synthetic restaurant corpus.
+
+Measures ``populate_vector_db`` throughput, ``create_faiss_store`` build time
+and memory, and retrieval latency (p50/p95/p99) and recall@k of the
+``answer_question`` retriever, with ``BagOfWordsEmbeddings`` in place of the
+embeddings API, so no network or API key is needed:
+
+    python -m benchmarks.rag_benchmark --restaurants 2000 --queries 300
+
+Results are printed and written as JSON (``--output``, by default under
+``benchmarks/results/``) so runs can be compared.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import faiss
+import numpy as np
+
+from backend.agent import rag
+from backend.agent.fakes import BagOfWordsEmbeddings
+from backend.agent.retriever import RetrieverService
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+_ADJECTIVES = (
+    "Golden Rustic Blue Copper Silver Smoky Crimson Humble Velvet Wild Little Urban "
+    "Lucky Brass Salty Olive Cedar Maple Harbor Midnight Sunny Iron Juniper Saffron "
+    "Ember Willow Coastal Quiet Hidden Northern"
+).split()
+_NOUNS = (
+    "Fork Spoon Kettle Table Lantern Barrel Garden Hearth Skillet Pantry Orchard Anchor "
+    "Oven Griddle Ladle Vine Market Harvest Porch Cellar Mill Wharf Basil Pepper Fig "
+    "Acorn Thistle Clover Magnolia Sparrow"
+).split()
+_KINDS = "Kitchen Bistro Grill Cafe Eatery Tavern".split()
+_STYLES = "Southern Korean Italian Mexican Thai Japanese Indian Mediterranean Seafood BBQ".split()
+_DISHES = {
+    "Southern": ["Fried Chicken Platter", "Shrimp & Grits", "Buttermilk Biscuits"],
+    "Korean": ["Bulgogi Bowl", "Kimchi Fried Rice", "Bibimbap"],
+    "Italian": ["Margherita Pizza", "Lasagna", "Cacio e Pepe"],
+    "Mexican": ["Carnitas Tacos", "Mole Enchiladas", "Elote"],
+    "Thai": ["Pad Thai", "Green Curry", "Tom Yum Soup"],
+    "Japanese": ["Salmon Nigiri", "Tonkotsu Ramen", "Chicken Katsu"],
+    "Indian": ["Butter Chicken", "Lamb Biryani", "Palak Paneer"],
+    "Mediterranean": ["Falafel Plate", "Lamb Gyro", "Hummus Trio"],
+    "Seafood": ["Lobster Roll", "Fish Tacos", "Oyster Platter"],
+    "BBQ": ["Brisket Plate", "Pulled Pork Sandwich", "Smoked Ribs"],
+}
+_NEIGHBORHOODS = ["NoDa", "South End", "Plaza Midwood", "Dilworth", "Uptown", "Elizabeth"]
+_QUESTIONS = (
+    "What are the hours at {name}?",
+    "Does {name} take reservations?",
+    "What are the popular dishes at {name}?",
+    "Where is {name} located?",
+)
+
+
+def restaurant_names(count, seed=0):
+    base = [f"{a} {n} {k}" for a in _ADJECTIVES for n in _NOUNS for k in _KINDS]
+    random.Random(seed).shuffle(base)
+    names = list(base)
+    while len(names) < count:
+        names += [f"{name} {len(names) // len(base) + 1}" for name in base]
+    return names[:count]
+
+
+def restaurant_section(name, rng):
+    style = rng.choice(_STYLES)
+    hood = rng.choice(_NEIGHBORHOODS)
+    dishes = rng.sample(_DISHES[style], 2)
+    opens, closes = rng.randint(7, 12), rng.randint(8, 11)
+    prices = rng.randint(9, 30), rng.randint(9, 30)
+    street = f"{rng.randint(100, 9999)} {rng.choice(_NOUNS)} Street"
+    return (
+        f"## {name}\n"
+        f"Location: {street}, Charlotte, NC 282{rng.randint(0, 99):02d}\n"
+        f"Style: {style}\n"
+        f"Price Range: {'$' * rng.randint(1, 4)}\n"
+        f"Hours: Mon-Sun {opens}am-{closes}pm\n"
+        f"Reservations: {rng.choice(['Accepted', 'Walk-ins only', 'Available online'])}\n"
+        f"Popular Dishes: {dishes[0]} (${prices[0]}.99), {dishes[1]} (${prices[1]}.99)\n"
+        f"Details: Located in {hood}, {name} serves {style.lower()} food in a "
+        f"{rng.choice(['cozy', 'lively', 'modern', 'rustic'])} dining room.\n"
+    )
+
+
+def write_corpus(directory, restaurants=1000, per_file=25, seed=0):
+    """Writes a markdown corpus of ``restaurants`` sections; returns the names."""
+    rng = random.Random(seed)
+    names = restaurant_names(restaurants, seed)
+    os.makedirs(directory, exist_ok=True)
+    for start in range(0, len(names), per_file):
+        sections = [restaurant_section(name, rng) for name in names[start : start + per_file]]
+        with open(os.path.join(directory, f"restaurants_{start // per_file:04d}.md"), "w") as f:
+            f.write("Charlotte Restaurants Knowledge Base\n" + "".join(sections))
+    return names
+
+
+def percentiles(values):
+    values = np.asarray(values) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+    }
+
+
+def _dir_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(path)
+        for name in files
+    )
+
+
+def bench_populate(directory, workers):
+    start = time.perf_counter()
+    documents = rag.populate_vector_db(directory, workers=workers)
+    seconds = time.perf_counter() - start
+    size = sum(len(doc.page_content.encode("utf-8")) for doc in documents)
+    return documents, {
+        "chunks": len(documents),
+        "seconds": round(seconds, 3),
+        "chunks_per_sec": round(len(documents) / seconds, 1),
+        "mb_per_sec": round(size / seconds / 1e6, 3),
+    }
+
+
+def _build(documents, store_path, embeddings, index_type, batch_size):
+    rag.create_faiss_store(
+        documents,
+        llm=None,
+        store_path=store_path,
+        embedding_size=embeddings.size,
+        manifest=rag.load_manifest(store_path),
+        batch_size=batch_size,
+        embeddings=embeddings,
+        index_type=index_type,
+    )
+
+
+def bench_build(documents, store_path, embeddings, index_type, batch_size):
+    """Build time, then peak memory from a second build traced separately.
+
+    tracemalloc slows allocation-heavy code severalfold, so the timed build
+    runs without it.
+    """
+    start = time.perf_counter()
+    _build(documents, store_path, embeddings, index_type, batch_size)
+    seconds = time.perf_counter() - start
+    traced_path = store_path.rstrip(os.sep) + "_traced"
+    tracemalloc.start()
+    try:
+        _build(documents, traced_path, embeddings, index_type, batch_size)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        shutil.rmtree(traced_path, ignore_errors=True)
+    return {
+        "index_type": index_type,
+        "seconds": round(seconds, 3),
+        "chunks_per_sec": round(len(documents) / seconds, 1),
+        "python_peak_mb": round(peak / 1e6, 2),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "store_mb": round(_dir_size(store_path) / 1e6, 3),
+    }
+
+
+def bench_retrieval(retriever, queries, k):
+    latencies = []
+    hits = 0
+    for query, name in queries:
+        start = time.perf_counter()
+        docs, _, _ = retriever.retrieve(query, k=k)
+        latencies.append(time.perf_counter() - start)
+        hits += any(name in doc.page_content for doc, _ in docs[:k])
+    return {
+        "queries": len(queries),
+        **percentiles(latencies),
+        f"recall@{k}": round(hits / len(queries), 4),
+        "lexical_fast_path": retriever.lexical_stats["fast_path"],
+    }
+
+
+def run(
+    restaurants=1000,
+    per_file=25,
+    queries=200,
+    k=5,
+    dimensions=256,
+    index_type="flat",
+    workers=1,
+    batch_size=512,
+    seed=0,
+    workdir=None,
+):
+    config = {
+        "restaurants": restaurants,
+        "per_file": per_file,
+        "queries": queries,
+        "k": k,
+        "dimensions": dimensions,
+        "index_type": index_type,
+        "workers": workers,
+        "seed": seed,
+    }
+    tmp = tempfile.mkdtemp(prefix="rag_benchmark_", dir=workdir)
+    try:
+        directory = os.path.join(tmp, "rag_datasets")
+        names = write_corpus(directory, restaurants, per_file, seed)
+        documents, populate = bench_populate(directory, workers)
+        store_path = os.path.join(tmp, "faiss_store")
+        embeddings = BagOfWordsEmbeddings(size=dimensions)
+        build = bench_build(documents, store_path, embeddings, index_type, batch_size)
+
+        rng = random.Random(seed)
+        picked = [rng.choice(names) for _ in range(queries)]
+        query_set = [(rng.choice(_QUESTIONS).format(name=name), name) for name in picked]
+        retrieval = {}
+        for mode, options in (
+            ("vector", {"lexical": False, "partitioned": False}),
+            ("hybrid", {}),
+        ):
+            retriever = RetrieverService(store_path, embeddings=embeddings, **options)
+            retriever.store
+            retrieval[mode] = bench_retrieval(retriever, query_set, k)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        "config": config,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "faiss": faiss.__version__,
+            "cpus": os.cpu_count(),
+        },
+        "populate": populate,
+        "build": build,
+        "retrieval": retrieval,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline RAG retrieval benchmark.")
+    parser.add_argument("--restaurants", type=int, default=1000)
+    parser.add_argument("--per-file", type=int, default=25)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--index-type", default="flat")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output", help="JSON file to write (default: benchmarks/results/<time>.json)"
+    )
+    args = parser.parse_args()
+
+    results = run(
+        restaurants=args.restaurants,
+        per_file=args.per_file,
+        queries=args.queries,
+        k=args.k,
+        dimensions=args.dim,
+        index_type=args.index_type,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        seed=args.seed,
+    )
+    output = args.output or os.path.join(
+        RESULTS_DIR, time.strftime("rag_benchmark-%Y%m%d-%H%M%S.json")
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Wrote {output}")
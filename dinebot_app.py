@@ -1,8 +1,8 @@
 import re
 import streamlit as st
-from backend.agent.graph import graph
+from backend.agent.graph import get_graph
 from backend.agent.utils import _print_event
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk
 from langchain.callbacks.base import BaseCallbackHandler
 from langchain_core.output_parsers import StrOutputParser
 from langchain.schema import ChatMessage
@@ -11,16 +11,6 @@ from dotenv import load_dotenv
 import os
 from langgraph.pregel.io import AddableValuesDict
 
-# Initialize unique thread ID for the session
-thread_id = str(uuid.uuid4())
-
-# Configuration dictionary
-config = {
-    "configurable": {
-        "thread_id": thread_id,
-    }
-}
-
 # Set to track printed events
 _printed = set()
 
@@ -33,13 +23,43 @@ class StreamHandler(BaseCallbackHandler):
         self.text += token
         self.container.markdown(self.text)
 
-def get_conversation_history():
-    history = []
-    for msg in st.session_state.messages:
-        if isinstance(msg, ChatMessage):
-            role = "You" if msg.role == "user" else "Dinebot"
-            history.append(f"{role}: {msg.content}")
-    return "\n".join(history)
+def stream_response(graph_input, container):
+    """Runs the graph, rendering LLM tokens in ``container`` as they arrive.
+
+    Uses the graph's "messages" stream mode for tokens (the RAG answer, then
+    the assistant's reply, each replacing the previous one) and "values" for
+    state. Returns the final assistant reply, or None if the run ended
+    without one (e.g. at an approval interrupt).
+    """
+    handler = None
+    message_id = None
+    state = None
+    for mode, chunk in graph.stream(graph_input, config, stream_mode=["messages", "values"]):
+        if mode == "values":
+            _print_event(chunk, _printed)
+            state = chunk
+            continue
+        message, metadata = chunk
+        if not isinstance(message, AIMessageChunk) or not isinstance(message.content, str):
+            continue
+        if not message.content:
+            continue
+        if message.id != message_id:
+            message_id = message.id
+            handler = StreamHandler(container)
+        handler.on_llm_new_token(message.content)
+
+    if not isinstance(state, dict):
+        return None
+    current_persona = state.get("current_persona", "General Agent")
+    persona_messages = state.get("messages", {}).get(current_persona, [])
+    if persona_messages and isinstance(persona_messages[-1], AIMessage):
+        content = persona_messages[-1].content
+        if isinstance(content, str) and content.strip():
+            container.markdown(content)
+            return content
+    container.empty()
+    return None
 
 # Load environment variables
 load_dotenv()
@@ -61,8 +81,23 @@ else:
     st.sidebar.info("Go to the 'Configuration' section in the sidebar to enter your API Key.")
     st.markdown("<h3 style='color:red;'>Enter your OpenAI API Key🔑 to unlock your restaurant assistant!</h3>", unsafe_allow_html=True)
     st.stop()
-    
-    
+
+# Built once per process (not on every rerun), now that the API key is set.
+graph = get_graph()
+
+# One checkpointed thread per conversation. It is kept across reruns, and in
+# the URL, so a reload or restarted server resumes it, pending approvals included.
+if "thread_id" not in st.session_state:
+    st.session_state["thread_id"] = st.query_params.get("thread") or str(uuid.uuid4())
+    st.query_params["thread"] = st.session_state["thread_id"]
+
+# Configuration dictionary
+config = {
+    "configurable": {
+        "thread_id": st.session_state["thread_id"],
+    }
+}
+
 st.title("🍽️ Welcome to Charlotte Eatz")
 st.markdown(
     "<h2>  Hi! Nice to meet you, I am Dinebot 🤖</h2>",
@@ -90,38 +125,15 @@ if prompt := st.chat_input():
     st.session_state.messages.append(ChatMessage(role="user", content=prompt))
     st.chat_message("user").write(prompt)
 
-    # Prepare chat history for the agent
-    conversation_history = get_conversation_history()
-
-    # Call the agent with user input
-    response = graph.stream(
-        {"messages": {"General Agent": ("user", conversation_history)}, "current_persona": "General Agent"},
-        config,
-        stream_mode="values",
-    )
-
-    # Process the events and display them
-    for event in response:
-        _print_event(event, _printed)
-        if isinstance(event, dict):
-            messages = event.get("messages", {})
-            current_persona = event.get("current_persona", "General Agent")
-            persona_messages = messages.get(current_persona, [])
-
-            # Find the most recent AIMessage with non-empty content
-            recent_ai_message_content = None
-            for msg in reversed(persona_messages):
-                if isinstance(msg, AIMessage) and msg.content.strip():
-                    recent_ai_message_content = msg.content
-                    break
-
-            # Check if a recent AI message content was found and display it
-            if recent_ai_message_content:
-                st.session_state.messages.append(ChatMessage(role="assistant", content=recent_ai_message_content))
-
-    # Display the latest assistant message
-    if st.session_state.messages[-1].role == "assistant":
-        st.chat_message("assistant").write(st.session_state.messages[-1].content)
+    # Send only the new turn: the thread's checkpoint already holds the
+    # conversation (recent messages plus a rolling summary of older ones).
+    with st.chat_message("assistant"):
+        reply = stream_response(
+            {"messages": {"General Agent": ("user", prompt)}, "current_persona": "General Agent"},
+            st.empty(),
+        )
+    if reply:
+        st.session_state.messages.append(ChatMessage(role="assistant", content=reply))
 
     # Interrupt Handling
     snapshot = graph.get_state(config)
@@ -148,34 +160,11 @@ if prompt := st.chat_input():
             st.session_state["interrupt_processed"] = True
             st.write("Approval processed, continuing with the agent.")
 
-            # Execute the approved action
-            result = graph.invoke(None, config)
-
-            # Process the result and continue the conversation
-            conversation_history = get_conversation_history()
-            response = graph.stream(
-                {"messages": {"General Agent": ("user", conversation_history)}, "current_persona": "General Agent"},
-                config,
-                stream_mode="values",
-            )
-
-            new_messages = []
-            for event in response:
-                _print_event(event, _printed)
-                if isinstance(event, dict):
-                    messages = event.get("messages", {})
-                    current_persona = event.get("current_persona", "General Agent")
-                    persona_messages = messages.get(current_persona, [])
-
-                    for msg in persona_messages:
-                        if isinstance(msg, AIMessage) and msg.content.strip():
-                            new_messages.append(msg.content)
-
-            # Combine all new messages into a single response
-            if new_messages:
-                combined_response = " ".join(new_messages)
-                st.session_state.messages.append(ChatMessage(role="assistant", content=combined_response))
-                st.chat_message("assistant").write(combined_response)
+            # Execute the approved action; the resumed run streams the reply
+            with st.chat_message("assistant"):
+                reply = stream_response(None, st.empty())
+            if reply:
+                st.session_state.messages.append(ChatMessage(role="assistant", content=reply))
 
             # Reset interrupt flags
             st.session_state["waiting_for_approval"] = False
@@ -192,32 +181,16 @@ if prompt := st.chat_input():
             if st.session_state.messages and st.session_state.messages[-1].role == "assistant":
                 st.session_state.messages.pop()
 
-            # Instead of sending a message, we'll just invoke the graph with None
+            # Instead of sending a message, we'll just resume the graph with None
             # This should trigger the graph to handle the denial internally
-            result = graph.invoke(None, config)
-
-            new_messages = []
-            for event in response:
-                _print_event(event, _printed)
-                if isinstance(event, dict):
-                    messages = event.get("messages", {})
-                    current_persona = event.get("current_persona", "General Agent")
-                    persona_messages = messages.get(current_persona, [])
-
-                    for msg in persona_messages:
-                        if isinstance(msg, AIMessage) and msg.content.strip():
-                            new_messages.append(msg.content)
-
-            # Combine all new messages into a single response
-            if new_messages:
-                combined_response = " ".join(new_messages)
-
-                # Check if the new message is a duplicate of the last assistant message
-                if not (st.session_state.messages and 
-                        st.session_state.messages[-1].role == "assistant" and 
-                        st.session_state.messages[-1].content.strip() == combined_response.strip()):
-                    st.session_state.messages.append(ChatMessage(role="assistant", content=combined_response))
-                    st.chat_message("assistant").write(combined_response)
+            with st.chat_message("assistant"):
+                reply = stream_response(None, st.empty())
+
+            # Check if the new message is a duplicate of the last assistant message
+            if reply and not (st.session_state.messages and
+                    st.session_state.messages[-1].role == "assistant" and
+                    st.session_state.messages[-1].content.strip() == reply.strip()):
+                st.session_state.messages.append(ChatMessage(role="assistant", content=reply))
 
             # Reset interrupt flags
             st.session_state["waiting_for_approval"] = False
@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+from langgraph.checkpoint.memory import MemorySaver
+
+from backend.agent import rag
+from backend.agent.fakes import BagOfWordsEmbeddings
+from backend.agent.graph import build_graph
+from backend.agent.retriever import RetrieverService, set_retriever
+
+
+LATENCY = 0.2
+SESSIONS = 10
+RESTAURANTS = ["Seoul Kitchen", "Hot Bird", "Golden Fork", "Blue Barrel", "Midnight Diner"]
+
+
+def _no_sync_calls(_):
+    raise AssertionError("sync call on the async path")
+
+
+class AsyncOnlyEmbeddings(BagOfWordsEmbeddings):
+    def embed_documents(self, texts):
+        _no_sync_calls(texts)
+
+
+def async_llm(respond):
+    async def call(prompt_value):
+        await asyncio.sleep(LATENCY)
+        return respond(prompt_value.to_messages())
+
+    return RunnableLambda(_no_sync_calls, afunc=call)
+
+
+class ScriptedAgentLLM:
+    """Calls answer_question for the user's question, then relays its result."""
+
+    def bind_tools(self, tools, **kwargs):
+        def respond(messages):
+            if isinstance(messages[-1], ToolMessage):
+                return AIMessage(f"DineBot: {messages[-1].content}")
+            call = {"name": "answer_question", "args": {"query": messages[-1].content}, "id": "c1"}
+            return AIMessage("", tool_calls=[call])
+
+        return async_llm(respond)
+
+
+def build_store(tmp_path):
+    directory = tmp_path / "rag_datasets"
+    directory.mkdir()
+    for name in RESTAURANTS:
+        (directory / f"{name}.md").write_text(f"{name}\nLocation: Charlotte\nHours: 11am-10pm")
+    store_path = str(tmp_path / "faiss_store")
+    manifest = rag.load_manifest(store_path)
+    rag.create_faiss_store(
+        rag.iter_documents(str(directory), manifest=manifest),
+        llm=None,
+        store_path=store_path,
+        embedding_size=64,
+        manifest=manifest,
+        embeddings=BagOfWordsEmbeddings(size=64),
+    )
+    return store_path
+
+
+def rag_retriever(store_path):
+    answer = async_llm(lambda messages: AIMessage("It opens at 11am"))
+    return RetrieverService(
+        store_path,
+        embeddings=AsyncOnlyEmbeddings(size=64, latency=LATENCY),
+        llm=answer,
+        lexical=False,
+    )
+
+
+def test_concurrent_answers_overlap_on_one_loop(tmp_path):
+    retriever = rag_retriever(build_store(tmp_path))
+    queries = [f"When does {name} open on day {i}?" for i in range(2) for name in RESTAURANTS]
+
+    async def main():
+        return await asyncio.gather(*(retriever.aanswer(q) for q in queries))
+
+    start = time.perf_counter()
+    answers = asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    assert answers == ["It opens at 11am"] * len(queries)
+    # Sequentially each answer waits 2 * LATENCY (embedding + generation).
+    assert elapsed < len(queries) * 2 * LATENCY / 3
+
+
+def test_graph_serves_concurrent_sessions_async(tmp_path):
+    set_retriever(rag_retriever(build_store(tmp_path)))
+    graph = build_graph(llm=ScriptedAgentLLM(), checkpointer=MemorySaver())
+
+    async def session(i):
+        config = {"configurable": {"thread_id": f"session-{i}"}}
+        question = f"When does {RESTAURANTS[i % len(RESTAURANTS)]} open?"
+        state = await graph.ainvoke(
+            {"messages": {"General Agent": [("user", question)]}, "current_persona": "General Agent"},
+            config,
+        )
+        return state["messages"]["General Agent"][-1].content
+
+    async def main():
+        return await asyncio.gather(*(session(i) for i in range(SESSIONS)))
+
+    try:
+        start = time.perf_counter()
+        replies = asyncio.run(main())
+        elapsed = time.perf_counter() - start
+    finally:
+        set_retriever(None)
+    assert replies == ["DineBot: It opens at 11am"] * SESSIONS
+    # Each session makes four LATENCY-long calls: agent, embedding, RAG answer, agent.
+    assert elapsed < SESSIONS * 4 * LATENCY / 3
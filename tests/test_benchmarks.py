@@ -0,0 +1,64 @@
+import numpy as np
+from langchain_core.messages import HumanMessage, ToolMessage
+
+from backend.agent.fakes import BagOfWordsEmbeddings, ScriptedChatModel
+from backend.agent.tools.general import answer_question, book_a_cab, book_a_table
+from benchmarks import load_test, rag_benchmark
+
+
+def test_bag_of_words_embeddings_are_deterministic_and_lexical():
+    embeddings = BagOfWordsEmbeddings(size=64)
+    a, b, c = embeddings.embed_documents(
+        ["Golden Fork Kitchen hours", "Golden Fork Kitchen menu", "Blue Barrel Tavern"]
+    )
+    assert a == BagOfWordsEmbeddings(size=64).embed_query("Golden Fork Kitchen hours")
+    assert np.dot(a, b) > np.dot(a, c)
+    assert abs(np.linalg.norm(a) - 1) < 1e-6
+
+
+def test_rag_benchmark_runs_offline(tmp_path):
+    results = rag_benchmark.run(
+        restaurants=60, per_file=10, queries=20, dimensions=64, workdir=str(tmp_path)
+    )
+    assert results["populate"]["chunks"] > 0
+    assert results["build"]["seconds"] > 0 and results["build"]["store_mb"] > 0
+    for mode in ("vector", "hybrid"):
+        stats = results["retrieval"][mode]
+        assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+    assert results["retrieval"]["hybrid"]["recall@5"] >= 0.9
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_scripted_chat_model_calls_the_tools():
+    llm = ScriptedChatModel().bind_tools([book_a_cab, book_a_table, answer_question])
+
+    def call(text):
+        return llm.invoke([HumanMessage(text)]).tool_calls[0]
+
+    cab = call("Book a cab from Hot Bird to Uptown at 6:30pm for 3 passengers")
+    assert cab["name"] == "book_a_cab"
+    assert cab["args"]["pickuplocation"] == "Hot Bird" and cab["args"]["numofpassengers"] == 3
+    table = call("Book a table on 2024-06-15 at 7pm")
+    assert table["name"] == "book_a_table" and table["args"]["date"] == "2024-06-15"
+    assert call("When does Hot Bird open?")["name"] == "answer_question"
+    done = llm.invoke([ToolMessage("Your taxi has been booked", tool_call_id="c1")])
+    assert done.content == "Done: Your taxi has been booked"
+    chunks = list(llm.stream([HumanMessage("Book a cab")]))
+    assert chunks[0].tool_calls[0]["name"] == "book_a_cab"
+
+
+def test_load_test_runs_offline(tmp_path):
+    results = load_test.run(sessions=4, rounds=2, restaurants=20, workdir=str(tmp_path))
+    sessions = 4 * 2
+    assert results["turns"] == sessions * len(load_test.SCENARIO)
+    assert results["interrupts"] == sessions
+    assert results["turns_per_sec"] > 0
+    nodes = results["nodes"]
+    # One of the four sessions per round denies the cab booking.
+    assert nodes["General Agent_sensitive_tools"]["count"] == sessions - 2
+    assert nodes["General Agent_rag_tools"]["count"] == sessions
+    for stats in [*nodes.values(), *results["checkpointer_calls"].values()]:
+        assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+    assert results["checkpointer_stats"]["threads"] == sessions
+    assert len(results["memory"]["rss_mb_per_round"]) == 3
+    assert list(tmp_path.iterdir()) == []
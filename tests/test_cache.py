@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import time
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from backend.agent.cache import (
+    CachedEmbeddings,
+    EmbeddingCache,
+    QueryEmbeddingCache,
+    SemanticAnswerCache,
+)
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    calls: list = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return super().embed_query(text)
+
+
+def test_cached_embeddings_only_embed_misses(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    fake = CountingEmbeddings(size=8)
+    embeddings = CachedEmbeddings(fake, cache, model="fake")
+
+    first = embeddings.embed_documents(["a", "b", "a"])
+    second = embeddings.embed_documents(["b", "c"])
+    query = embeddings.embed_query("c")
+
+    assert fake.calls == [["a", "b"], ["c"]]
+    assert first[0] == first[2]
+    assert second[1] == query
+    # Vectors round-trip through float32 storage.
+    assert abs(first[1][0] - fake.embed_query("b")[0]) < 1e-6
+
+
+def test_async_lookups_run_off_the_event_loop(tmp_path):
+    threads = []
+
+    class RecordingCache(EmbeddingCache):
+        def get_many(self, model, texts):
+            threads.append(threading.current_thread())
+            return super().get_many(model, texts)
+
+    cache = RecordingCache(str(tmp_path / "cache.sqlite3"))
+    embeddings = CachedEmbeddings(DeterministicFakeEmbedding(size=8), cache, model="fake")
+    first = asyncio.run(embeddings.aembed_query("a"))
+    assert asyncio.run(embeddings.aembed_documents(["a"])) == [first]
+    assert threads and threading.main_thread() not in threads
+
+
+def test_cache_is_shared_on_disk_and_keyed_by_model(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    EmbeddingCache(path).put_many("model-a", ["hours"], [[1.0, 2.0]])
+    cache = EmbeddingCache(path)
+    assert cache.get_many("model-a", ["hours"]) == [[1.0, 2.0]]
+    assert cache.get_many("model-b", ["hours"]) == [None]
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.put_many("m", ["a"], [[1.0]])
+    cache.put_many("m", ["b"], [[2.0]])
+    cache.get_many("m", ["a"])
+    cache.put_many("m", ["c"], [[3.0]])
+    assert len(cache) == 2
+    assert cache.get_many("m", ["a", "b", "c"]) == [[1.0], None, [3.0]]
+
+
+def test_cache_defers_touches_and_counts_only_past_a_limit(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_entries=3, touch_every=2)
+    statements = []
+    cache._conn.set_trace_callback(statements.append)
+    cache.put_many("m", ["a", "b"], [[1.0], [2.0]])
+    cache.get_many("m", ["a"])
+    assert not [s for s in statements if "COUNT" in s or "UPDATE" in s]
+
+    cache.get_many("m", ["b"])
+    assert len([s for s in statements if "UPDATE" in s]) == 2
+    cache.put_many("m", ["c", "d"], [[3.0], [4.0]])
+    assert len([s for s in statements if "COUNT" in s]) == 2
+    assert len(cache) == 3
+
+
+def test_query_cache_normalizes_and_counts():
+    cache = QueryEmbeddingCache(max_entries=10)
+    cache.put("What are the hours for  Seoul Kitchen?", [1.0, 2.0])
+    assert cache.get("what are the hours for seoul kitchen?") == [1.0, 2.0]
+    assert cache.get("parking at Seoul Kitchen?") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_query_cache_bounds_entries_bytes_and_age(monkeypatch):
+    cache = QueryEmbeddingCache(max_entries=2, max_bytes=10_000, ttl=60)
+    cache.put("a", [0.0])
+    cache.put("b", [0.0])
+    cache.get("a")
+    cache.put("c", [0.0])
+    assert cache.get("b") is None and cache.get("a") == [0.0]
+    cache.put("big", [0.0] * 4096)
+    assert cache.get("big") is None
+    assert cache.bytes <= 10_000
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    assert cache.get("a") is None
+
+
+def test_semantic_answer_cache_matches_similar_queries():
+    cache = SemanticAnswerCache(threshold=0.9, max_entries=2)
+    cache.put([1.0, 0.0, 0.0], "Open 11am-9pm")
+    assert cache.get([0.95, 0.05, 0.0]) == "Open 11am-9pm"
+    assert cache.get([0.0, 1.0, 0.0]) is None
+
+    cache.put([0.0, 1.0, 0.0], "Free lot parking")
+    cache.get([1.0, 0.0, 0.0])
+    cache.put([0.0, 0.0, 1.0], "Brunch on Sundays")
+    assert cache.get([0.0, 1.0, 0.0]) is None
+    assert cache.get([1.0, 0.0, 0.0]) == "Open 11am-9pm"
+
+    cache.clear()
+    assert cache.get([1.0, 0.0, 0.0]) is None
+
+    scope = SemanticAnswerCache.scope_key(["restaurant:Hot Bird"])
+    cache.put([0.0, 0.0, 1.0], "Hot Bird opens at 11am", scope)
+    assert cache.get([0.0, 0.0, 1.0], scope) == "Hot Bird opens at 11am"
+    assert cache.get([0.0, 0.0, 1.0], SemanticAnswerCache.scope_key(["restaurant:Seoul"])) is None
@@ -0,0 +1,132 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+from langgraph.checkpoint.base import create_checkpoint, empty_checkpoint
+
+from backend.agent.checkpoint import SQLiteCheckpointSaver
+from backend.agent.graph import build_graph
+
+
+class ScriptedLLM:
+    """Books a cab when asked to, otherwise echoes the last message."""
+
+    def bind_tools(self, tools, **kwargs):
+        def respond(prompt_value):
+            last = prompt_value.to_messages()[-1]
+            if isinstance(last, ToolMessage):
+                return AIMessage(f"Done: {last.content}")
+            if "cab" in last.content:
+                args = {
+                    "userquery": last.content,
+                    "pickuplocation": "Uptown",
+                    "pickuptime": "7pm",
+                    "numofpassengers": 2,
+                    "specialrequirements": "none",
+                }
+                return AIMessage("", tool_calls=[{"name": "book_a_cab", "args": args, "id": "c1"}])
+            return AIMessage(f"Echo: {last.content}")
+
+        async def arespond(prompt_value):
+            return respond(prompt_value)
+
+        return RunnableLambda(respond, afunc=arespond)
+
+
+def user_turn(text):
+    return {"messages": {"General Agent": [("user", text)]}, "current_persona": "General Agent"}
+
+
+def test_pending_approval_survives_restart(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite3")
+    config = {"configurable": {"thread_id": "t1"}}
+    graph = build_graph(llm=ScriptedLLM(), checkpointer=SQLiteCheckpointSaver(path))
+    graph.invoke(user_turn("Book a cab to Uptown"), config)
+    assert graph.get_state(config).next == ("General Agent_sensitive_tools",)
+
+    # A new process: fresh saver and graph over the same database.
+    graph = build_graph(llm=ScriptedLLM(), checkpointer=SQLiteCheckpointSaver(path))
+    assert graph.get_state(config).next == ("General Agent_sensitive_tools",)
+    state = graph.invoke(None, config)
+    assert state["messages"]["General Agent"][-1].content == "Done: Your taxi has been booked"
+    assert graph.get_state(config).next == ()
+
+
+def test_pruning_eviction_and_retention(tmp_path):
+    saver = SQLiteCheckpointSaver(
+        str(tmp_path / "checkpoints.sqlite3"), keep_checkpoints=3, idle_seconds=3600
+    )
+    graph = build_graph(llm=ScriptedLLM(), checkpointer=saver)
+    for thread in ("a", "b"):
+        config = {"configurable": {"thread_id": thread}}
+        for turn in range(3):
+            graph.invoke(user_turn(f"hello {turn}"), config)
+
+    for thread in ("a", "b"):
+        # Reading a thread caches its latest checkpoint.
+        saver.get_tuple({"configurable": {"thread_id": thread}})
+    stats = saver.stats()
+    assert stats["threads"] == 2
+    assert stats["checkpoints"] == 2 * 3
+    assert stats["pruned_checkpoints"] > 0
+    assert stats["cached_threads"] == 2 and stats["cached_bytes"] > 0
+    assert stats["disk_bytes"] > 0
+
+    saver.idle_seconds = 0
+    saver.evict_idle()
+    assert saver.stats()["cached_threads"] == 0
+    config = {"configurable": {"thread_id": "a"}}
+    history = graph.get_state(config).values["messages"]["General Agent"]
+    assert history[-1].content == "Echo: hello 2"
+    assert len(list(graph.get_state_history(config))) == 3
+
+    asyncio.run(graph.ainvoke(user_turn("async hello"), config))
+    assert graph.get_state(config).values["messages"]["General Agent"][-1].content == (
+        "Echo: async hello"
+    )
+
+    saver.retention_seconds = 0
+    assert saver.prune_expired() == 2
+    assert saver.stats()["threads"] == 0
+    assert graph.get_state(config).values == {}
+
+
+def test_cache_follows_writes_saved_out_of_order(tmp_path):
+    saver = SQLiteCheckpointSaver(str(tmp_path / "checkpoints.sqlite3"))
+    config = {"configurable": {"thread_id": "t", "checkpoint_ns": ""}}
+    first = saver.put(config, empty_checkpoint(), {}, {})
+    second = create_checkpoint(empty_checkpoint(), None, 1)
+    second_config = {"configurable": {**first["configurable"], "checkpoint_id": second["id"]}}
+
+    # langgraph may save a checkpoint's writes before the checkpoint itself.
+    saver.put_writes(second_config, [("messages", "done")], "task-1")
+    latest = saver.put(first, second, {}, {})
+    assert saver.get_tuple(config).pending_writes == [("task-1", "messages", "done")]
+
+    # A late write for the previous checkpoint keeps the latest one cached.
+    saver.put_writes(first, [("messages", "late")], "task-0")
+    assert saver.stats()["cached_threads"] == 1
+    cached = saver.get_tuple(config)
+    assert cached.config == latest and cached.pending_writes == [("task-1", "messages", "done")]
+    assert saver.stats()["cache_hits"] >= 2
+
+
+def test_cached_reads_skip_queries_and_deserialization(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite3")
+    saver = SQLiteCheckpointSaver(path)
+    config = {"configurable": {"thread_id": "t", "checkpoint_ns": ""}}
+    saver.put(config, empty_checkpoint(), {"step": 0}, {})
+    saver.get_tuple(config)
+
+    loads, statements = [], []
+    real_loads = saver.serde.loads_typed
+    saver.serde.loads_typed = lambda data: loads.append(data) or real_loads(data)
+    saver._conn.set_trace_callback(statements.append)
+    first, second = saver.get_tuple(config), saver.get_tuple(config)
+    assert first.metadata == {"step": 0} and first.checkpoint is not second.checkpoint
+    assert not loads and not [s for s in statements if "threads" in s]
+
+    # Another process saving the thread is noticed through data_version.
+    other = SQLiteCheckpointSaver(path)
+    other.put(config, create_checkpoint(empty_checkpoint(), None, 1), {"step": 1}, {})
+    assert saver.get_tuple(config).metadata == {"step": 1}
@@ -0,0 +1,40 @@
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from backend.agent.context import ContextBuilder, overlap_length
+
+TEXT = " ".join(f"Restaurant {i} serves dish number {i} every evening." for i in range(12))
+
+
+def chunks(filename="a.md"):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=160, chunk_overlap=60)
+    return [
+        Document(page_content=text, metadata={"filename": filename, "chunk_id": i})
+        for i, text in enumerate(splitter.split_text(TEXT))
+    ]
+
+
+def test_overlap_between_neighbouring_chunks_is_removed():
+    docs = chunks()
+    assert overlap_length(docs[0].page_content, docs[1].page_content) > 20
+    builder = ContextBuilder()
+    # Relevance order need not follow file order.
+    context = builder.build([docs[2], docs[1], docs[0]])
+    for i in range(7):
+        assert context.count(f"dish number {i} every") == 1
+    assert builder.stats["saved_overlap"] > 0
+
+
+def test_chunks_of_other_files_are_kept_whole():
+    a, b = chunks("a.md")[0], chunks("b.md")[1]
+    context = ContextBuilder().build([a, b])
+    assert context == a.page_content + "\n\n" + b.page_content
+
+
+def test_context_fits_the_token_budget_in_relevance_order():
+    docs = chunks()
+    builder = ContextBuilder(max_tokens=60)
+    context = builder.build([(doc, 0.0) for doc in reversed(docs)])
+    assert builder.count(context) <= 60
+    assert context.startswith(docs[-1].page_content.strip())
+    assert builder.stats["saved_budget"] > 0
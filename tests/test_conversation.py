@@ -0,0 +1,91 @@
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, StateGraph
+
+from backend.agent.conversation import ConversationWindow
+from backend.agent.nodes.assistant import Assistant
+from backend.agent.state import State
+
+
+def test_split_keeps_tool_calls_with_their_results():
+    call = {"name": "book_a_table", "args": {}, "id": "c1"}
+    messages = [
+        HumanMessage("hi"),
+        AIMessage("hello"),
+        HumanMessage("book a table"),
+        AIMessage("", tool_calls=[call]),
+        ToolMessage("booked", tool_call_id="c1"),
+        AIMessage("Your table is booked"),
+    ]
+    window = ConversationWindow(max_messages=4, keep_messages=2)
+    older, recent = window.split(messages)
+    assert recent[0] is messages[3]
+    assert older + recent == messages
+    assert window.split(messages[:4]) == ([], messages[:4])
+
+
+def test_assistant_keeps_a_bounded_window_and_rolling_summary():
+    prompts = []
+
+    def echo(prompt_value):
+        messages = prompt_value.to_messages()
+        prompts.append(messages)
+        return AIMessage(f"echo {messages[-1].content}")
+
+    summaries = []
+
+    def summarize(messages):
+        summaries.append(messages[-1].content)
+        return AIMessage(f"summary {len(summaries)}")
+
+    prompt = ChatPromptTemplate.from_messages([("placeholder", "{messages}")])
+    window = ConversationWindow(
+        summarizer=RunnableLambda(summarize), max_messages=6, keep_messages=2
+    )
+    builder = StateGraph(State)
+    builder.add_node("General Agent", Assistant(prompt | RunnableLambda(echo), window=window))
+    builder.add_edge(START, "General Agent")
+    builder.add_edge("General Agent", END)
+    graph = builder.compile(checkpointer=MemorySaver())
+    config = {"configurable": {"thread_id": "t"}}
+
+    for turn in range(12):
+        state = graph.invoke(
+            {"messages": {"General Agent": ("user", f"turn {turn}")}, "current_persona": "General Agent"},
+            config,
+        )
+        assert len(state["messages"]["General Agent"]) <= window.max_messages + 1
+
+    assert state["messages"]["General Agent"][-1].content == "echo turn 11"
+    assert window.stats["compactions"] >= 2
+    # Each summary folds the previous one into the new messages.
+    assert "summary 1" in summaries[1] and "turn 0" in summaries[0]
+    assert state["summary"]["General Agent"] == f"summary {len(summaries)}"
+    last_prompt = prompts[-1]
+    assert isinstance(last_prompt[0], SystemMessage) and "summary" in last_prompt[0].content
+    assert len(last_prompt) <= window.max_messages + 1
+
+
+def test_summaries_are_not_streamed():
+    summarizer = GenericFakeChatModel(messages=iter([AIMessage("the earlier summary")]))
+    window = ConversationWindow(summarizer=summarizer, max_messages=2, keep_messages=1)
+    agent = GenericFakeChatModel(messages=iter([AIMessage("the reply")]))
+    builder = StateGraph(State)
+    node = Assistant(RunnableLambda(lambda state: state["messages"]) | agent, window=window)
+    builder.add_node("General Agent", node)
+    builder.add_edge(START, "General Agent")
+    builder.add_edge("General Agent", END)
+    graph = builder.compile()
+    history = [HumanMessage("a", id="1"), AIMessage("b", id="2"), HumanMessage("c", id="3")]
+    streamed = [
+        message.content
+        for message, _ in graph.stream(
+            {"messages": {"General Agent": history}, "current_persona": "General Agent"},
+            stream_mode="messages",
+        )
+        if isinstance(message, AIMessageChunk)
+    ]
+    assert "".join(streamed) == "the reply"
@@ -0,0 +1,43 @@
+import time
+
+from backend.agent.embeddings import BatchEmbeddings
+from backend.agent.llm_gateway import LLMGateway, RateLimiter
+from backend.agent.stub_openai import StubOpenAIServer, fake_embedding
+
+
+def test_batches_are_embedded_concurrently_and_in_order():
+    texts = [f"chunk {i}" for i in range(40)]
+    with StubOpenAIServer(dimensions=8, latency=0.2) as server:
+        embeddings = BatchEmbeddings(
+            batch_size=5, max_workers=8, api_key="stub", base_url=server.url
+        )
+        embeddings.embed_query("warm up")
+        start = time.perf_counter()
+        vectors = embeddings.embed_documents(texts)
+        elapsed = time.perf_counter() - start
+    assert vectors == [fake_embedding(text, 8) for text in texts]
+    assert embeddings.stats["requests"] == 9
+    # Eight 200ms requests on eight workers take well under their serial sum.
+    assert elapsed < 0.8
+    assert embeddings.throughput > 0
+
+
+def test_failed_batches_are_retried_through_the_gateway():
+    gateway = LLMGateway(backoff=0.01)
+    with StubOpenAIServer(dimensions=8, failures=2) as server:
+        embeddings = BatchEmbeddings(
+            batch_size=10, api_key="stub", base_url=server.url, gateway=gateway
+        )
+        vectors = embeddings.embed_documents(["a", "b"])
+    assert len(vectors) == 2
+    assert embeddings.stats["requests"] == 1
+    assert gateway.stats["retries"] == 2 and gateway.stats["attempts"] == 3
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(requests_per_minute=1200)
+    limiter._requests = 0
+    start = time.perf_counter()
+    limiter.acquire()
+    limiter.acquire()
+    assert time.perf_counter() - start >= 0.09
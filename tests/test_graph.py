@@ -0,0 +1,65 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from backend.agent.build_index import build_index, store_lock
+from backend.agent.graph import build_graph
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ToolCallingFake(GenericFakeChatModel):
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+def test_importing_graph_is_lazy(tmp_path):
+    code = (
+        "import json, sys\n"
+        "import backend.agent.graph\n"
+        "print(json.dumps([m for m in ('faiss', 'openai', 'langchain_openai') if m in sys.modules]))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=tmp_path,
+        env={**os.environ, "PYTHONPATH": ROOT},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == []
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_build_graph_runs_with_given_llm():
+    llm = ToolCallingFake(messages=iter([AIMessage("Hi! How can I help?")]))
+    graph = build_graph(llm=llm, checkpointer=MemorySaver())
+    config = {"configurable": {"thread_id": "t1"}}
+    state = graph.invoke(
+        {"messages": {"General Agent": [("user", "hello")]}, "current_persona": "General Agent"},
+        config,
+    )
+    assert state["messages"]["General Agent"][-1].content == "Hi! How can I help?"
+
+
+def test_build_index_updates_store_under_lock(tmp_path):
+    datasets = tmp_path / "rag_datasets"
+    datasets.mkdir()
+    (datasets / "a.md").write_text("Seoul Kitchen\nHours: 11am-10pm")
+    store_path = str(tmp_path / "faiss_store")
+    embeddings = DeterministicFakeEmbedding(size=1536)
+
+    store = build_index(store_path, str(datasets), embeddings=embeddings)
+    assert store.index.ntotal == 1
+    with store_lock(store_path):
+        with pytest.raises(Exception, match="being built by another process"):
+            build_index(store_path, str(datasets), embeddings=embeddings, wait=False)
+    assert build_index(store_path, str(datasets), embeddings=embeddings).index.ntotal == 1
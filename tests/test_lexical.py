@@ -0,0 +1,37 @@
+from backend.agent.lexical import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+DOCS = [
+    ("a", "Magnolia's Home Kitchen serves Southern comfort food. Hours: 11am-9pm"),
+    ("b", "Seoul Kitchen serves Korean barbecue. Hours: 11am-10pm"),
+    ("c", "Hot Bird serves Nashville hot chicken. Hours: 11am-11pm"),
+]
+
+
+def test_tokenize_drops_stopwords_and_punctuation():
+    assert tokenize("What are Magnolia's hours?") == ["magnolia", "hours"]
+
+
+def test_rare_terms_rank_first_and_survive_save(tmp_path):
+    index = BM25Index.build(DOCS)
+    hits = index.search("korean barbecue kitchen")
+    assert [i for i, _ in hits] == ["b", "a"]
+
+    index.save(str(tmp_path / "lexical.json"))
+    loaded = BM25Index.load(str(tmp_path / "lexical.json"))
+    assert loaded.search("korean barbecue kitchen") == hits
+
+
+def test_confidence_penalizes_unknown_and_shared_terms():
+    index = BM25Index.build(DOCS)
+    coverage, margin = index.confidence("hot bird", index.search("hot bird"))
+    assert coverage == 1.0 and margin > 0.5
+    coverage, _ = index.confidence("hot bird gluten", index.search("hot bird gluten"))
+    assert coverage < 0.7
+    _, margin = index.confidence("hours", index.search("hours"))
+    assert margin < 0.1
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "a"]])
+    assert [i for i, _ in fused] == ["b", "a", "c"]
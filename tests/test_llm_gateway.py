@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+import openai
+import pytest
+
+from backend.agent.llm_gateway import LLMGateway
+from backend.agent.stub_openai import StubOpenAIServer
+
+
+def test_chat_and_embeddings_retry_through_the_gateway():
+    with StubOpenAIServer(dimensions=8, failures=2) as server:
+        gateway = LLMGateway(backoff=0.01)
+        llm = gateway.chat_model(api_key="stub", base_url=server.url, streaming=True)
+        assert llm.invoke("hello").content == "Echo: hello"
+        assert asyncio.run(llm.ainvoke("again")).content == "Echo: again"
+        # A second event loop gets its own connections.
+        assert asyncio.run(llm.ainvoke("later")).content == "Echo: later"
+        embeddings = gateway.embeddings(
+            api_key="stub", base_url=server.url, check_embedding_ctx_length=False
+        )
+        assert len(embeddings.embed_query("hi")) == 8
+    assert gateway.stats["retries"] == 2
+    assert gateway.stats["requests"] == 4 and gateway.stats["attempts"] == 6
+
+
+def test_hedged_request_cuts_a_slow_response():
+    with StubOpenAIServer(dimensions=8, delays=[2.0, 0.0, 2.0]) as server:
+        gateway = LLMGateway(hedge_after=0.1)
+        llm = gateway.chat_model(api_key="stub", base_url=server.url)
+        start = time.perf_counter()
+        assert llm.invoke("sync").content == "Echo: sync"
+        assert time.perf_counter() - start < 1.0
+        start = time.perf_counter()
+        assert asyncio.run(llm.ainvoke("async")).content == "Echo: async"
+        assert time.perf_counter() - start < 1.0
+    assert gateway.stats["hedges"] == 2 and gateway.stats["hedge_wins"] == 2
+
+
+def test_circuit_breaker_fails_fast_then_recovers():
+    with StubOpenAIServer(dimensions=8, failures=3, failure_status=503) as server:
+        gateway = LLMGateway(
+            backoff=0.01, max_retries=2, failure_threshold=3, reset_seconds=0.2
+        )
+        llm = gateway.chat_model(api_key="stub", base_url=server.url)
+        with pytest.raises(openai.InternalServerError):
+            llm.invoke("fails")
+        assert gateway.breaker.state == "open"
+        with pytest.raises(openai.APIConnectionError):
+            llm.invoke("rejected")
+        assert server.requests == 3
+        time.sleep(0.25)
+        # The half-open probe succeeds and closes the circuit.
+        assert llm.invoke("recovered").content == "Echo: recovered"
+        assert gateway.breaker.state == "closed"
+    assert gateway.stats["circuit_opened"] == 1 and gateway.stats["circuit_rejected"] == 1
+
+
+def test_async_client_uses_a_pool_per_event_loop():
+    transport = LLMGateway().async_http_client()._transport
+
+    async def pool():
+        return transport._transport()
+
+    first, second = asyncio.run(pool()), asyncio.run(pool())
+    assert first is not second
+    # The closed first loop's pool is dropped when the second loop's is made.
+    assert list(transport._transports.values()) == [second]
@@ -0,0 +1,53 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.graph import add_messages
+
+from backend.agent.message_log import MessageLog
+from backend.agent.utils import add_messages_to_dict
+
+
+def test_extend_matches_add_messages():
+    history = [HumanMessage("hi", id="1"), AIMessage("hello", id="2")]
+    updates = [
+        [{"role": "user", "content": "book a table", "id": "4"}],
+        [AIMessage("edited", id="2"), AIMessage("new", id="3")],
+        [RemoveMessage(id="1")],
+        [HumanMessage("again", id="1")],
+    ]
+    log, expected = MessageLog(history), list(history)
+    for update in updates:
+        log, expected = log.extend(update), add_messages(expected, update)
+        assert [(m.id, m.content) for m in log] == [(m.id, m.content) for m in expected]
+    assert log.get("3").content == "new" and log.position("1") == len(log) - 1
+    with pytest.raises(ValueError):
+        log.extend([RemoveMessage(id="missing")])
+
+
+def test_older_versions_are_unchanged():
+    base = MessageLog([HumanMessage("a", id="a")])
+    appended = base.extend([AIMessage("b", id="b")])
+    # A sibling of ``appended`` (e.g. a retry from the same checkpoint).
+    forked = base.extend([AIMessage("c", id="c")])
+    replaced = appended.extend([AIMessage("B", id="b")])
+
+    assert [m.content for m in base] == ["a"] and base.get("b") is None
+    assert [m.content for m in appended] == ["a", "b"]
+    assert [m.content for m in forked] == ["a", "c"] and forked.get("b") is None
+    assert [m.content for m in replaced] == ["a", "B"]
+    # Appends to the newest version share its storage.
+    assert appended._items is base._items
+
+
+def test_reducer_does_not_modify_its_input_and_round_trips():
+    left = {"General Agent": [HumanMessage("hi", id="1")], "Other": [AIMessage("x", id="x")]}
+    merged = add_messages_to_dict(left, {"General Agent": ("ai", "hello")})
+    assert len(left["General Agent"]) == 1
+    assert isinstance(merged["General Agent"], MessageLog)
+    assert [m.content for m in merged["General Agent"]] == ["hi", "hello"]
+    assert merged["Other"] is left["Other"]
+
+    serde = JsonPlusSerializer()
+    loaded = serde.loads_typed(serde.dumps_typed(merged))
+    assert isinstance(loaded["General Agent"], MessageLog)
+    assert loaded["General Agent"] == merged["General Agent"]
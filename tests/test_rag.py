@@ -0,0 +1,280 @@
+import os
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from backend.agent import rag
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    embedded: int = 0
+    batches: list = []
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        self.batches.append(len(texts))
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    fake = CountingEmbeddings(size=16)
+    monkeypatch.setattr(rag, "default_embeddings", lambda: fake)
+    return fake
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    directory = tmp_path / "rag_datasets"
+    directory.mkdir()
+    (directory / "a.md").write_text("Magnolia's Home Kitchen\nHours: 11am-9pm")
+    (directory / "b.md").write_text("Seoul Kitchen\nHours: 11am-10pm")
+    return directory
+
+
+def build(corpus, store_path):
+    manifest = rag.load_manifest(store_path)
+    documents = rag.populate_vector_db(str(corpus), manifest=manifest)
+    return rag.create_faiss_store(
+        documents, llm=None, store_path=store_path, embedding_size=16, manifest=manifest
+    )
+
+
+def test_incremental_build_only_embeds_changes(corpus, tmp_path, embeddings):
+    store_path = str(tmp_path / "faiss_store")
+    store = build(corpus, store_path)
+    assert embeddings.embedded == 2
+    assert os.path.exists(os.path.join(store_path, rag.MANIFEST_FILE))
+
+    build(corpus, store_path)
+    assert embeddings.embedded == 2
+
+    (corpus / "b.md").write_text("Seoul Kitchen\nHours: noon-10pm")
+    (corpus / "c.md").write_text("Hot Bird\nHours: 11am-11pm")
+    store = build(corpus, store_path)
+    assert embeddings.embedded == 4
+    assert store.index.ntotal == 3
+
+    assert (corpus / "a").is_dir()
+    (corpus / "a.md").unlink()
+    store = build(corpus, store_path)
+    assert embeddings.embedded == 4
+    assert store.index.ntotal == 2
+    assert not (corpus / "a").exists() and (corpus / "b").is_dir()
+    contents = {doc.page_content for doc in store.docstore._dict.values()}
+    assert contents == {"Seoul Kitchen\nHours: noon-10pm", "Hot Bird\nHours: 11am-11pm"}
+
+
+def test_streaming_build_embeds_in_batches(corpus, tmp_path, embeddings):
+    for i in range(5):
+        (corpus / f"extra_{i}.md").write_text(f"Restaurant {i}\nHours: 9am-{i}pm")
+    manifest = rag.load_manifest(str(tmp_path / "faiss_store"))
+    store = rag.create_faiss_store(
+        rag.iter_documents(str(corpus), manifest=manifest),
+        llm=None,
+        store_path=str(tmp_path / "faiss_store"),
+        embedding_size=16,
+        manifest=manifest,
+        batch_size=3,
+    )
+    assert embeddings.batches == [3, 3, 1]
+    assert store.index.ntotal == 7
+    assert len(manifest["files"]) == 7
+
+
+def test_iter_batches_respects_memory_ceiling():
+    docs = [rag.Document(page_content="x" * 100) for _ in range(10)]
+    per_doc = rag.estimate_document_bytes(docs[0], embedding_size=16)
+    batches = list(
+        rag.iter_batches(docs, batch_size=64, max_batch_bytes=per_doc * 4, embedding_size=16)
+    )
+    assert [len(b) for b in batches] == [4, 4, 2]
+
+
+def test_parallel_ingestion_matches_sequential(tmp_path):
+    for name in ("sequential", "parallel"):
+        directory = tmp_path / name
+        directory.mkdir()
+        for i in range(12):
+            (directory / f"restaurant_{i:02d}.md").write_text(
+                "\n##".join(f"Review {i}.{j} " + "tasty " * 60 for j in range(4))
+            )
+    sequential = rag.populate_vector_db(str(tmp_path / "sequential"))
+    parallel = rag.populate_vector_db(str(tmp_path / "parallel"), workers=3)
+
+    assert [d.page_content for d in parallel] == [d.page_content for d in sequential]
+    assert [d.metadata for d in parallel] == [d.metadata for d in sequential]
+    chunk_ids = [d.metadata["chunk_id"] for d in parallel]
+    assert chunk_ids == list(range(len(chunk_ids)))
+    first = parallel[0].metadata
+    chunk_file = tmp_path / "parallel" / "restaurant_00" / f"{first['chunk_id']}.txt"
+    assert chunk_file.read_text() == parallel[0].page_content
+
+
+@pytest.mark.parametrize(
+    "index_type, extra_options",
+    [
+        ("ivf", {}),
+        ("hnsw", {}),
+        ("ivfpq", {}),
+        ("fp16", {}),
+        ("sq8", {}),
+        ("pq", {}),
+        ("sq8", {"pca": 8}),
+    ],
+)
+def test_ann_index_types_build_incrementally(
+    corpus, tmp_path, embeddings, index_type, extra_options
+):
+    for i in range(30):
+        (corpus / f"extra_{i:02d}.md").write_text(f"Restaurant {i}\nHours: 9am-{i}pm")
+    store_path = str(tmp_path / "faiss_store")
+    options = {"nprobe": 4, "ef_search": 32, "train_size": 16, **extra_options}
+
+    manifest = rag.load_manifest(store_path)
+    store = rag.create_faiss_store(
+        rag.iter_documents(str(corpus), manifest=manifest),
+        llm=None,
+        store_path=store_path,
+        embedding_size=16,
+        manifest=manifest,
+        batch_size=8,
+        index_type=index_type,
+        index_options=options,
+    )
+    assert store.index.is_trained and store.index.ntotal == 32
+
+    (corpus / "a.md").unlink()
+    (corpus / "extra_00.md").write_text("Hot Bird\nHours: 11am-11pm")
+    manifest = rag.load_manifest(store_path)
+    store = rag.create_faiss_store(
+        rag.iter_documents(str(corpus), manifest=manifest),
+        llm=None,
+        store_path=store_path,
+        embedding_size=16,
+        manifest=manifest,
+        index_type=index_type,
+        index_options=options,
+    )
+    assert embeddings.embedded == 33
+    assert store.index.ntotal == 31
+    assert manifest["index"]["type"] == index_type
+    results = store.max_marginal_relevance_search("Hot Bird", k=2, fetch_k=5)
+    assert results
+
+
+def test_search_options_apply_without_rebuild(corpus, tmp_path, embeddings):
+    import faiss
+
+    for i in range(30):
+        (corpus / f"extra_{i:02d}.md").write_text(f"Restaurant {i}\nHours: 9am-{i}pm")
+    store_path = str(tmp_path / "faiss_store")
+    for nprobe in (2, 8):
+        manifest = rag.load_manifest(store_path)
+        rag.create_faiss_store(
+            rag.iter_documents(str(corpus), manifest=manifest),
+            llm=None,
+            store_path=store_path,
+            embedding_size=16,
+            manifest=manifest,
+            index_type="ivf",
+            index_options={"nlist": 4, "nprobe": nprobe, "train_size": 16},
+        )
+        assert embeddings.embedded == 32
+        store = rag.load_faiss_store(store_path, embeddings=embeddings)
+        assert faiss.extract_index_ivf(store.index).nprobe == nprobe
+    store = rag.load_faiss_store(store_path, embeddings=embeddings, nprobe=3)
+    assert faiss.extract_index_ivf(store.index).nprobe == 3
+
+
+def test_training_sample_is_uniform_over_the_stream():
+    import numpy as np
+
+    from backend.agent.ann import TrainingSample
+
+    sample = TrainingSample(100, seed=1)
+    for start in range(0, 1000, 64):
+        stop = min(start + 64, 1000)
+        sample.add(np.arange(start, stop, dtype=np.float32)[:, None])
+    assert sample.seen == 1000 and sample.vectors.shape == (100, 1)
+    values = sample.vectors[:, 0]
+    assert len(set(values)) == 100
+    # The first batches alone would give a mean near 50.
+    assert 350 < values.mean() < 650 and values.max() > 900
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf"])
+def test_mmap_load_matches_regular_load(corpus, tmp_path, embeddings, index_type):
+    for i in range(20):
+        (corpus / f"extra_{i:02d}.md").write_text(f"Restaurant {i}\nParking: lot {i}")
+    store_path = str(tmp_path / "faiss_store")
+    manifest = rag.load_manifest(store_path)
+    rag.create_faiss_store(
+        rag.iter_documents(str(corpus), manifest=manifest),
+        llm=None,
+        store_path=store_path,
+        embedding_size=16,
+        manifest=manifest,
+        index_type=index_type,
+        index_options={"nprobe": 64},
+    )
+    regular = rag.load_faiss_store(store_path, embeddings=embeddings)
+    mapped = rag.load_faiss_store(store_path, embeddings=embeddings, mmap=True)
+    query = embeddings.embed_query("Parking near Restaurant 3")
+    expected = regular.max_marginal_relevance_search_with_score_by_vector(query, k=4, fetch_k=10)
+    found = mapped.max_marginal_relevance_search_with_score_by_vector(query, k=4, fetch_k=10)
+    assert [(d.page_content, d.metadata) for d, _ in found] == [
+        (d.page_content, d.metadata) for d, _ in expected
+    ]
+    assert [s for _, s in found] == pytest.approx([s for _, s in expected])
+
+
+def test_mmap_exports_switch_as_a_set(corpus, tmp_path, embeddings):
+    from backend.agent import mmap_store
+
+    store_path = str(tmp_path / "faiss_store")
+    build(corpus, store_path)
+    before = rag.load_faiss_store(store_path, embeddings=embeddings, mmap=True)
+    for i in range(3):
+        (corpus / f"c{i}.md").write_text(f"Hot Bird {i}\nHours: 11am-11pm")
+        build(corpus, store_path)
+    after = rag.load_faiss_store(store_path, embeddings=embeddings, mmap=True)
+    assert (before.index.ntotal, after.index.ntotal) == (2, 5)
+    exports = [n for n in os.listdir(store_path) if os.path.isdir(os.path.join(store_path, n))]
+    assert len(exports) == 1 + mmap_store.KEEP_PREVIOUS
+    assert len(after.similarity_search("Hot Bird 2", k=5)) == 5
+
+    # Mid-rebuild (index.faiss rewritten, export not yet switched) readers
+    # keep serving the last complete export.
+    import faiss
+
+    index_path = os.path.join(store_path, "index.faiss")
+    saved = faiss.read_index(index_path)
+    faiss.write_index(faiss.IndexFlatL2(16), index_path)
+    store = rag.load_faiss_store(store_path, embeddings=embeddings, mmap=True)
+    assert store.index.ntotal == 5
+    assert store.similarity_search("Hot Bird 2", k=1)[0].page_content.startswith("Hot Bird")
+    faiss.write_index(saved, index_path)
+
+    # Readers never export; without any export they load into memory.
+    os.remove(os.path.join(store_path, mmap_store.CURRENT_FILE))
+    store = rag.load_faiss_store(store_path, embeddings=embeddings, mmap=True)
+    assert store.index.ntotal == 5
+    assert not os.path.exists(os.path.join(store_path, mmap_store.CURRENT_FILE))
+
+
+def test_quantized_index_report_shows_memory_saved():
+    import numpy as np
+
+    from backend.agent.ann import index_report
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((500, 32)).astype(np.float32)
+    queries = vectors[:20] + 0.01 * rng.standard_normal((20, 32)).astype(np.float32)
+    report = {
+        row["index_type"]: row
+        for row in index_report(vectors, queries, k=5, index_types=["flat", "fp16", "sq8"])
+    }
+    assert report["flat"]["memory_saved"] == 0 and report["flat"]["recall_lost"] == 0
+    assert report["fp16"]["memory_saved"] > 0.4 and report["fp16"]["recall_lost"] < 0.05
+    assert report["sq8"]["memory_saved"] > report["fp16"]["memory_saved"]
@@ -0,0 +1,235 @@
+import asyncio
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListLLM
+
+from backend.agent import rag
+from backend.agent.retriever import RetrieverService, batched_mmr
+
+
+@pytest.fixture
+def embeddings():
+    return DeterministicFakeEmbedding(size=16)
+
+
+def build_store(directory, store_path, embeddings):
+    manifest = rag.load_manifest(store_path)
+    return rag.create_faiss_store(
+        rag.iter_documents(str(directory), manifest=manifest),
+        llm=None,
+        store_path=store_path,
+        embedding_size=16,
+        manifest=manifest,
+        embeddings=embeddings,
+    )
+
+
+@pytest.fixture
+def store(tmp_path, embeddings):
+    directory = tmp_path / "rag_datasets"
+    directory.mkdir()
+    (directory / "a.md").write_text("Magnolia's Home Kitchen\nHours: 11am-9pm")
+    (directory / "b.md").write_text("Seoul Kitchen\nHours: 11am-10pm")
+    store_path = str(tmp_path / "faiss_store")
+    build_store(directory, store_path, embeddings)
+    return directory, store_path
+
+
+def test_store_is_loaded_once_and_reloaded_on_change(store, embeddings, monkeypatch):
+    directory, store_path = store
+    loads = []
+    load_faiss_store = rag.load_faiss_store
+
+    def counting_load(*args, **kwargs):
+        loads.append(args)
+        return load_faiss_store(*args, **kwargs)
+
+    monkeypatch.setattr("backend.agent.retriever.load_faiss_store", counting_load)
+    retriever = RetrieverService(
+        store_path, embeddings=embeddings, llm=FakeListLLM(responses=["11am"]), check_interval=0
+    )
+    assert retriever.answer("When does Seoul Kitchen open?") == "11am"
+    assert len(retriever.search("hours")) == 2
+    assert len(loads) == 1
+
+    (directory / "c.md").write_text("Hot Bird\nHours: 11am-11pm")
+    build_store(directory, store_path, embeddings)
+    assert len(retriever.search("hours")) == 3
+    assert len(loads) == 2
+
+
+def test_similar_questions_reuse_answers_until_rebuild(store, embeddings):
+    directory, store_path = store
+    llm = FakeListLLM(responses=["11am", "noon"])
+    retriever = RetrieverService(store_path, embeddings=embeddings, llm=llm, check_interval=0)
+    assert retriever.answer("When does Seoul Kitchen open?") == "11am"
+    assert retriever.answer("when does seoul kitchen  open?") == "11am"
+    assert retriever.answer_cache.stats()["hits"] == 1
+
+    (directory / "b.md").write_text("Seoul Kitchen\nHours: noon-10pm")
+    build_store(directory, store_path, embeddings)
+    assert retriever.answer("When does Seoul Kitchen open?") == "noon"
+
+
+def test_batched_mmr_matches_langchain():
+    from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((3, 8)).astype(np.float32)
+    candidates = rng.standard_normal((3, 10, 8)).astype(np.float32)
+    valid = np.ones((3, 10), dtype=bool)
+    valid[2, 6:] = False
+    selected = batched_mmr(queries, candidates, valid, k=5, lambda_mult=0.3)
+    for q in range(3):
+        expected = maximal_marginal_relevance(
+            queries[q], list(candidates[q][valid[q]]), k=5, lambda_mult=0.3
+        )
+        assert list(selected[q]) == expected
+
+
+def test_search_many_merges_and_deduplicates(store, embeddings):
+    directory, store_path = store
+    retriever = RetrieverService(store_path, embeddings=embeddings, llm=FakeListLLM(responses=["ok"]))
+    queries = ["Seoul Kitchen hours", "Magnolia's hours", "Seoul Kitchen hours again"]
+    results = retriever.search_many(queries, k=2, fetch_k=2)
+    contents = [doc.page_content for doc, _ in results]
+    assert sorted(contents) == sorted(set(contents))
+    assert len(contents) == 2
+    assert [s for _, s in results] == sorted(s for _, s in results)
+    assert retriever.query_cache.stats()["entries"] == 3
+    assert retriever.answer_many(queries, question="Compare their hours") == "ok"
+    assert retriever.search_many([]) == []
+
+
+def test_answer_many_without_sub_queries_answers_the_question(store, embeddings):
+    _, store_path = store
+    retriever = RetrieverService(
+        store_path, embeddings=embeddings, llm=FakeListLLM(responses=["11am", "noon"])
+    )
+    assert retriever.answer_many([], question="When does Seoul Kitchen open?") == "11am"
+    assert asyncio.run(retriever.aanswer_many([], question="Hours of Magnolia's?")) == "noon"
+
+
+class CountingQueries(DeterministicFakeEmbedding):
+    queries: list = []
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return super().embed_query(text)
+
+
+def test_lexical_fast_path_skips_query_embedding(store):
+    directory, store_path = store
+    embeddings = CountingQueries(size=16, queries=[])
+    retriever = RetrieverService(
+        store_path, embeddings=embeddings, llm=FakeListLLM(responses=["11am", "9pm"])
+    )
+    assert retriever.answer("Magnolia's Home Kitchen hours") == "11am"
+    assert embeddings.queries == []
+    assert retriever.lexical_stats["fast_path"] == 1
+
+    # "open" is not in the corpus, so this one falls back to hybrid search.
+    assert retriever.answer("When does Seoul Kitchen open?") == "9pm"
+    assert embeddings.queries == ["When does Seoul Kitchen open?"]
+    assert retriever.lexical_stats["fused"] == 1
+
+
+def test_hybrid_search_puts_keyword_match_first(store, embeddings):
+    directory, store_path = store
+    (directory / "c.md").write_text("Hot Bird\nHours: 11am-11pm")
+    build_store(directory, store_path, embeddings)
+    retriever = RetrieverService(store_path, embeddings=embeddings)
+    vector_only = [doc.page_content for doc, _ in retriever.search("Seoul Kitchen", k=3)]
+    results = retriever.hybrid_search("Seoul Kitchen", k=3)
+    assert vector_only[0] != "Seoul Kitchen\nHours: 11am-10pm"
+    assert results[0][0].page_content == "Seoul Kitchen\nHours: 11am-10pm"
+    assert [s for _, s in results] == sorted((s for _, s in results), reverse=True)
+
+    retriever = RetrieverService(store_path, embeddings=embeddings, lexical=False)
+    assert retriever.lexical_search("Seoul Kitchen") == []
+
+
+def test_scoped_queries_search_only_their_partitions(tmp_path, embeddings):
+    directory = tmp_path / "rag_datasets"
+    directory.mkdir()
+    (directory / "a.md").write_text(
+        "Magnolia's Home Kitchen\nLocation: 2200 Plaza Central Lane\nLocated in NoDa, serves biscuits."
+    )
+    (directory / "b.md").write_text(
+        "Seoul Kitchen\nLocation: 1440 South Boulevard\nLocated in South End, serves kimchi."
+    )
+    (directory / "c.md").write_text(
+        "Green Table\nLocation: 2122 South Tryon\nLocated in South End, serves salads."
+    )
+    store_path = str(tmp_path / "faiss_store")
+    build_store(directory, store_path, embeddings)
+    retriever = RetrieverService(store_path, embeddings=embeddings, lexical=False)
+
+    assert retriever.route("Is Magnolia's open late?") == ["restaurant:Magnolia's Home Kitchen"]
+    results = retriever.search("Is Magnolia's open late?")
+    assert [doc.metadata["filename"] for doc, _ in results] == ["a.md"]
+
+    results = retriever.search("Where can I eat in South End?")
+    assert sorted(doc.metadata["filename"] for doc, _ in results) == ["b.md", "c.md"]
+
+    results = retriever.search("Where can I get dinner?")
+    assert len(results) == 3
+    assert retriever.partition_stats == {"routed": 2, "global": 1}
+
+
+class OneQueryVector(DeterministicFakeEmbedding):
+    def embed_query(self, text):
+        return [1.0] + [0.0] * 15
+
+
+def test_cached_answers_do_not_cross_partitions(tmp_path):
+    directory = tmp_path / "rag_datasets"
+    directory.mkdir()
+    (directory / "a.md").write_text(
+        "Magnolia's Home Kitchen\nLocation: 2200 Plaza Central Lane\nHours: 11am-9pm"
+    )
+    (directory / "b.md").write_text("Seoul Kitchen\nLocation: 1440 South Boulevard\nHours: 11am-10pm")
+    store_path = str(tmp_path / "faiss_store")
+    build_store(directory, store_path, OneQueryVector(size=16))
+    retriever = RetrieverService(
+        store_path,
+        embeddings=OneQueryVector(size=16),
+        llm=FakeListLLM(responses=["11am-10pm", "11am-9pm"]),
+        lexical=False,
+    )
+    # Both questions embed identically; only their routed partitions differ.
+    assert retriever.answer("When does Seoul Kitchen open?") == "11am-10pm"
+    assert retriever.answer("When does Magnolia's Home Kitchen open?") == "11am-9pm"
+    assert retriever.answer("What time does Seoul Kitchen open?") == "11am-10pm"
+    assert retriever.answer_cache.hits == 1
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "pq"])
+def test_restricted_search_stays_in_the_partition(index_type):
+    from backend.agent.ann import build_index
+    from backend.agent.partitions import restricted_search
+
+    vectors = np.random.default_rng(0).standard_normal((300, 16)).astype(np.float32)
+    index = build_index(index_type, vectors, nlist=16, pq_m=4, nprobe=1)
+    index.add(vectors)
+    positions = np.array([5, 80, 150, 299], dtype=np.int64)
+    distances, labels = restricted_search(index, vectors[150], positions, 10)
+    assert sorted(labels[0]) == sorted(positions) and labels[0][0] == 150
+    assert list(distances[0]) == sorted(distances[0])
+
+
+def test_partition_positions_are_bounded(tmp_path, embeddings, monkeypatch):
+    directory = tmp_path / "rag_datasets"
+    directory.mkdir()
+    for name in ("Seoul Kitchen", "Hot Bird", "Green Table"):
+        (directory / f"{name}.md").write_text(f"{name}\nLocation: Charlotte\nHours: 11am")
+    store_path = str(tmp_path / "faiss_store")
+    build_store(directory, store_path, embeddings)
+    monkeypatch.setattr("backend.agent.retriever.MAX_PARTITION_CACHE", 2)
+    retriever = RetrieverService(store_path, embeddings=embeddings, lexical=False, mmap=True)
+    for name in ("Seoul Kitchen", "Hot Bird", "Green Table"):
+        results = retriever.search(f"When does {name} open?")
+        assert [doc.metadata["filename"] for doc, _ in results] == [f"{name}.md"]
+    assert len(retriever._partition_positions) == 2
@@ -0,0 +1,102 @@
+import threading
+
+import pytest
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListLLM
+
+from backend.agent import rag
+from backend.agent.shards import (
+    ShardedRetrieverService,
+    ShardPool,
+    _serve_listener,
+    create_sharded_store,
+    shard_paths,
+)
+
+
+def write_corpus(directory):
+    directory.mkdir()
+    for i in range(24):
+        (directory / f"r{i:02d}.md").write_text(f"Restaurant {i}\nHours: 9am-{i % 12 + 1}pm")
+
+
+def test_sharded_search_matches_single_store(tmp_path):
+    directory = tmp_path / "rag_datasets"
+    write_corpus(directory)
+    embeddings = DeterministicFakeEmbedding(size=16)
+    single_path = str(tmp_path / "faiss_store")
+    manifest = rag.load_manifest(single_path)
+    single = rag.create_faiss_store(
+        rag.iter_documents(str(directory), manifest=manifest),
+        llm=None,
+        store_path=single_path,
+        embedding_size=16,
+        manifest=manifest,
+        embeddings=embeddings,
+    )
+    sharded_path = str(tmp_path / "faiss_shards")
+    manifest = rag.load_manifest(sharded_path)
+    create_sharded_store(
+        rag.iter_documents(str(directory), manifest=manifest),
+        sharded_path,
+        num_shards=3,
+        manifest=manifest,
+        embedding_size=16,
+        embeddings=embeddings,
+    )
+    sizes = [
+        rag.load_faiss_store(path, embeddings=embeddings).index.ntotal
+        for path in shard_paths(sharded_path)
+    ]
+    assert sum(sizes) == 24 and all(sizes)
+
+    queries = ["Restaurant 3 hours", "late dinner", "Restaurant 17"]
+    with ShardPool(sharded_path) as pool:
+        assert pool.sizes == sizes
+        found = pool.search([embeddings.embed_query(q) for q in queries], k=4, fetch_k=10)
+        for query, results in zip(queries, found):
+            expected = single.max_marginal_relevance_search_with_score_by_vector(
+                embeddings.embed_query(query), k=4, fetch_k=10, lambda_mult=0.1
+            )
+            assert sorted(d.page_content for d, _ in results) == sorted(
+                d.page_content for d, _ in expected
+            )
+
+        retriever = ShardedRetrieverService(
+            pool, embeddings=embeddings, llm=FakeListLLM(responses=["9am"] * 8)
+        )
+        answers = []
+        threads = [
+            threading.Thread(target=lambda q=q: answers.append(retriever.answer(q)))
+            for q in queries + ["Restaurant 5 opening time"]
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert answers == ["9am"] * 4
+        assert len(retriever.search_many(queries, k=2, fetch_k=4)) <= 6
+
+        # Rebuilding the shards reloads the workers and clears cached answers.
+        cached = embeddings.embed_query(queries[0])
+        assert retriever.answer_cache.get(cached) == "9am"
+        (directory / "r99.md").write_text("Restaurant 99\nHours: closed on Mondays")
+        manifest = rag.load_manifest(sharded_path)
+        create_sharded_store(
+            rag.iter_documents(str(directory), manifest=manifest),
+            sharded_path,
+            num_shards=3,
+            manifest=manifest,
+            embedding_size=16,
+            embeddings=embeddings,
+        )
+        retriever.check_interval = 0
+        retriever.store
+        assert retriever.answer_cache.get(cached) is None
+        assert sum(len(shard[0]) for shard in pool.scatter([cached], fetch_k=30)) == 25
+
+
+def test_listener_refuses_to_start_without_authkey(tmp_path):
+    with pytest.raises(Exception, match="authkey"):
+        _serve_listener(str(tmp_path), ("127.0.0.1", 0), b"")
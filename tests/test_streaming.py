@@ -0,0 +1,74 @@
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.prompts import ChatPromptTemplate
+from langgraph.graph import END, START, StateGraph
+
+from backend.agent import rag
+from backend.agent.nodes.assistant import Assistant
+from backend.agent.retriever import RetrieverService, set_retriever
+from backend.agent.state import State
+from backend.agent.tools.general import answer_question
+from backend.agent.utils import create_tool_node_with_fallback
+
+
+def streamed_tokens(graph, inputs):
+    tokens = {}
+    for message, metadata in graph.stream(inputs, stream_mode="messages"):
+        if isinstance(message, AIMessageChunk) and message.content:
+            tokens.setdefault(metadata["langgraph_node"], []).append(message.content)
+    return tokens
+
+
+def test_assistant_streams_tokens():
+    llm = GenericFakeChatModel(messages=iter([AIMessage("Seoul Kitchen opens at 11am")]))
+    prompt = ChatPromptTemplate.from_messages([("placeholder", "{messages}")])
+    builder = StateGraph(State)
+    builder.add_node("General Agent", Assistant(prompt | llm))
+    builder.add_edge(START, "General Agent")
+    builder.add_edge("General Agent", END)
+    graph = builder.compile()
+
+    tokens = streamed_tokens(
+        graph,
+        {"messages": {"General Agent": [("user", "hours?")]}, "current_persona": "General Agent"},
+    )
+    assert len(tokens["General Agent"]) > 1
+    assert "".join(tokens["General Agent"]) == "Seoul Kitchen opens at 11am"
+
+
+def test_rag_tool_streams_tokens(tmp_path):
+    directory = tmp_path / "rag_datasets"
+    directory.mkdir()
+    (directory / "a.md").write_text("Seoul Kitchen\nHours: 11am-10pm")
+    store_path = str(tmp_path / "faiss_store")
+    embeddings = DeterministicFakeEmbedding(size=16)
+    manifest = rag.load_manifest(store_path)
+    rag.create_faiss_store(
+        rag.iter_documents(str(directory), manifest=manifest),
+        llm=None,
+        store_path=store_path,
+        embedding_size=16,
+        manifest=manifest,
+        embeddings=embeddings,
+    )
+    llm = GenericFakeChatModel(messages=iter([AIMessage("It opens at 11am")]))
+    set_retriever(RetrieverService(store_path, embeddings=embeddings, llm=llm))
+    try:
+        builder = StateGraph(State)
+        builder.add_node("rag_tools", create_tool_node_with_fallback([answer_question], "General Agent"))
+        builder.add_edge(START, "rag_tools")
+        builder.add_edge("rag_tools", END)
+        graph = builder.compile()
+        call = {"name": "answer_question", "args": {"query": "Seoul Kitchen hours"}, "id": "call_1"}
+        tokens = streamed_tokens(
+            graph,
+            {
+                "messages": {"General Agent": [AIMessage("", tool_calls=[call])]},
+                "current_persona": "General Agent",
+            },
+        )
+    finally:
+        set_retriever(None)
+    assert len(tokens["rag_tools"]) > 1
+    assert "".join(tokens["rag_tools"]) == "It opens at 11am"